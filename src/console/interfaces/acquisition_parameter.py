@@ -8,7 +8,7 @@ from pathlib import Path
 from typing import Any
 
 from console.interfaces.dimensions import Dimensions
-from console.interfaces.enums import DDCMethod
+from console.interfaces.enums import DDCMethod, Precision
 
 DEFAULT_STATE_FILE_PATH = os.path.join(Path.home(), "nexus-console", "acquisition-parameter.state")
 DEFAULT_FOV_SCALING = Dimensions(x=1., y=1., z=1.)
@@ -50,9 +50,15 @@ class AcquisitionParameter:
 
     ddc_method: DDCMethod = DDCMethod.FIR
 
+    precision: Precision = Precision.DOUBLE
+    """Floating point precision of the post-processing, float32/complex64 halves the memory of the processed data."""
+
     num_averages: int = 1
     """Number of acquisition averages."""
 
+    running_mean: bool = False
+    """Keep only the mean and the variance of the averages instead of the individual averages."""
+
     averaging_delay: float = 0.0
     """Delay in seconds between acquisition averages."""
 
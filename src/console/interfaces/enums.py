@@ -8,3 +8,11 @@ class DDCMethod(str, Enum):
     FIR = "finite-impulse-response-filter"
     AVG = "moving-average-filter"
     CIC = "cascaded-integrator-comb-filter"
+    MULTISTAGE = "multi-stage-decimation"
+
+
+class Precision(str, Enum):
+    """Enum for the floating point precision of the post-processing."""
+
+    DOUBLE = "float64"
+    SINGLE = "float32"
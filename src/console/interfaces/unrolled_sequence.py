@@ -1,6 +1,9 @@
 """Interface class for an unrolled sequence."""
 
-from dataclasses import dataclass
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+
+import numpy as np
 
 
 @dataclass(slots=True, frozen=True)
@@ -13,15 +16,14 @@ class UnrolledSequence:
     `unroll_sequence` function.
     """
 
-    seq: list
-    """Replay data as int16 values in a list of numpy arrays. The sequence data already
-    contains the digital adc and unblanking signals in the channels gx and gy."""
+    data: np.ndarray
+    """Replay data of the whole sequence as one contiguous array of interleaved int16 values.
+    The sequence data already contains the digital adc, reference and unblanking signals
+    in the channels gx, gy and gz."""
 
-    adc_gate: list
-    """ADC gate signal in binary logic where 0 corresponds to ADC gate off and 1 to ADC gate on."""
-    rf_unblanking: list
-    """Unblanking signal for the RF power amplifier (RFPA) in binary logic. 0 corresponds to blanking state
-    and 1 to unblanking state."""
+    block_offsets: np.ndarray
+    """Sample position (per channel) of each block within the replay data, the last entry is the total
+    number of samples. The replay data of block k is given by ``data[4 * offsets[k]:4 * offsets[k + 1]]``."""
 
     sample_count: int
     """Total number of samples per channel."""
@@ -56,3 +58,33 @@ class UnrolledSequence:
 
     adc_count: int
     """Number of adc events in the sequence."""
+
+    adc_samples: list[int] = field(default_factory=list)
+    """Number of ADC gate samples (per channel) of each adc event in the order of the sequence.
+    The samples are given on the time grid of the replay data, gates are truncated at the end of a block."""
+
+    stream: Callable[[int], Iterator[np.ndarray]] | None = None
+    """Function which unrolls the sequence incrementally, if the sequence was unrolled in streaming mode.
+    Called with a chunk size in bytes, it returns an iterator over interleaved int16 replay data chunks.
+    In streaming mode, the replay data array is empty."""
+
+    @property
+    def seq(self) -> list[np.ndarray]:
+        """Replay data as list of per block views of the replay data array."""
+        return [
+            self.data[4 * start:4 * end]
+            for start, end in zip(self.block_offsets[:-1], self.block_offsets[1:], strict=True)
+        ]
+
+    @property
+    def adc_gate(self) -> np.ndarray:
+        """ADC gate signal in binary logic where 0 corresponds to ADC gate off and 1 to ADC gate on."""
+        return self.data[1::4].view(np.uint16) >> 15
+
+    @property
+    def rf_unblanking(self) -> np.ndarray:
+        """Unblanking signal for the RF power amplifier (RFPA) in binary logic.
+
+        0 corresponds to blanking state and 1 to unblanking state.
+        """
+        return self.data[3::4].view(np.uint16) >> 15
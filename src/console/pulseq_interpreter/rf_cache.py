@@ -0,0 +1,133 @@
+"""Cache of unrolled RF waveforms."""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+
+import numpy as np
+
+
+def shape_digest(signal: np.ndarray) -> str:
+    """Calculate a content based identifier of an RF shape.
+
+    Parameters
+    ----------
+    signal
+        Complex RF envelope of a pulseq RF event
+
+    Returns
+    -------
+        Hexadecimal digest of the envelope samples
+    """
+    return hashlib.blake2b(np.ascontiguousarray(signal).tobytes(), digest_size=16).hexdigest()
+
+
+class RFWaveformCache:
+    """Least recently used (LRU) cache of unrolled RF waveforms.
+
+    Sequences like a turbo spin echo play the same refocusing pulse thousands of times.
+    The resampled and modulated RF waveform only depends on the RF shape, its duration
+    and the carrier frequency (Larmor frequency and frequency offset).
+    The cache stores this waveform with zero carrier phase and unit scaling, the phase rotation and
+    RF scaling (B1 scaling and output limit) are applied per occurrence.
+
+    The total size of all cached waveforms is limited by a byte budget.
+    If the budget is exceeded, the least recently used waveforms are evicted.
+    The cache can be shared by multiple threads, waveforms are calculated outside of the lock.
+
+    Example
+    -------
+    >>> cache = RFWaveformCache(max_bytes=1024**2)
+    >>> waveform = cache.get(key, lambda: calculate_waveform())
+    >>> cache.stats()["hits"]
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024**2):
+        """Initialize RF waveform cache.
+
+        Parameters
+        ----------
+        max_bytes, optional
+            Byte budget of the cache, by default 256 MB.
+            If 0, the cache is disabled and every waveform is calculated.
+        """
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, np.ndarray] = OrderedDict()
+        self.size_bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.miss_time: float = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return number of cached waveforms."""
+        return len(self._entries)
+
+    def get(self, key: Hashable, calculate: Callable[[], np.ndarray]) -> np.ndarray:
+        """Get a cached waveform or calculate and store it.
+
+        Parameters
+        ----------
+        key
+            Hashable key which uniquely defines the waveform
+        calculate
+            Function without arguments which calculates the waveform on a cache miss
+
+        Returns
+        -------
+            Cached waveform, must not be modified in place
+        """
+        with self._lock:
+            if (waveform := self._entries.get(key)) is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return waveform
+            self.misses += 1
+
+        time_start = time.perf_counter()
+        waveform = calculate()
+
+        with self._lock:
+            self.miss_time += time.perf_counter() - time_start
+            if waveform.nbytes <= self.max_bytes and key not in self._entries:
+                self._entries[key] = waveform
+                self.size_bytes += waveform.nbytes
+                # Evict least recently used waveforms until the cache fits into the byte budget
+                while self.size_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size_bytes -= evicted.nbytes
+                    self.evictions += 1
+        return waveform
+
+    def clear(self) -> None:
+        """Remove all cached waveforms and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.miss_time = 0.0
+
+    def stats(self) -> dict:
+        """Return cache statistics.
+
+        The saved time is estimated by the number of hits times the average calculation time per miss.
+
+        Returns
+        -------
+            Dictionary with number of hits, misses, evictions, entries, size in bytes
+            and calculation time in seconds
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "miss_time": self.miss_time,
+            "saved_time": self.hits * self.miss_time / self.misses if self.misses > 0 else 0.0,
+        }
@@ -0,0 +1,279 @@
+"""Persistent on-disk cache of unrolled sequences."""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from dataclasses import fields
+
+import numpy as np
+
+from console.interfaces.unrolled_sequence import UnrolledSequence
+from console.pulseq_interpreter.sequence_provider import SequenceProvider
+
+# Version of the unrolling implementation, cached sequences of other versions are not used
+CACHE_VERSION = 2
+
+# Event libraries of a pulseq sequence which define the waveforms of the block events
+_LIBRARIES = ("rf_library", "grad_library", "adc_library", "shape_library", "delay_library")
+
+# Maximum number of samples which are used for the sampled checksum of the replay data
+_CHECKSUM_SAMPLES = 2**20
+
+
+def _update_digest(digest: hashlib.blake2b, value: object) -> None:
+    """Add a (nested) value to a digest, arrays are added by their binary content."""
+    if isinstance(value, np.ndarray):
+        digest.update(f"{value.dtype.str}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            _update_digest(digest, key)
+            _update_digest(digest, item)
+    elif isinstance(value, list | tuple):
+        digest.update(b"(")
+        for item in value:
+            _update_digest(digest, item)
+        digest.update(b")")
+    else:
+        digest.update(repr(value).encode())
+        digest.update(b";")
+
+
+def sequence_digest(provider: SequenceProvider) -> str:
+    """Calculate the cache key of a sequence.
+
+    The key is a digest of the sequence content (block events, block durations and event libraries),
+    the device constants of the sequence provider and the acquisition parameters
+    which affect the unrolled sequence.
+
+    Parameters
+    ----------
+    provider
+        Sequence provider with the sequence to be unrolled
+
+    Returns
+    -------
+        Hexadecimal digest
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    _update_digest(digest, CACHE_VERSION)
+    # Sequence content
+    _update_digest(digest, dict(provider.block_events))
+    _update_digest(digest, dict(provider.block_durations))
+    for library in _LIBRARIES:
+        _update_digest(digest, dict(getattr(provider, library).data))
+    # Device constants
+    _update_digest(digest, [
+        provider.gpa_gain,
+        provider.grad_eff,
+        provider.output_limits,
+        provider.imp_scaling,
+        provider.spcm_dwell_time,
+        provider.rf_to_mvolt,
+    ])
+    # Acquisition parameters
+    _update_digest(digest, dict(provider.unroll_parameters()))
+    return digest.hexdigest()
+
+
+def _checksum(data: np.ndarray) -> str:
+    """Calculate a checksum of the replay data from at most ``_CHECKSUM_SAMPLES`` equidistant values."""
+    stride = max(1, data.size // _CHECKSUM_SAMPLES)
+    digest = hashlib.blake2b(np.ascontiguousarray(data[::stride]).tobytes(), digest_size=16)
+    digest.update(np.ascontiguousarray(data[-64:]).tobytes())
+    return digest.hexdigest()
+
+
+def _full_checksum(data: np.ndarray) -> str:
+    """Calculate a checksum of the complete replay data."""
+    return hashlib.blake2b(np.ascontiguousarray(data).data, digest_size=16).hexdigest()
+
+
+class SequenceCache:
+    """Persistent on-disk cache of unrolled sequences.
+
+    Each unrolled sequence is stored in a sub-directory of the cache directory, named by the digest
+    of the sequence, device constants and acquisition parameters (see ``sequence_digest``).
+    The replay data is stored as ``.npy`` file and loaded memory mapped (read only),
+    such that a cached sequence is available without unrolling or reading the whole file.
+
+    The total size of the cache is limited by a byte budget.
+    If the budget is exceeded, the least recently used sequences are removed.
+    On loading, file sizes and a sampled checksum of the replay data are verified,
+    invalid entries are removed.
+
+    Example
+    -------
+    >>> cache = SequenceCache("~/nexus-console/sequence-cache", max_bytes=8 * 1024**3)
+    >>> key = sequence_digest(seq_provider)
+    >>> if (unrolled := cache.load(key)) is None:
+    >>>     unrolled = seq_provider.unroll_sequence()
+    >>>     cache.store(key, unrolled)
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 8 * 1024**3, full_check: bool = False):
+        """Initialize the sequence cache.
+
+        Parameters
+        ----------
+        cache_dir
+            Directory of the cache, created if it does not exist
+        max_bytes, optional
+            Byte budget of the cache, by default 8 GB
+        full_check, optional
+            Verify the checksum of the complete replay data on loading instead of a sampled checksum,
+            by default False
+        """
+        self.log = logging.getLogger("SeqCache")
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        self.full_check = full_check
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.invalid: int = 0
+
+    def load(self, key: str) -> UnrolledSequence | None:
+        """Load a cached unrolled sequence.
+
+        Parameters
+        ----------
+        key
+            Cache key of the sequence
+
+        Returns
+        -------
+            Unrolled sequence with memory mapped replay data or None, if the sequence is not cached or invalid
+        """
+        entry = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry):
+            self.misses += 1
+            return None
+
+        try:
+            with open(os.path.join(entry, "meta.json"), encoding="utf-8") as file:
+                meta = json.load(file)
+            data = np.load(os.path.join(entry, "data.npy"), mmap_mode="r")
+            block_offsets = np.load(os.path.join(entry, "offsets.npy"))
+            if meta["version"] != CACHE_VERSION or data.dtype != np.int16 or data.nbytes != meta["nbytes"]:
+                raise ValueError("Cached sequence does not match its meta data")
+            if int(block_offsets[-1]) * 4 != data.size:
+                raise ValueError("Cached block offsets do not match the replay data")
+            checksum = _full_checksum(data) if self.full_check else _checksum(data)
+            if checksum != meta["full_checksum" if self.full_check else "checksum"]:
+                raise ValueError("Checksum of cached sequence is invalid")
+        except (OSError, KeyError, ValueError) as err:
+            self.log.warning("Removing invalid cached sequence %s: %s", key, err)
+            shutil.rmtree(entry, ignore_errors=True)
+            self.invalid += 1
+            self.misses += 1
+            return None
+
+        # Update access time, used to evict the least recently used sequences
+        os.utime(os.path.join(entry, "meta.json"))
+        self.hits += 1
+        return UnrolledSequence(data=data, block_offsets=block_offsets, **meta["sequence"])
+
+    def store(self, key: str, unrolled: UnrolledSequence) -> bool:
+        """Store an unrolled sequence.
+
+        Parameters
+        ----------
+        key
+            Cache key of the sequence
+        unrolled
+            Unrolled sequence, sequences in streaming mode are not stored
+
+        Returns
+        -------
+            True if the sequence was stored
+        """
+        if unrolled.stream is not None or unrolled.data.nbytes > self.max_bytes:
+            return False
+
+        self._evict(self.max_bytes - unrolled.data.nbytes)
+
+        meta = {
+            "version": CACHE_VERSION,
+            "nbytes": unrolled.data.nbytes,
+            "checksum": _checksum(unrolled.data),
+            "full_checksum": _full_checksum(unrolled.data) if self.full_check else None,
+            "sequence": {
+                field.name: getattr(unrolled, field.name)
+                for field in fields(unrolled)
+                if field.name not in ("data", "block_offsets", "stream")
+            },
+        }
+
+        # Write to temporary directory first, which is renamed when all the files are complete
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            np.save(os.path.join(tmp_dir, "data.npy"), unrolled.data)
+            np.save(os.path.join(tmp_dir, "offsets.npy"), unrolled.block_offsets)
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as file:
+                json.dump(meta, file)
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            os.replace(tmp_dir, os.path.join(self.cache_dir, key))
+        except OSError as err:
+            self.log.warning("Could not store sequence %s in cache: %s", key, err)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+        return True
+
+    def entries(self) -> list[tuple[str, int, float]]:
+        """Return key, size in bytes and last access time of all cached sequences, least recently used first."""
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, key)
+            if key.startswith(".") or not os.path.isdir(entry):
+                continue
+            size = sum(file.stat().st_size for file in os.scandir(entry) if file.is_file())
+            try:
+                access_time = os.path.getmtime(os.path.join(entry, "meta.json"))
+            except OSError:
+                access_time = 0.0
+            entries.append((key, size, access_time))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size_bytes(self) -> int:
+        """Return the total size of all cached sequences in bytes."""
+        return sum(size for _, size, _ in self.entries())
+
+    def clear(self) -> None:
+        """Remove all cached sequences."""
+        for key, _, _ in self.entries():
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+
+    def stats(self) -> dict:
+        """Return cache statistics.
+
+        Returns
+        -------
+            Dictionary with number of hits, misses, evictions, invalid entries, entries and size in bytes
+        """
+        entries = self.entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalid": self.invalid,
+            "entries": len(entries),
+            "size_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+    def _evict(self, max_bytes: int) -> None:
+        """Remove least recently used sequences until the cache size is below max_bytes."""
+        entries = self.entries()
+        size = sum(size for _, size, _ in entries)
+        for key, entry_size, _ in entries:
+            if size <= max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            size -= entry_size
+            self.evictions += 1
+            self.log.debug("Evicted cached sequence %s", key)
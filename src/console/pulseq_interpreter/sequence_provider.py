@@ -1,6 +1,9 @@
 """Sequence provider class."""
 import logging
-from collections.abc import Callable
+from collections.abc import Callable, Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from functools import partial
 from types import SimpleNamespace
 from typing import Any
 
@@ -12,8 +15,11 @@ from pypulseq.Sequence.sequence import Sequence
 from scipy.signal import resample
 
 import console
+from console.interfaces.acquisition_parameter import AcquisitionParameter
 from console.interfaces.dimensions import Dimensions
 from console.interfaces.unrolled_sequence import UnrolledSequence
+from console.pulseq_interpreter.rf_cache import RFWaveformCache, shape_digest
+from console.utilities.nco import NumericallyControlledOscillator, phase_word
 
 try:
     from line_profiler import profile
@@ -31,6 +37,69 @@ default_fov_scaling: Dimensions = Dimensions(1, 1, 1)
 default_fov_offset: Dimensions = Dimensions(0, 0, 0)
 
 
+# Max. number of samples which are processed at once by vectorized unrolling steps
+_BATCH_SAMPLES = 2**22
+# Digital signals are encoded by the 16th bit of the gradient channels
+_DIGITAL_BIT = np.uint16(1 << 15)
+# Min. number of samples per range to process ranges one by one instead of fancy indexing
+_MIN_SLICE_SAMPLES = 4096
+# Number of block ranges per thread of the parallel unrolling
+_RANGES_PER_WORKER = 4
+
+
+def _event_occurrences(event_ids: np.ndarray) -> list[np.ndarray]:
+    """Group block indices by library event ID, blocks without event (ID 0) are omitted."""
+    order = np.argsort(event_ids, kind="stable")
+    ids, first = np.unique(event_ids[order], return_index=True)
+    groups = np.split(order, first[1:])
+    return [group for event_id, group in zip(ids, groups, strict=True) if event_id > 0]
+
+
+def _scatter(target: np.ndarray, offsets: np.ndarray, values: np.ndarray) -> None:
+    """Write values to target at each of the given offsets."""
+    if values.size == 0:
+        return
+    if values.size >= _MIN_SLICE_SAMPLES:
+        # Long waveforms: plain copy per offset, overhead is negligible compared to copying the samples
+        for offset in offsets:
+            target[offset:offset + values.size] = values
+        return
+    # Short waveforms: fancy indexing in batches
+    step = max(1, _BATCH_SAMPLES // values.size)
+    index = np.arange(values.size)
+    for k in range(0, offsets.size, step):
+        target[offsets[k:k + step, None] + index] = values
+
+
+def _batched_ranges(
+    starts: np.ndarray, lengths: np.ndarray
+) -> Iterator[tuple[slice, np.ndarray, np.ndarray | slice]]:
+    """Iterate over the sample indices of multiple index ranges [start, start + length).
+
+    Short ranges are processed in batches of up to ``_BATCH_SAMPLES`` samples, long ranges one by one.
+    Each iteration yields the slice of ranges within the batch, the sample index relative to the start
+    of each range and the absolute sample index (index array or slice for a single long range).
+    """
+    ends = np.cumsum(lengths)
+    first = 0
+    while first < lengths.size:
+        if lengths[first] >= _MIN_SLICE_SAMPLES:
+            # Long range: process on its own, the absolute sample index is a slice
+            start = int(starts[first])
+            yield slice(first, first + 1), np.arange(lengths[first]), slice(start, start + int(lengths[first]))
+            first += 1
+            continue
+        # Take short ranges until the batch size or the next long range is reached
+        batch_limit = ends[first] - lengths[first] + _BATCH_SAMPLES
+        last = max(first + 1, int(np.searchsorted(ends, batch_limit, side="right")))
+        if (long_ranges := np.flatnonzero(lengths[first:last] >= _MIN_SLICE_SAMPLES)).size > 0:
+            last = first + int(long_ranges[0])
+        sizes = lengths[first:last]
+        local = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        yield slice(first, last), local, np.repeat(starts[first:last], sizes) + local
+        first = last
+
+
 class SequenceProvider(Sequence):
     """Sequence provider class.
 
@@ -59,6 +128,7 @@ class SequenceProvider(Sequence):
         spcm_dwell_time: float = 1 / 20e6,
         rf_to_mvolt: float = 1,
         system: Opts = default_opts,
+        rf_cache_bytes: int = 256 * 1024**2,
     ):
         """Initialize sequence provider class which is used to unroll a pulseq sequence.
 
@@ -76,6 +146,9 @@ class SequenceProvider(Sequence):
             Translation of RF waveform from pulseq (Hz) to mV, by default 1
         system, optional
             System options from pypulseq, by default Opts()
+        rf_cache_bytes, optional
+            Byte budget of the cache for unrolled RF waveforms, by default 256 MB.
+            Set to 0 to disable caching.
         """
         super().__init__(system=system)
 
@@ -107,7 +180,21 @@ class SequenceProvider(Sequence):
 
         self.larmor_freq: float = float("nan")
         self.sample_count: int = 0
-        self._sqnc_cache: list = []
+        self._sqnc_cache: np.ndarray | None = None
+        # Acquisition parameters and block positions of the last unrolled sequence, used for incremental updates
+        self._unroll_state: Mapping[str, float] | None = None
+        self._unroll_blocks: tuple[list, np.ndarray, int] | None = None
+
+        # Cache of resampled and modulated RF waveforms, reused for repeated RF events
+        self.rf_cache = RFWaveformCache(max_bytes=rf_cache_bytes)
+
+        self.parameter: AcquisitionParameter | None = None
+        """Acquisition parameters of the unrolling, the global ``console.parameter`` instance if None."""
+
+    @property
+    def acquisition_parameter(self) -> AcquisitionParameter:
+        """Acquisition parameters of the unrolling, see ``parameter``."""
+        return self.parameter if self.parameter is not None else console.parameter
 
     def dict(self) -> dict:
         """Abstract method which returns variables for logging in dictionary."""
@@ -119,7 +206,8 @@ class SequenceProvider(Sequence):
             "gradient_efficiency": self.grad_eff,
             "output_limits": self.output_limits,
             "larmor_freq": self.larmor_freq,
-            "sample_count": self.sample_count
+            "sample_count": self.sample_count,
+            "rf_cache": self.rf_cache.stats(),
         }
 
     def from_pypulseq(self, seq: Sequence) -> None:
@@ -162,9 +250,14 @@ class SequenceProvider(Sequence):
         b1_scaling: float,
         unblanking: np.ndarray,
         num_samples_rf_start: int = 0,
+        sample_position: int | None = None,
     ) -> None:
         """Calculate RF sample points to be played by TX card.
 
+        The resampled and modulated RF waveform is taken from the RF waveform cache if the same RF shape
+        was calculated before with identical duration and frequency.
+        Only the carrier phase rotation and the scaling are applied per RF event.
+
         Parameters
         ----------
         block
@@ -178,6 +271,9 @@ class SequenceProvider(Sequence):
         num_samples_rf_start
             Number of samples until the first RF event in the sequence.
             This value is important to calculate the correct carrier wave phase offset.
+        sample_position, optional
+            Absolute sample position of the block within the sequence, by default None.
+            If None, the current sample count is used.
 
         Returns
         -------
@@ -211,33 +307,41 @@ class SequenceProvider(Sequence):
         unblanking_end = num_samples_delay + num_samples
         unblanking[unblanking_start:unblanking_end] = 1
 
-        # Calculate the static phase offset, defined by RF pulse
-        phase_offset = np.exp(1j * block.phase_offset)
+        # RF scaling according to B1 calibration and "device" (translation from pulseq to output voltage)
+        rf_scaling = b1_scaling * self.rf_to_mvolt * self.imp_scaling[0] / self.output_limits[0]
+        carrier_freq = self.larmor_freq + block.freq_offset
 
-        # Calculate scaled envelope and convert to int16 scale (not datatype, since we use complex numbers)
-        # Perform this step here to save computation time, num. of envelope samples << num. of resampled signal
+        # Check scaled envelope, num. of envelope samples << num. of resampled signal
         try:
-            # RF scaling according to B1 calibration and "device" (translation from pulseq to output voltage)
-            rf_scaling = b1_scaling * self.rf_to_mvolt * self.imp_scaling[0] / self.output_limits[0]
-            if np.abs(np.amax(envelope_scaled := block.signal * phase_offset * rf_scaling)) > 1:
+            if np.amax(np.abs(block.signal * rf_scaling)) > 1:
                 raise ValueError("RF magnitude exceeds output limit.")
         except ValueError as err:
             self.log.exception(err, exc_info=True)
             raise err
 
-        envelope_scaled = envelope_scaled * INT16_MAX
+        def _calculate_waveform() -> np.ndarray:
+            # Resampling of the complex envelope in int16 scale (not datatype, since we use complex numbers)
+            envelope = resample(block.signal * INT16_MAX, num=num_samples)
 
-        # Resampling of scaled complex envelope
-        envelope = resample(envelope_scaled, num=num_samples)
+            # Carrier with frequency offset of the RF block event, phase is applied per occurrence
+            nco = NumericallyControlledOscillator(carrier_freq, self.spcm_dwell_time)
+            return envelope * nco.carrier(nco.phase(num_samples))
+
+        # Modulated waveform only depends on shape, duration and frequency, reuse it if cached
+        waveform = self.rf_cache.get(
+            key=(shape_digest(block.signal), num_samples, carrier_freq),
+            calculate=_calculate_waveform,
+        )
 
         # Calculate phase offset of RF according to total sample count
-        carrier_phase_samples = self.sample_count + num_samples_delay - num_samples_rf_start
+        if sample_position is None:
+            sample_position = self.sample_count
+        carrier_phase_samples = sample_position + num_samples_delay - num_samples_rf_start
         carrier_phase_offset = carrier_phase_samples * self.spcm_dwell_time
 
-        # Only precalculate carrier time array, calculate carriere here to take into account the
-        # frequency and phase offsets of an RF block event
-        carrier_time = np.arange(num_samples) * self.spcm_dwell_time
-        carrier = np.exp(2j * np.pi * ((self.larmor_freq + block.freq_offset) * carrier_time + carrier_phase_offset))
+        # Phase rotation by the carrier phase and the static phase offset, defined by RF pulse,
+        # combined with the RF scaling
+        rotation = rf_scaling * np.exp(1j * (2 * np.pi * carrier_phase_offset + block.phase_offset))
 
         try:
             # Calculate position indices for unrolled RF event
@@ -246,7 +350,10 @@ class SequenceProvider(Sequence):
             if idx_signal_end > unroll_arr.size:
                 raise IndexError("Unrolled RF event exceeds number of block samples")
             # Write unrolled RF event in place
-            unroll_arr[num_samples_delay:idx_signal_end] = (envelope * carrier).real.astype(np.int16)
+            # Real part of the rotated waveform: Re(w * r) = Re(w) * Re(r) - Im(w) * Im(r)
+            unroll_arr[num_samples_delay:idx_signal_end] = (
+                waveform.real * rotation.real - waveform.imag * rotation.imag
+            ).astype(np.int16)
         except IndexError as err:
             self.log.exception(err, exc_info=True)
             raise err
@@ -279,12 +386,50 @@ class SequenceProvider(Sequence):
         """
         # Both gradient types have a delay, calculate delay in number of samples
         samples_delay = int(block.delay * self.spcm_freq)
+        gradient = self.gradient_waveform(block, fov_scaling)
+
+        try:
+            # Check if gradient waveform fits into unroll array space
+            if (index_end := samples_delay + gradient.size) > unroll_arr.size:
+                raise IndexError("Unrolled gradient event exceeds number of block samples")
+        except IndexError as err:
+            self.log.exception(err, exc_info=True)
+            raise err
+
+        # Add gradient waveform (trapezoid or arbitrary) in place
+        unroll_arr[samples_delay:index_end] = gradient
+
+    def gradient_waveform(self, block: SimpleNamespace, fov_scaling: float) -> np.ndarray:
+        """Calculate the int16 sample points of a gradient event without its delay.
+
+        The waveform only depends on the gradient event and the scaling factors.
+        It is therefore calculated once per gradient event of the sequence library
+        and reused for every block which contains the event.
+
+        Parameters
+        ----------
+        block
+            Gradient block from pypulseq sequence, type must be grad or trap
+        fov_scaling
+            Scaling factor to adjust the FoV.
+
+        Returns
+        -------
+            Gradient waveform as int16 values
+
+        Raises
+        ------
+        ValueError
+            Invalid block type (must be either ``grad`` or ``trap``),
+            gradient amplitude exceeds channel maximum output level
+        """
         # Index of this gradient, dependent on channel designation, offset of 1 to start at channel 1
         idx = ["x", "y", "z"].index(block.channel)
 
         # Calculate gradient offset int16 value from mV
         # block.channel is either x, y or z and used to obtain correct gradient offset dimension/channel
-        offset = getattr(console.parameter.gradient_offset, block.channel) / INT16_MAX * self.output_limits[idx + 1]
+        gradient_offset = self.acquisition_parameter.gradient_offset
+        offset = getattr(gradient_offset, block.channel) / INT16_MAX * self.output_limits[idx + 1]
 
         # Calculat gradient waveform scaling
         scaling = fov_scaling * self.imp_scaling[idx + 1] / (42.58e3 * self.gpa_gain[idx] * self.grad_eff[idx])
@@ -306,7 +451,7 @@ class SequenceProvider(Sequence):
                 # Trasnfer mV floating point waveform values to int16 if amplitude check passed
                 waveform *= INT16_MAX / self.output_limits[idx + 1]
 
-                gradient = np.interp(
+                return np.interp(
                     x=np.linspace(
                         block.tt[0],
                         block.tt[-1],
@@ -316,7 +461,7 @@ class SequenceProvider(Sequence):
                     fp=waveform,
                 ).astype(np.int16)
 
-            elif block.type == "trap":
+            if block.type == "trap":
                 # Construct trapezoidal gradient from rise, flat and fall sections
                 if np.amax(flat_amp := block.amplitude * scaling) + offset > self.output_limits[idx + 1]:
                     raise ValueError(
@@ -344,24 +489,18 @@ class SequenceProvider(Sequence):
                     dtype=np.int16,
                 )
 
-                gradient = np.concatenate((rise, flat, fall))
-
-            else:
-                raise ValueError("Block is not a valid gradient block")
-
-            # Check if gradient waveform fits into unroll array space
-            if (index_end := samples_delay + gradient.size) > unroll_arr.size:
-                raise IndexError("Unrolled gradient event exceeds number of block samples")
+                return np.concatenate((rise, flat, fall))
 
-            # Add gradient waveform (trapezoid or arbitrary) in place
-            unroll_arr[samples_delay:index_end] = gradient
+            raise ValueError("Block is not a valid gradient block")
 
-        except (ValueError, IndexError) as err:
+        except ValueError as err:
             self.log.exception(err, exc_info=True)
             raise err
 
     @profile
-    def add_adc_gate(self, block: SimpleNamespace, gate: np.ndarray, clk_ref: np.ndarray) -> None:
+    def add_adc_gate(
+        self, block: SimpleNamespace, gate: np.ndarray, clk_ref: np.ndarray, sample_position: int | None = None
+    ) -> None:
         """Add ADC gate signal and reference signal during gate inplace to gate and reference arrays.
 
         Parameters
@@ -372,50 +511,58 @@ class SequenceProvider(Sequence):
             Gate array, predefined by zeros. If ADC event is present, the corresponding range is set to one.
         clk_ref
             Phase reference array, predefined by zeros. Digital signal during ADC which encodes the signal phase.
+        sample_position, optional
+            Absolute sample position of the block within the sequence, by default None.
+            If None, the current sample count is used.
         """
-        delay = max(int(block.delay * self.spcm_freq), int(block.dead_time * self.spcm_freq))
-        adc_dur = block.num_samples * block.dwell
-        adc_len = round(adc_dur * self.spcm_freq)
+        delay, adc_len = self._adc_gate_range(block)
         # Gate signal
         gate[delay : delay + adc_len] = 1
 
         # Calculate reference signal with phase offset (dependent on total number of samples at beginning of adc)
-        offset = self.sample_count * self.spcm_dwell_time
-        ref_time = np.arange(clk_ref.size) * self.spcm_dwell_time
-
-        # Time consuming operation, if computed over the whole gate
-        # Instead limit to max(clk_ref.size, 2000) to use at most the first 2000 samples for phase synchronization
-        # 2000 samples == 0.1 ms, at 2 MHz this still covers 200 cycles
-        ref_signal = np.exp(2j * np.pi * (self.larmor_freq * ref_time + offset))
-        # Digital reference signal, sin > 0 is high, 16th bit set to 1 (high)
-        clk_ref[ref_signal > 0] = 1
+        nco = NumericallyControlledOscillator(self.larmor_freq, self.spcm_dwell_time)
+        if sample_position is None:
+            sample_position = self.sample_count
+        offset = self._reference_phase_offset(np.array([sample_position]))
+        # Digital reference signal, cos > 0 is high, 16th bit set to 1 (high)
+        clk_ref[nco.reference(nco.phase(clk_ref.size, start=offset))] = 1
 
     @profile
-    def unroll_sequence(self) -> UnrolledSequence:
+    def unroll_sequence(self, vectorized: bool = True, streaming: bool = False, workers: int = 1) -> UnrolledSequence:
         """Unroll the pypulseq sequence description.
 
-        TODO: Update this docstring
+        The acquisition parameters (Larmor frequency, B1 scaling and FoV scaling) are taken
+        from the global ``console.parameter`` instance, unless ``parameter`` is set.
+
+        All blocks are unrolled into one preallocated interleaved int16 buffer.
+        By default, the blocks are grouped by their library events: Gradient waveforms and ADC gates are
+        calculated once per event and written to all the blocks containing this event in vectorized passes.
+        Only RF events are calculated per occurrence, since the carrier phase depends on the sample position.
 
         Parameters
         ----------
-        larmor_freq
-            (Larmor) frequency of the carrier RF waveform
-        b1_scaling, optional
-            Factor for the RF waveform, which is to be calibrated per coil and phantom (load), by default 1.0
-        fov_scaling, optional
-            Per channel factor for the gradient waveforms to scale the field of fiew (FOV),
-            by default Dimensions(1.0, 1.0, 1.0)
+        vectorized, optional
+            Use the batched unrolling engine, by default True.
+            If False, the sequence is unrolled block by block which yields the identical result.
+        streaming, optional
+            Do not unroll the sequence at once, by default False.
+            If True, the returned instance does not contain any replay data, but a ``stream`` function which
+            unrolls the sequence incrementally, see ``stream_sequence``.
+        workers, optional
+            Number of threads, by default 1.
+            If larger than 1, contiguous block ranges are unrolled concurrently into the shared sequence array,
+            which yields the identical result.
 
         Returns
         -------
             UnrolledSequence
-                Instance of an unrolled sequence object which contains a list of numpy arrays with
-                the block-wise calculated sample points in correct spectrum card order (Fortran).
+                Instance of an unrolled sequence object which contains one contiguous numpy array with
+                the calculated sample points in correct spectrum card order (Fortran) and the sample
+                offset of each block within this array.
 
-                The list of unrolled sequence arrays is returned as uint16 values which contain a digital
+                The unrolled sequence array is returned as int16 values which contain a digital
                 signal encoded by 15th bit. Only the RF channel does not contain a digital signal.
-                In addition, the adc and unblanking signals are returned as list of numpy arrays in the
-                unrolled sequence instance.
+                The adc and unblanking signals can be obtained from the unrolled sequence instance.
 
         Raises
         ------
@@ -453,15 +600,272 @@ class SequenceProvider(Sequence):
 
         As the 15th bit is not encoding the sign (as usual for int16), the values are casted to uint16 before shifting.
         """
-        if self._sqnc_cache:
-            self._sqnc_cache = []
+        self._sqnc_cache = None
+        self._unroll_state = None
+
+        block_keys, block_pos = self._prepare_unrolling()
+        total_samples = int(block_pos[-1])
+        rf_start = self._rf_start_position(block_keys, block_pos)
+
+        adc_samples = self._adc_gate_samples(block_keys, block_pos)
+
+        if streaming:
+            # Only count the ADC events, the replay data is calculated on demand
+            adc_count = len(adc_samples)
+            self.log.debug(
+                "Prepared sequence streaming; Total sample points: %s; Total block events: %s",
+                total_samples,
+                len(block_keys),
+            )
+            return UnrolledSequence(
+                data=np.zeros(0, dtype=np.int16),
+                block_offsets=block_pos,
+                sample_count=total_samples,
+                gpa_gain=self.gpa_gain,
+                gradient_efficiency=self.grad_eff,
+                rf_to_mvolt=self.rf_to_mvolt,
+                dwell_time=self.spcm_dwell_time,
+                larmor_frequency=self.larmor_freq,
+                duration=self.duration()[0],
+                adc_count=adc_count,
+                adc_samples=adc_samples,
+                stream=partial(self._stream_blocks, block_keys, block_pos, rf_start, vectorized=vectorized),
+            )
+
+        _sqnc, adc_count = self._unroll_segment(
+            block_keys, block_pos, rf_start, vectorized=vectorized, workers=workers
+        )
+
+        # Count the total amount of samples (for one channel) to keep track of the phase
+        self.sample_count = total_samples
+
+        self.log.debug(
+            "Unrolled sequence; Total sample points: %s; Total block events: %s",
+            self.sample_count,
+            len(block_keys),
+        )
+        self.log.debug("RF waveform cache: %s", self.rf_cache.stats())
+
+        # Save unrolled sequence in class
+        self._sqnc_cache = _sqnc
+        self._unroll_state = self.unroll_parameters()
+        self._unroll_blocks = (block_keys, block_pos, rf_start)
+
+        return UnrolledSequence(
+            data=_sqnc,
+            block_offsets=block_pos,
+            sample_count=self.sample_count,
+            gpa_gain=self.gpa_gain,
+            gradient_efficiency=self.grad_eff,
+            rf_to_mvolt=self.rf_to_mvolt,
+            dwell_time=self.spcm_dwell_time,
+            larmor_frequency=self.larmor_freq,
+            duration=self.duration()[0],
+            adc_count=adc_count,
+            adc_samples=adc_samples,
+        )
+
+    def update_unrolled_sequence(self, unrolled: UnrolledSequence, workers: int = 1) -> UnrolledSequence:
+        """Update an unrolled sequence to the current acquisition parameters.
+
+        Only the channels which depend on a changed acquisition parameter are recalculated in place:
+
+        - Larmor frequency: RF channel and reference signal
+        - B1 scaling: RF channel, the cached RF carriers are reused
+        - FoV scaling and gradient offset: Gradient channel of the respective axis
+
+        All other acquisition parameters do not affect the unrolled sequence.
+        If the unrolled sequence was not calculated by the last call of ``unroll_sequence``,
+        the sequence is unrolled again.
+
+        Parameters
+        ----------
+        unrolled
+            Unrolled sequence of the last call of ``unroll_sequence``
+        workers, optional
+            Number of threads if the sequence is unrolled again, by default 1
+
+        Returns
+        -------
+            Unrolled sequence which shares the replay data with the given instance
+
+        Raises
+        ------
+        ValueError
+            Larmor frequency too large or an RF or gradient event exceeds the output limit,
+            the unrolled sequence is not modified in this case
+        """
+        if unrolled.stream is not None:
+            # Streamed replay data is calculated with the current parameters anyway
+            return self.unroll_sequence(streaming=True)
+        if self._unroll_state is None or self._unroll_blocks is None or unrolled.data is not self._sqnc_cache:
+            return self.unroll_sequence(workers=workers)
+
+        state = self.unroll_parameters()
+        changed = {key for key, value in state.items() if value != self._unroll_state[key]}
+        if not changed:
+            return unrolled
+
+        try:
+            if self.acquisition_parameter.larmor_frequency > 10e6:
+                raise ValueError("Larmor frequency is above 10 MHz: %s MHz",
+                                 self.acquisition_parameter.larmor_frequency * 1e-6)
+        except ValueError as err:
+            self.log.exception(err, exc_info=True)
+            raise err
+
+        block_keys, block_pos, rf_start = self._unroll_blocks
+        event_ids = self._event_ids(block_keys)
+        # Channels are zeroed before they are recalculated, check the output limits first
+        self._check_output_limits(
+            block_keys,
+            event_ids,
+            rf=bool({"larmor_frequency", "b1_scaling"} & changed),
+            columns=[col for col, axis in enumerate(["x", "y", "z"], start=1)
+                     if {f"fov_scaling_{axis}", f"gradient_offset_{axis}"} & changed],
+        )
+        self.larmor_freq = self.acquisition_parameter.larmor_frequency
+        bits = unrolled.data.view(np.uint16).reshape(-1, 4)
+        # Replay data is inconsistent until the update is completed
+        self._unroll_state = None
+
+        # Gradient channels: recalculate the values and keep the digital signals
+        for col, axis in enumerate(["x", "y", "z"], start=1):
+            if {f"fov_scaling_{axis}", f"gradient_offset_{axis}"} & changed:
+                digital = bits[:, col] & _DIGITAL_BIT
+                bits[:, col] = 0
+                self._write_gradients(block_keys, block_pos, event_ids, unrolled.data, columns=[col])
+                np.right_shift(bits[:, col], 1, out=bits[:, col])
+                np.bitwise_or(bits[:, col], digital, out=bits[:, col])
+
+        # Reference signal is only affected by the Larmor frequency
+        if "larmor_frequency" in changed:
+            np.bitwise_and(bits[:, 2], ~_DIGITAL_BIT, out=bits[:, 2])
+            adc_blocks = np.flatnonzero(event_ids[:, 4])
+            self._add_reference_signal(bits[:, 2], block_pos[adc_blocks], np.diff(block_pos)[adc_blocks])
+
+        # RF channel without digital signal, unblanking does not depend on acquisition parameters
+        if {"larmor_frequency", "b1_scaling"} & changed:
+            bits[:, 0] = 0
+            self._write_rf(block_keys, block_pos, event_ids, unrolled.data, 0, rf_start, unblanking=False)
+
+        self.sample_count = int(block_pos[-1])
+        self._unroll_state = state
+        self.log.debug("Updated unrolled sequence, changed parameters: %s", sorted(changed))
+
+        return replace(unrolled, larmor_frequency=self.larmor_freq)
+
+    def set_unrolled_sequence(self, unrolled: UnrolledSequence) -> None:
+        """Set the state of the sequence provider to a sequence, which was not unrolled by this instance.
+
+        Larmor frequency, sample count and replay data of the sequence provider are taken from the
+        unrolled sequence, e.g. a sequence loaded from the sequence cache, such that ``dict`` and
+        ``plot_unrolled`` refer to this sequence.
+        The replay data may be read only, thus ``update_unrolled_sequence`` unrolls the sequence again.
+
+        Parameters
+        ----------
+        unrolled
+            Unrolled sequence of the current sequence and acquisition parameters
+        """
+        self.larmor_freq = unrolled.larmor_frequency
+        self.sample_count = unrolled.sample_count
+        self._sqnc_cache = unrolled.data if unrolled.stream is None else None
+        self._unroll_state = None
+        self._unroll_blocks = None
+
+    def unroll_parameters(self) -> Mapping[str, float]:
+        """Return the acquisition parameters which affect the unrolled sequence."""
+        return {
+            "larmor_frequency": self.acquisition_parameter.larmor_frequency,
+            "b1_scaling": self.acquisition_parameter.b1_scaling,
+            "fov_scaling_x": self.acquisition_parameter.fov_scaling.x,
+            "fov_scaling_y": self.acquisition_parameter.fov_scaling.y,
+            "fov_scaling_z": self.acquisition_parameter.fov_scaling.z,
+            "gradient_offset_x": self.acquisition_parameter.gradient_offset.x,
+            "gradient_offset_y": self.acquisition_parameter.gradient_offset.y,
+            "gradient_offset_z": self.acquisition_parameter.gradient_offset.z,
+        }
+
+    def stream_sequence(self, chunk_bytes: int, vectorized: bool = True) -> Iterator[np.ndarray]:
+        """Unroll the sequence incrementally and yield the interleaved replay data in chunks.
+
+        In contrast to ``unroll_sequence``, the whole sequence is never held in memory.
+        Consecutive blocks are unrolled in segments of about one chunk, peak memory is bounded by a few chunks
+        (or the largest block, if a single block exceeds the chunk size).
+        The replay data is identical to the concatenated ``seq`` of ``unroll_sequence``.
+
+        Parameters
+        ----------
+        chunk_bytes
+            Size of each chunk in bytes, must be a multiple of 8 (4 channels with 2 bytes per sample).
+            Usually the notify size of the transmit card.
+        vectorized, optional
+            Use the batched unrolling engine, by default True
+
+        Yields
+        ------
+            Interleaved int16 replay data with chunk_bytes bytes. The last chunk is padded with zeros.
+
+        Raises
+        ------
+        ValueError
+            Chunk size is not a multiple of 8 bytes
+        """
+        block_keys, block_pos = self._prepare_unrolling()
+        rf_start = self._rf_start_position(block_keys, block_pos)
+        yield from self._stream_blocks(block_keys, block_pos, rf_start, chunk_bytes, vectorized=vectorized)
 
+    def _stream_blocks(
+        self,
+        block_keys: list,
+        block_pos: np.ndarray,
+        rf_start: int,
+        chunk_bytes: int,
+        vectorized: bool = True,
+    ) -> Iterator[np.ndarray]:
+        """Yield the replay data of validated blocks in chunks, see ``stream_sequence``."""
+        try:
+            if chunk_bytes <= 0 or chunk_bytes % 8 != 0:
+                raise ValueError("Chunk size must be a positive multiple of 8 bytes: %s" % chunk_bytes)
+        except ValueError as err:
+            self.log.exception(err, exc_info=True)
+            raise err
+
+        chunk_size = chunk_bytes // 2
+        remainder = np.zeros(0, dtype=np.int16)
+        first = 0
+        while first < len(block_keys):
+            # Take consecutive blocks until the segment fills at least one chunk
+            segment_end = block_pos[first] + chunk_size // 4
+            last = max(first + 1, min(len(block_keys), int(np.searchsorted(block_pos, segment_end))))
+            sqnc, _ = self._unroll_segment(
+                block_keys[first:last], block_pos[first:last + 1], rf_start, vectorized=vectorized
+            )
+            data = np.concatenate((remainder, sqnc)) if remainder.size > 0 else sqnc
+            num_chunks = data.size // chunk_size
+            for k in range(num_chunks):
+                yield data[k * chunk_size:(k + 1) * chunk_size]
+            remainder = data[num_chunks * chunk_size:]
+            first = last
+
+        self.sample_count = int(block_pos[-1])
+        if remainder.size > 0:
+            yield np.concatenate((remainder, np.zeros(chunk_size - remainder.size, dtype=np.int16)))
+
+    def _prepare_unrolling(self) -> tuple[list, np.ndarray]:
+        """Validate the sequence and calculate the sample position of each block.
+
+        Returns
+        -------
+            List of block keys and sample positions of the blocks with the total number of samples as last entry
+        """
         try:
             # Check larmor frequency
-            if console.parameter.larmor_frequency > 10e6:
+            if self.acquisition_parameter.larmor_frequency > 10e6:
                 raise ValueError("Larmor frequency is above 10 MHz: %s MHz",
-                                 console.parameter.larmor_frequency * 1e-6)
-            self.larmor_freq = console.parameter.larmor_frequency
+                                 self.acquisition_parameter.larmor_frequency * 1e-6)
+            self.larmor_freq = self.acquisition_parameter.larmor_frequency
 
             # Check if sequence has block events
             if not len(self.block_events) > 0:
@@ -476,88 +880,356 @@ class SequenceProvider(Sequence):
             self.log.exception(err, exc_info=True)
             raise err
 
-        # Get all blocks in a list and pre-calculate number of sample points per block
-        # to allocate empty sequence array.
-        blocks = [self.get_block(k) for k in list(self.block_events.keys())]
-        samples_per_block = [round(block.block_duration / self.spcm_dwell_time) for block in blocks]
-
-        # Internal list of arrays to store sequence and digital signals
-        # Empty list of list, 4 channels => 4 times n_samples
-        # Sequence, ADC events, unblanking and reference signal (for phase synchronization)
-        _seq = [np.zeros(4 * n, dtype=np.int16) for n in samples_per_block]
-        _adc = [np.zeros(n, dtype=np.int16) for n in samples_per_block]
-        _unblanking = [np.zeros(n, dtype=np.int16) for n in samples_per_block]
-        _ref = [np.zeros(n, dtype=np.int16) for n in samples_per_block]
-
-        # Count the total number of sample points and gate signals
-        self.sample_count = 0
+        # Pre-calculate number of sample points per block and the sample position of each block
+        # to allocate the sequence array at once.
+        block_keys = list(self.block_events.keys())
+        samples_per_block = [round(self.block_durations[key] / self.spcm_dwell_time) for key in block_keys]
+        block_pos = np.zeros(len(block_keys) + 1, dtype=np.int64)
+        np.cumsum(samples_per_block, out=block_pos[1:])
+        return block_keys, block_pos
+
+    def _rf_start_position(self, block_keys: list, block_pos: np.ndarray) -> int:
+        """Return the sample position of the first RF event, which is the reference of the carrier phase."""
+        for k, key in enumerate(block_keys):
+            if self.block_events[key][1] != 0 and self.get_block(key).rf.signal.size > 0:
+                return int(block_pos[k])
+        return 0
+
+    def _unroll_segment(
+        self,
+        block_keys: list,
+        block_pos: np.ndarray,
+        rf_start: int,
+        vectorized: bool = True,
+        workers: int = 1,
+    ) -> tuple[np.ndarray, int]:
+        """Unroll consecutive blocks into a new interleaved buffer.
+
+        Parameters
+        ----------
+        block_keys
+            Keys of the consecutive blocks
+        block_pos
+            Absolute sample positions of the blocks, one entry more than block keys
+        rf_start
+            Absolute sample position of the first RF event in the sequence
+        vectorized, optional
+            Use the batched unrolling engine, by default True
+        workers, optional
+            Number of threads which unroll contiguous block ranges concurrently, by default 1
+
+        Returns
+        -------
+            Interleaved sequence with merged digital signals and number of ADC events
+        """
+        sample_offset = int(block_pos[0])
+        local_pos = block_pos - sample_offset
+
+        # Interleaved sequence array, 4 channels => 4 times n_samples
+        # Digital signals are written to the 16th bit of the gradient channels in place
+        _sqnc = np.zeros(4 * int(local_pos[-1]), dtype=np.int16)
+
+        unroll = self._unroll_vectorized if vectorized else self._unroll_blockwise
+        if workers > 1 and len(block_keys) > 1:
+            adc_count = self._unroll_parallel(unroll, block_keys, local_pos, _sqnc, sample_offset, rf_start, workers)
+        else:
+            adc_count = unroll(block_keys, local_pos, _sqnc, sample_offset, rf_start)
+
+        return _sqnc, adc_count
+
+    def _unroll_parallel(
+        self,
+        unroll: Callable[..., int],
+        block_keys: list,
+        block_pos: np.ndarray,
+        sqnc: np.ndarray,
+        sample_offset: int,
+        rf_start: int,
+        workers: int,
+    ) -> int:
+        """Unroll contiguous block ranges concurrently into the shared buffer, returns the number of ADC events.
+
+        The blocks are partitioned into ranges with about the same number of samples.
+        Each range is unrolled by the given engine into its own section of the buffer.
+        The absolute sample position of a range is known from the block positions,
+        such that carrier and reference phase are identical to the serial unrolling.
+        """
+        num_blocks = len(block_keys)
+        # Use more ranges than threads to balance ranges with many RF events
+        targets = np.linspace(0, block_pos[-1], _RANGES_PER_WORKER * workers + 1)
+        bounds = np.unique(np.clip(np.searchsorted(block_pos[:-1], targets), 0, num_blocks))
+        bounds = np.union1d(bounds, [0, num_blocks])
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="unroll") as executor:
+            futures = [
+                executor.submit(
+                    unroll,
+                    block_keys[first:last],
+                    block_pos[first:last + 1] - block_pos[first],
+                    sqnc[4 * int(block_pos[first]):4 * int(block_pos[last])],
+                    sample_offset + int(block_pos[first]),
+                    rf_start,
+                )
+                for first, last in zip(bounds[:-1], bounds[1:])
+            ]
+            return sum(future.result() for future in futures)
+
+    def _unroll_blockwise(
+        self,
+        block_keys: list,
+        block_pos: np.ndarray,
+        sqnc: np.ndarray,
+        sample_offset: int = 0,
+        rf_start: int = 0,
+    ) -> int:
+        """Unroll the sequence block by block, returns the number of ADC events.
+
+        Block positions are relative to the given array, the sample offset is the absolute position
+        of the first block within the sequence.
+        """
+        # Count the number of gate signals, the sample position of each block is passed explicitly
         adc_count: int = 0
-        rf_start_sample_pos: int | None = None
 
-        for k, (n_samples, block) in enumerate(zip(samples_per_block, blocks, strict=True)):
+        for k, key in enumerate(block_keys):
+            block = self.get_block(key)
+            start, end = int(block_pos[k]), int(block_pos[k + 1])
+            _seq = sqnc[4 * start:4 * end]
+            # Digital signals of the block: ADC gate, reference and unblanking signal
+            has_digital = block.rf is not None or block.adc is not None
+            _digital = np.zeros((end - start if has_digital else 0, 3), dtype=np.uint16)
 
             if block.rf is not None and block.rf.signal.size > 0:
                 # Every 4th value in _seq starting at index 0 belongs to RF
-                if rf_start_sample_pos is None:
-                    rf_start_sample_pos = self.sample_count
                 self.calculate_rf(
                     block=block.rf,
-                    unroll_arr=_seq[k][0::4],
-                    unblanking=_unblanking[k],
-                    b1_scaling=console.parameter.b1_scaling,
-                    num_samples_rf_start=rf_start_sample_pos,
+                    unroll_arr=_seq[0::4],
+                    unblanking=_digital[:, 2],
+                    b1_scaling=self.acquisition_parameter.b1_scaling,
+                    num_samples_rf_start=rf_start,
+                    sample_position=sample_offset + start,
                 )
 
             if block.adc is not None:
-                self.add_adc_gate(block.adc, _adc[k], _ref[k])
+                self.add_adc_gate(block.adc, _digital[:, 0], _digital[:, 1], sample_position=sample_offset + start)
                 adc_count += 1
 
             if block.gx is not None:
                 # Every 4th value in _seq starting at index 1 belongs to x gradient
                 self.calculate_gradient(
-                    block=block.gx, unroll_arr=_seq[k][1::4], fov_scaling=console.parameter.fov_scaling.x
+                    block=block.gx, unroll_arr=_seq[1::4], fov_scaling=self.acquisition_parameter.fov_scaling.x
                 )
             if block.gy is not None:
                 # Every 4th value in _seq starting at index 2 belongs to y gradient
                 self.calculate_gradient(
-                    block=block.gy, unroll_arr=_seq[k][2::4], fov_scaling=console.parameter.fov_scaling.y
+                    block=block.gy, unroll_arr=_seq[2::4], fov_scaling=self.acquisition_parameter.fov_scaling.y
                 )
             if block.gz is not None:
                 # Every 4th value in _seq starting at index 3 belongs to z gradient
                 self.calculate_gradient(
-                    block=block.gz, unroll_arr=_seq[k][3::4], fov_scaling=console.parameter.fov_scaling.z
+                    block=block.gz, unroll_arr=_seq[3::4], fov_scaling=self.acquisition_parameter.fov_scaling.z
                 )
 
-            # Bitwise operations to merge gx with adc and gy with unblanking
-            _seq[k][1::4] = _seq[k][1::4].view(np.uint16) >> 1 | (_adc[k] << 15)
-            _seq[k][2::4] = _seq[k][2::4].view(np.uint16) >> 1 | (_ref[k] << 15)
-            _seq[k][3::4] = _seq[k][3::4].view(np.uint16) >> 1 | (_unblanking[k] << 15)
+            # Merge gx with adc, gy with reference and gz with unblanking in place
+            gradients = _seq.view(np.uint16).reshape(-1, 4)[:, 1:]
+            np.right_shift(gradients, 1, out=gradients)
+            if has_digital:
+                np.left_shift(_digital, 15, out=_digital)
+                np.bitwise_or(gradients, _digital, out=gradients)
 
-            # Count the total amount of samples (for one channel) to keep track of the phase
-            self.sample_count += n_samples
+        return adc_count
 
-        self.log.debug(
-            "Unrolled sequence; Total sample points: %s; Total block events: %s",
-            self.sample_count,
-            len(blocks),
-        )
+    @profile
+    def _unroll_vectorized(
+        self,
+        block_keys: list,
+        block_pos: np.ndarray,
+        sqnc: np.ndarray,
+        sample_offset: int = 0,
+        rf_start: int = 0,
+    ) -> int:
+        """Unroll the sequence grouped by library events, returns the number of ADC events.
+
+        Each library event is decompressed once using the first block which contains it.
+        Blocks which share a gradient or ADC event get identical waveforms, which are written
+        to all the block positions at once.
+        Digital signals are set in the 16th bit of the gradient channels after all gradients are written.
+        Block positions are relative to the given array, the sample offset is the absolute position
+        of the first block within the sequence.
+        """
+        event_ids = self._event_ids(block_keys)
+        bits = sqnc.view(np.uint16).reshape(-1, 4)
 
-        # Save unrolled sequence in class
-        self._sqnc_cache = _seq
+        self._write_gradients(block_keys, block_pos, event_ids, sqnc, columns=[1, 2, 3])
+        # Free the 16th bit of the gradient channels for the digital signals
+        np.right_shift(bits[:, 1:], 1, out=bits[:, 1:])
 
-        return UnrolledSequence(
-            seq=_seq,
-            adc_gate=_adc,
-            rf_unblanking=_unblanking,
-            sample_count=self.sample_count,
-            gpa_gain=self.gpa_gain,
-            gradient_efficiency=self.grad_eff,
-            rf_to_mvolt=self.rf_to_mvolt,
-            dwell_time=self.spcm_dwell_time,
-            larmor_frequency=self.larmor_freq,
-            duration=self.duration()[0],
-            adc_count=adc_count,
+        adc_blocks = self._write_adc_gates(block_keys, block_pos, event_ids, sqnc)
+        self._add_reference_signal(
+            bits[:, 2], block_pos[adc_blocks], np.diff(block_pos)[adc_blocks], sample_offset=sample_offset
         )
+        self._write_rf(block_keys, block_pos, event_ids, sqnc, sample_offset, rf_start)
+
+        return int(adc_blocks.size)
+
+    def _event_ids(self, block_keys: list) -> np.ndarray:
+        """Return the library event IDs per block, columns: RF, Gx, Gy, Gz and ADC."""
+        return np.array([self.block_events[key][1:6] for key in block_keys], dtype=np.int64).reshape(-1, 5)
+
+    def _write_gradients(
+        self, block_keys: list, block_pos: np.ndarray, event_ids: np.ndarray, sqnc: np.ndarray, columns: list[int]
+    ) -> None:
+        """Calculate the waveform once per gradient event and write it to all occurrences.
+
+        The int16 gradient values are written to the given channels (1: gx, 2: gy, 3: gz),
+        before the digital signals are merged.
+        """
+        samples_per_block = np.diff(block_pos)
+        channels = sqnc.reshape(-1, 4)
+        fov_scaling = self.acquisition_parameter.fov_scaling
+        for col in columns:
+            name, scaling = [("gx", fov_scaling.x), ("gy", fov_scaling.y), ("gz", fov_scaling.z)][col - 1]
+            for blocks in _event_occurrences(event_ids[:, col]):
+                event = getattr(self.get_block(block_keys[blocks[0]]), name)
+                samples_delay = int(event.delay * self.spcm_freq)
+                gradient = self.gradient_waveform(event, scaling)
+                try:
+                    if np.any(samples_delay + gradient.size > samples_per_block[blocks]):
+                        raise IndexError("Unrolled gradient event exceeds number of block samples")
+                except IndexError as err:
+                    self.log.exception(err, exc_info=True)
+                    raise err
+                _scatter(channels[:, col], block_pos[blocks] + samples_delay, gradient)
+
+    def _check_output_limits(self, block_keys: list, event_ids: np.ndarray, rf: bool, columns: list[int]) -> None:
+        """Check the amplitudes of the RF events (if rf is True) and the gradient events of the given channels.
+
+        Raises a ValueError, if an event exceeds the output limit, see ``calculate_rf`` and ``gradient_waveform``.
+        """
+        if rf:
+            b1_scaling = self.acquisition_parameter.b1_scaling
+            rf_scaling = b1_scaling * self.rf_to_mvolt * self.imp_scaling[0] / self.output_limits[0]
+            for blocks in _event_occurrences(event_ids[:, 0]):
+                event = self.get_block(block_keys[blocks[0]]).rf
+                try:
+                    if event.signal.size > 0 and np.amax(np.abs(event.signal * rf_scaling)) > 1:
+                        raise ValueError("RF magnitude exceeds output limit.")
+                except ValueError as err:
+                    self.log.exception(err, exc_info=True)
+                    raise err
+        fov_scaling = self.acquisition_parameter.fov_scaling
+        for col in columns:
+            name, scaling = [("gx", fov_scaling.x), ("gy", fov_scaling.y), ("gz", fov_scaling.z)][col - 1]
+            for blocks in _event_occurrences(event_ids[:, col]):
+                self.gradient_waveform(getattr(self.get_block(block_keys[blocks[0]]), name), scaling)
+
+    def _adc_gate_range(self, event: SimpleNamespace) -> tuple[int, int]:
+        """Return delay and length of the gate signal of an ADC event in samples."""
+        delay = max(int(event.delay * self.spcm_freq), int(event.dead_time * self.spcm_freq))
+        return delay, round(event.num_samples * event.dwell * self.spcm_freq)
+
+    def _adc_gate_samples(self, block_keys: list, block_pos: np.ndarray) -> list[int]:
+        """Return the number of gate samples of each ADC event in sequence order.
+
+        Gates are truncated at the end of a block, as by ``_write_adc_gates``.
+        """
+        samples_per_block = np.diff(block_pos)
+        adc_ids = self._event_ids(block_keys)[:, 4]
+        gate_samples = np.zeros(adc_ids.size, dtype=np.int64)
+        for blocks in _event_occurrences(adc_ids):
+            delay, adc_len = self._adc_gate_range(self.get_block(block_keys[blocks[0]]).adc)
+            block_samples = samples_per_block[blocks]
+            gate_samples[blocks] = np.minimum(delay + adc_len, block_samples) - np.minimum(delay, block_samples)
+        return gate_samples[adc_ids > 0].tolist()
+
+    def _write_adc_gates(
+        self, block_keys: list, block_pos: np.ndarray, event_ids: np.ndarray, sqnc: np.ndarray
+    ) -> np.ndarray:
+        """Set the ADC gate signal (16th bit of gx), returns the indices of the ADC blocks.
+
+        The gate range is defined by the event, gates are truncated at the end of a block.
+        """
+        samples_per_block = np.diff(block_pos)
+        adc_blocks = np.flatnonzero(event_ids[:, 4])
+        gate_start, gate_end = [], []
+        for blocks in _event_occurrences(event_ids[:, 4]):
+            delay, adc_len = self._adc_gate_range(self.get_block(block_keys[blocks[0]]).adc)
+            gate_start.append(block_pos[blocks] + np.minimum(delay, samples_per_block[blocks]))
+            gate_end.append(block_pos[blocks] + np.minimum(delay + adc_len, samples_per_block[blocks]))
+        if adc_blocks.size > 0:
+            gate_start_arr = np.concatenate(gate_start)
+            gate = sqnc.view(np.uint16)[1::4]
+            for _, _, index in _batched_ranges(gate_start_arr, np.concatenate(gate_end) - gate_start_arr):
+                gate[index] |= _DIGITAL_BIT
+        return adc_blocks
+
+    def _write_rf(
+        self,
+        block_keys: list,
+        block_pos: np.ndarray,
+        event_ids: np.ndarray,
+        sqnc: np.ndarray,
+        sample_offset: int,
+        rf_start: int,
+        unblanking: bool = True,
+    ) -> None:
+        """Calculate the RF events per occurrence, since the carrier phase depends on the sample position.
+
+        If unblanking is True, the unblanking signal is merged into the 16th bit of gz.
+        """
+        rf_events = {}
+        for blocks in _event_occurrences(event_ids[:, 0]):
+            event = self.get_block(block_keys[blocks[0]]).rf
+            if event.signal.size > 0:
+                rf_events[event_ids[blocks[0], 0]] = event
+        rf_blocks = np.flatnonzero(np.isin(event_ids[:, 0], list(rf_events.keys())))
+        if rf_blocks.size == 0:
+            return
+
+        channels = sqnc.reshape(-1, 4)
+        unblanking_bits = sqnc.view(np.uint16)[3::4]
+        # Unblanking signal of a single block
+        _unblanking = np.zeros(int(np.diff(block_pos)[rf_blocks].max()), dtype=np.uint16)
+        for k in rf_blocks:
+            start, end = int(block_pos[k]), int(block_pos[k + 1])
+            block_unblanking = _unblanking[:end - start]
+            block_unblanking.fill(0)
+            self.calculate_rf(
+                block=rf_events[event_ids[k, 0]],
+                unroll_arr=channels[start:end, 0],
+                unblanking=block_unblanking,
+                b1_scaling=self.acquisition_parameter.b1_scaling,
+                num_samples_rf_start=rf_start,
+                sample_position=sample_offset + start,
+            )
+            if unblanking:
+                np.left_shift(block_unblanking, 15, out=block_unblanking)
+                np.bitwise_or(unblanking_bits[start:end], block_unblanking, out=unblanking_bits[start:end])
+
+    def _add_reference_signal(
+        self, clk_ref: np.ndarray, block_starts: np.ndarray, block_sizes: np.ndarray, sample_offset: int = 0
+    ) -> None:
+        """Set the digital reference signal (16th bit) of multiple ADC blocks in place.
+
+        Vectorized version of the reference signal calculation in ``add_adc_gate``.
+        Blocks are processed in batches to limit the size of the temporary phase arrays.
+        The phase offset of each block is given by its absolute position, i.e. the block start plus sample offset.
+        """
+        nco = NumericallyControlledOscillator(self.larmor_freq, self.spcm_dwell_time)
+        offsets = self._reference_phase_offset(block_starts + sample_offset)
+        for batch, local, index in _batched_ranges(block_starts, block_sizes):
+            ref_signal = nco.reference(nco.phase(local, start=np.repeat(offsets[batch], block_sizes[batch])))
+            if isinstance(index, slice):
+                clk_ref[index][ref_signal] |= _DIGITAL_BIT
+            else:
+                clk_ref[index[ref_signal]] |= _DIGITAL_BIT
+
+    def _reference_phase_offset(self, sample_pos: np.ndarray) -> np.ndarray:
+        """Return the phase words of the reference signal at the beginning of ADC blocks.
+
+        The phase offset in cycles is given by the sample position times the dwell time.
+        It is calculated in the integer phase domain, which keeps the offset exact for long sequences.
+        """
+        return np.asarray(sample_pos, dtype=np.uint64) * phase_word(self.spcm_dwell_time)
 
     def plot_unrolled(
             self, time_range: tuple[float, float] = (0, -1)
@@ -576,7 +1248,7 @@ class SequenceProvider(Sequence):
         """
         fig, axis = plt.subplots(5, 1, figsize=(16, 9))
 
-        if not self._sqnc_cache:
+        if self._sqnc_cache is None:
             print("No unrolled sequence...")
             return fig, axis
 
@@ -584,7 +1256,7 @@ class SequenceProvider(Sequence):
         seq_end = int(time_range[1] * self.spcm_freq) if time_range[1] > time_range[0] else -1
         samples = np.arange(self.sample_count, dtype=float)[seq_start:seq_end] * self.spcm_dwell_time * 1e3
 
-        sqnc = np.concatenate(self._sqnc_cache)
+        sqnc = self._sqnc_cache
         rf_signal = sqnc[0::4][seq_start:seq_end]
         gx_signal = sqnc[1::4][seq_start:seq_end]
         gy_signal = sqnc[2::4][seq_start:seq_end]
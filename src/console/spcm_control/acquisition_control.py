@@ -1,25 +1,36 @@
 """Acquisition Control Class."""
 
+import functools
 import logging
 import logging.config
 import os
+import threading
 import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field, replace
 from datetime import datetime
 from pathlib import Path
 
 import numpy as np
-from scipy import signal
 
 import console
 from console.interfaces.acquisition_data import AcquisitionData
 from console.interfaces.acquisition_parameter import AcquisitionParameter, DDCMethod
 from console.interfaces.dimensions import Dimensions
+from console.interfaces.enums import Precision
 from console.interfaces.unrolled_sequence import UnrolledSequence
+from console.pulseq_interpreter.sequence_cache import SequenceCache, sequence_digest
 from console.pulseq_interpreter.sequence_provider import Sequence, SequenceProvider
+from console.spcm_control.acquisition_store import AcquisitionStore
+from console.spcm_control.async_acquisition import AsyncAcquisition
+from console.spcm_control.average_accumulator import AverageAccumulator, ProcessedAverage, ProcessedGates
+from console.spcm_control.gate_pipeline import GatePipeline
+from console.spcm_control.protocol_queue import ProtocolItem, ProtocolQueue
 from console.spcm_control.rx_device import RxCard
+from console.spcm_control.spcm.tools import dma_buffer_pool
 from console.spcm_control.tx_device import TxCard
 from console.utilities import ddc
-from console.utilities.load_config import get_instances
+from console.utilities.load_config import get_instances, get_sequence_provider
 
 LOG_LEVELS = [
     logging.DEBUG,
@@ -30,6 +41,51 @@ LOG_LEVELS = [
 ]
 
 
+@dataclass
+class PrecisionValidation:
+    """Deviation of the post-processing in reduced precision from the float64 post-processing."""
+
+    gates: int = 0
+    """Number of validated gates."""
+
+    max_abs_error: float = 0.
+    """Max. absolute deviation of the processed data."""
+
+    max_magnitude: float = 0.
+    """Max. magnitude of the processed float64 data."""
+
+    @property
+    def relative_error(self) -> float:
+        """Max. absolute deviation relative to the max. magnitude."""
+        return self.max_abs_error / self.max_magnitude if self.max_magnitude > 0 else 0.
+
+    def dict(self) -> dict:
+        """Return the validation result as dictionary, including the relative error."""
+        return {**asdict(self), "relative_error": self.relative_error}
+
+
+@dataclass
+class AcquisitionTiming:
+    """Timing of the card operations of an acquisition, with one entry per card session."""
+
+    rx_start: list[float] = field(default_factory=list)
+    """Time between starting the receive operation and the started receive card in s."""
+
+    tx_arm: list[float] = field(default_factory=list)
+    """Time between starting the transmit operation and the armed transmit card in s."""
+
+    arm_to_first_gate: list[float] = field(default_factory=list)
+    """Latency between the armed transmit card and the first gate, which was read by the receive card, in s."""
+
+    def dict(self) -> dict:
+        """Return the timing as dictionary."""
+        return asdict(self)
+
+
+class AcquisitionCancelledError(Exception):
+    """Acquisition was cancelled before all averages were received."""
+
+
 class AcquisitionControl:
     """Acquisition control class.
 
@@ -43,6 +99,11 @@ class AcquisitionControl:
         nexus_data_dir: str = os.path.join(Path.home(), "nexus-console"),
         file_log_level: int = logging.INFO,
         console_log_level: int = logging.INFO,
+        sequence_cache_bytes: int = 8 * 1024**3,
+        ddc_workers: int = 0,
+        ddc_queue_size: int = 64,
+        validate_precision: bool = False,
+        continuous_averages: bool = False,
     ):
         """Construct acquisition control class.
 
@@ -61,6 +122,22 @@ class AcquisitionControl:
             Set the logging level for log file. Logfile is written to the session folder.
         console_log_level
             Set the logging level for the terminal/console output.
+        sequence_cache_bytes
+            Byte budget of the on-disk cache of unrolled sequences in the nexus data directory,
+            by default 8 GB. If 0, the cache is disabled and sequences are always unrolled.
+        ddc_workers
+            Number of threads, which demodulate and decimate the received gates while the acquisition is running,
+            by default 0. If 0, the gates of an average are processed after the average was received.
+        ddc_queue_size
+            Max. number of received gates, which wait for processing, by default 64.
+            Only used if ``ddc_workers`` is larger than 0.
+        validate_precision
+            Additionally process the gates in float64, if the precision of the acquisition parameter is reduced,
+            and report the deviation, by default False. Doubles the processing time.
+        continuous_averages
+            Acquire all averages back-to-back in one session of the measurement cards, by default False.
+            The transmit card replays the sequence for all averages and the receive card records one gated stream,
+            the averages are separated by the gate count. The averaging delay is replayed as zeros.
         """
         # Create session path (contains all acquisitions of one day)
         session_folder_name = datetime.now().strftime("%Y-%m-%d") + "-session/"
@@ -84,6 +161,7 @@ class AcquisitionControl:
         self._current_parameter_hash: int = hash(console.parameter)
 
         # Get instances from configuration file
+        self.configuration_file = configuration_file
         ctx = get_instances(configuration_file)
         self.seq_provider: SequenceProvider = ctx[0]
         self.tx_card: TxCard = ctx[1]
@@ -103,6 +181,39 @@ class AcquisitionControl:
         self.seq_provider.max_amp_per_channel = self.tx_card.max_amplitude
 
         self.unrolled_seq: UnrolledSequence | None = None
+        # Preallocated receive data and processed averages of the current acquisition, see run
+        self.rx_store: AcquisitionStore | None = None
+        self.averages: AverageAccumulator | None = None
+        # Unroll the sequence on demand while replaying, see set_sequence
+        self.streaming: bool = False
+        # Number of threads to unroll a sequence, see set_sequence
+        self.unroll_workers: int = 1
+        # Persistent cache of unrolled sequences, which is used if the sequence is not streamed
+        self.sequence_cache: SequenceCache | None = None
+        if sequence_cache_bytes > 0:
+            self.sequence_cache = SequenceCache(
+                os.path.join(nexus_data_dir, "sequence-cache"), max_bytes=sequence_cache_bytes
+            )
+
+        # Pipelined post processing of the received gates, see run
+        self.ddc_workers: int = ddc_workers
+        self.ddc_queue_size: int = ddc_queue_size
+
+        # Validation of the post-processing precision against float64, see _process_gates
+        self.validate_precision: bool = validate_precision
+        self.precision_validation: PrecisionValidation | None = None
+        self._validation_lock = threading.Lock()
+
+        # Acquire all averages in one session of the measurement cards, see run
+        self.continuous_averages: bool = continuous_averages
+        # Start and arm latencies of the card sessions of the last acquisition
+        self.timing = AcquisitionTiming()
+
+        # Set by cancel, checked by the running acquisition
+        self._cancel = threading.Event()
+
+        # Queued acquisitions, of which the next sequence is unrolled during the current acquisition, see enqueue
+        self.protocol = ProtocolQueue(self._prepare_protocol_item)
 
         # Attributes for data and dwell time of downsampled signal
         self._raw: list[np.ndarray] = []
@@ -143,15 +254,19 @@ class AcquisitionControl:
         console.setFormatter(formatter)
         logging.getLogger("").addHandler(console)
 
-    def set_sequence(self, sequence: str | Sequence) -> None:
+    def set_sequence(self, sequence: str | Sequence, streaming: bool = False, unroll_workers: int = 1) -> None:
         """Set sequence and acquisition parameter.
 
         Parameters
         ----------
         sequence
             Path to pulseq sequence file.
-        parameter
-            Set of acquisition parameters which are required for the acquisition.
+        streaming, optional
+            Unroll the sequence incrementally during the replay instead of holding the whole sequence in memory,
+            by default False. The sequence is unrolled again for each average.
+        unroll_workers, optional
+            Number of threads to unroll the sequence, by default 1.
+            Contiguous block ranges are unrolled concurrently, if larger than 1.
 
         Raises
         ------
@@ -160,40 +275,119 @@ class AcquisitionControl:
         FileNotFoundError
             Invalid file ending of sequence file.
         """
+        self._load_sequence(self.seq_provider, sequence)
+
+        # Reset unrolled sequence
+        self.unrolled_seq = None
+        self.log.info(
+            "Unrolling sequence: %s",
+            self.seq_provider.definitions["Name"].replace(" ", "_"),
+        )
+        # Update sequence parameter hash and calculate sequence
+        self.streaming = streaming
+        self.unroll_workers = unroll_workers
+        self._current_parameter_hash = hash(console.parameter)
+        self.unrolled_seq = self._unroll_sequence()
+        self.log.info("Sequence duration: %s s", self.unrolled_seq.duration)
+
+    def _load_sequence(self, provider: SequenceProvider, sequence: str | Sequence) -> None:
+        """Load a sequence file or pypulseq sequence into a sequence provider, see ``set_sequence``."""
         try:
             # Check sequence
             if isinstance(sequence, Sequence):
-                self.seq_provider.from_pypulseq(sequence)
+                provider.from_pypulseq(sequence)
             elif isinstance(sequence, str):
                 if not sequence.endswith(".seq"):
                     raise FileNotFoundError("Invalid sequence file.")
-                self.seq_provider.read(sequence)
+                provider.read(sequence)
 
         except (FileNotFoundError, AttributeError) as err:
             self.log.exception(err, exc_info=True)
             raise err
 
-        # Reset unrolled sequence
-        self.unrolled_seq = None
-        self.log.info(
-            "Unrolling sequence: %s",
-            self.seq_provider.definitions["Name"].replace(" ", "_"),
-        )
-        # Update sequence parameter hash and calculate sequence
-        self._current_parameter_hash = hash(console.parameter)
-        self.unrolled_seq = self.seq_provider.unroll_sequence()
-        self.log.info("Sequence duration: %s s", self.unrolled_seq.duration)
+    def _unroll_sequence(
+        self,
+        unrolled: UnrolledSequence | None = None,
+        provider: SequenceProvider | None = None,
+        streaming: bool | None = None,
+        workers: int | None = None,
+    ) -> UnrolledSequence:
+        """Unroll the current sequence or load it from the sequence cache.
 
-    def run(self) -> AcquisitionData:
+        Parameters
+        ----------
+        unrolled, optional
+            Previously unrolled sequence, which is updated if the sequence is not cached, by default None
+        provider, optional
+            Sequence provider which holds the sequence, by default the sequence provider of the acquisition control
+        streaming, optional
+            Unroll the sequence incrementally during the replay, by default the current streaming mode
+        workers, optional
+            Number of threads to unroll the sequence, by default the current number of unroll workers
+
+        Returns
+        -------
+            Unrolled sequence
+        """
+        provider = provider if provider is not None else self.seq_provider
+        streaming = streaming if streaming is not None else self.streaming
+        workers = workers if workers is not None else self.unroll_workers
+        if streaming or self.sequence_cache is None:
+            if unrolled is None:
+                return provider.unroll_sequence(streaming=streaming, workers=workers)
+            return provider.update_unrolled_sequence(unrolled, workers=workers)
+
+        key = sequence_digest(provider)
+        if (cached := self.sequence_cache.load(key)) is not None:
+            self.log.info("Loaded unrolled sequence from cache: %s", key)
+            provider.set_unrolled_sequence(cached)
+            return cached
+        if unrolled is None:
+            unrolled = provider.unroll_sequence(workers=workers)
+        else:
+            unrolled = provider.update_unrolled_sequence(unrolled, workers=workers)
+        if self.sequence_cache.store(key, unrolled):
+            self.log.debug("Stored unrolled sequence in cache: %s", key)
+        return unrolled
+
+    def run(
+        self,
+        gate_listener: Callable[[ProcessedGates], None] | None = None,
+        average_listener: Callable[[ProcessedAverage], None] | None = None,
+    ) -> AcquisitionData:
         """Run an acquisition job.
 
+        Parameters
+        ----------
+        gate_listener, optional
+            Function which is called with the processed gates during the acquisition, by default None.
+            Without ``ddc_workers``, the gates of a group are processed at once after each average.
+        average_listener, optional
+            Function which is called with the processed data of each average, once all of its gates
+            were processed, by default None. In running mean mode, it is called with the current mean.
+
+        The listeners are called from the acquisition or worker threads and must not block.
+
         Raises
         ------
         RuntimeError
             The measurement cards are not setup properly
         ValueError
             Missing raw data or missing averages
+        AcquisitionCancelledError
+            The acquisition was cancelled by ``cancel``
         """
+        return self._run(threading.Event(), gate_listener, average_listener)
+
+    def _run(
+        self,
+        cancel: threading.Event,
+        gate_listener: Callable[[ProcessedGates], None] | None = None,
+        average_listener: Callable[[ProcessedAverage], None] | None = None,
+    ) -> AcquisitionData:
+        """Run an acquisition job, which is cancelled by setting the given event, see ``run``."""
+        # Cancellation is scoped to this acquisition, cancelling a finished acquisition does not affect the next one
+        self._cancel = cancel
         try:
             # Check setup
             if not self.is_setup:
@@ -205,14 +399,16 @@ class AcquisitionControl:
             raise err
 
         if self._current_parameter_hash != hash(console.parameter):
-            # Redo sequence unrolling in case acquisition parameters changed, i.e. different hash
-            self.unrolled_seq = None
+            # Update sequence in case acquisition parameters changed, i.e. different hash
+            # Only the channels which depend on changed parameters are recalculated
             self.log.info(
-                "Unrolling sequence: %s", self.seq_provider.definitions["Name"].replace(" ", "_")
+                "Updating sequence: %s", self.seq_provider.definitions["Name"].replace(" ", "_")
             )
-            # Update acquisition parameter hash value
-            self._current_parameter_hash = hash(console.parameter)
-            self.unrolled_seq = self.seq_provider.unroll_sequence()
+            # Update acquisition parameter hash value once the update succeeded,
+            # such that a failed update is repeated by the next acquisition
+            parameter_hash = hash(console.parameter)
+            self.unrolled_seq = self._unroll_sequence(self.unrolled_seq)
+            self._current_parameter_hash = parameter_hash
             self.log.info("Sequence duration: %s s", self.unrolled_seq.duration)
 
         # Define timeout for acquisition process: 5 sec + sequence duration
@@ -220,87 +416,407 @@ class AcquisitionControl:
 
         self._unproc = []
         self._raw = []
+        # Preallocate the receive data of all averages from the ADC layout of the sequence,
+        # gate samples are converted from the replay to the receive sample rate
+        self.rx_store = AcquisitionStore(
+            gate_samples=[round(n * self.f_spcm * self.unrolled_seq.dwell_time) for n in self.unrolled_seq.adc_samples],
+            num_averages=console.parameter.num_averages,
+            num_channels=self.rx_card.num_channels.value,
+            continuous=self.continuous_averages,
+        )
+        self.log.debug("Allocated %s MB receive data", self.rx_store.nbytes * 1e-6)
+
+        # Preallocate the processed data of all averages or their running mean
+        parameter = console.parameter
+        self.averages = AverageAccumulator(
+            self.rx_store,
+            process=lambda gates: self._process_gates(gates, parameter),
+            running_mean=parameter.running_mean,
+            gate_listener=gate_listener,
+            average_listener=average_listener,
+        )
 
-        # Set gradient offset values
-        self.tx_card.set_gradient_offsets(console.parameter.gradient_offset, self.seq_provider.high_impedance[1:])
-
-        for k in range(console.parameter.num_averages):
-            self.log.info("Acquisition %s/%s", k + 1, console.parameter.num_averages)
-
-            # Start masurement card operations
-            self.rx_card.start_operation()
-            time.sleep(0.01)
-            self.tx_card.start_operation(self.unrolled_seq)
-
-            # Get start time of acquisition
-            time_start = time.time()
-
-            while (num_gates := len(self.rx_card.rx_data)) < self.unrolled_seq.adc_count or num_gates == 0:
-                # Delay poll by 10 ms
-                time.sleep(0.01)
-
-                if (time.time() - time_start) > timeout:
-                    # Could not receive all the data before timeout
-                    self.log.warning(
-                        "Acquisition Timeout: Only received %s/%s adc events",
-                        num_gates, self.unrolled_seq.adc_count
-                    )
-                    break
+        # Process the gates while the acquisition is running, if workers are set
+        pipeline = None
+        if self.ddc_workers > 0:
+            pipeline = GatePipeline(
+                self.rx_store,
+                process=lambda gates: self._process_gates(gates, parameter),
+                accumulator=self.averages,
+                workers=self.ddc_workers,
+                queue_size=self.ddc_queue_size,
+            )
+            pipeline.start()
 
-                if num_gates >= self.unrolled_seq.adc_count and num_gates > 0:
-                    break
+        # Validation is started after the outputs were allocated from the results of zero-filled gates
+        self.precision_validation = None
+        if self.validate_precision and console.parameter.precision != Precision.DOUBLE:
+            self.precision_validation = PrecisionValidation()
 
-            if num_gates > 0:
-                self.post_processing(console.parameter)
+        self.timing = AcquisitionTiming()
 
-            self.tx_card.stop_operation()
-            self.rx_card.stop_operation()
+        # Set gradient offset values
+        self.tx_card.set_gradient_offsets(console.parameter.gradient_offset, self.seq_provider.high_impedance[1:])
 
-            if console.parameter.averaging_delay > 0:
-                time.sleep(console.parameter.averaging_delay)
+        if self.continuous_averages:
+            self._acquire_continuous(pipeline, timeout)
+        else:
+            self._acquire_averages(pipeline, timeout)
 
         # Reset gradient offset values
         self.tx_card.set_gradient_offsets(Dimensions(x=0, y=0, z=0), self.seq_provider.high_impedance[1:])
 
+        if pipeline is not None:
+            # Wait for the gates in the queue
+            pipeline.join()
+
+        if self._cancel.is_set():
+            self.log.info("Acquisition cancelled, received %s gates", int(self.rx_store.received.sum()))
+            raise AcquisitionCancelledError("Acquisition was cancelled.")
+
+        # Results of all averages which received gates, or their mean
+        received = np.flatnonzero(self.rx_store.received)
+        results = self.averages.results(received if received.size < parameter.num_averages else None)
+        self._unproc = [unprocessed for unprocessed, _ in results]
+        self._raw = [raw for _, raw in results]
+
         try:
-            # if len(self._raw) != parameter.num_averages:
-            if not all(gate.shape[0] == console.parameter.num_averages for gate in self._raw):
-                raise ValueError(
-                    "Missing averages: %s/%s",
-                    [gate.shape[0] for gate in self._raw],
-                    console.parameter.num_averages,
-                )
+            if received.size != parameter.num_averages:
+                raise ValueError("Missing averages: %s/%s", received.size, parameter.num_averages)
         except ValueError as err:
             self.log.exception(err, exc_info=True)
             raise err
 
+        meta = {
+            self.tx_card.__name__: self.tx_card.dict(),
+            self.rx_card.__name__: self.rx_card.dict(),
+            self.seq_provider.__name__: self.seq_provider.dict(),
+            "dma_buffer_pool": dma_buffer_pool.stats.dict(),
+            "timing": self.timing.dict(),
+        }
+        additional_data = {}
+        if self.averages.running_mean:
+            # Variance of the processed data across the averages, named like the raw data files
+            variances = self.averages.variances()
+            if len(variances) == 1:
+                additional_data["raw_variance"] = variances[0]
+            else:
+                additional_data.update({f"raw_variance_{k}": variance for k, variance in enumerate(variances)})
+            meta["running_mean"] = {"averages": int(received.size)}
+        if self.precision_validation is not None:
+            self.log.info(
+                "Deviation of %s post-processing from float64: %.3e (relative: %.3e, %s gates)",
+                console.parameter.precision.value,
+                self.precision_validation.max_abs_error,
+                self.precision_validation.relative_error,
+                self.precision_validation.gates,
+            )
+            meta["precision_validation"] = self.precision_validation.dict()
+
         return AcquisitionData(
             _raw=self._raw,
             unprocessed_data=self._unproc,
             sequence=self.seq_provider,
             session_path=self.session_path,
-            meta={
-                self.tx_card.__name__: self.tx_card.dict(),
-                self.rx_card.__name__: self.rx_card.dict(),
-                self.seq_provider.__name__: self.seq_provider.dict()
-            },
+            meta=meta,
             dwell_time=console.parameter.decimation / self.f_spcm,
             acquisition_parameters=console.parameter,
+            _additional_data=additional_data,
         )
 
-    def post_processing(self, parameter: AcquisitionParameter) -> None:
+    def enqueue(
+        self,
+        sequence: str | Sequence,
+        parameter: AcquisitionParameter | None = None,
+        name: str = "",
+        streaming: bool = False,
+        unroll_workers: int = 1,
+    ) -> ProtocolItem:
+        """Append an acquisition to the protocol queue, see ``run_protocol``.
+
+        The sequence of the next queued acquisition is read and unrolled in the background,
+        e.g. while the previous acquisition is running.
+
+        Parameters
+        ----------
+        sequence
+            Path to pulseq sequence file or pypulseq sequence
+        parameter, optional
+            Acquisition parameters, by default a copy of the current acquisition parameters
+        name, optional
+            Name of the acquisition, by default the index of the acquisition in the queue
+        streaming, optional
+            Unroll the sequence incrementally during the replay, by default False
+        unroll_workers, optional
+            Number of threads to unroll the sequence, by default 1
+
+        Returns
+        -------
+            Protocol item, which holds the acquisition data and the timing once the acquisition has finished
+        """
+        if parameter is None:
+            parameter = replace(console.parameter, save_on_mutation=False)
+        item = ProtocolItem(
+            sequence=sequence,
+            parameter=parameter,
+            name=name or str(len(self.protocol)),
+            streaming=streaming,
+            unroll_workers=unroll_workers,
+        )
+        return self.protocol.put(item)
+
+    def run_protocol(self) -> list[ProtocolItem]:
+        """Run all acquisitions of the protocol queue back-to-back.
+
+        Each acquisition is started as soon as the previous acquisition has finished and its sequence was unrolled,
+        the sequence of the subsequent acquisition is unrolled in the background meanwhile.
+        The unroll, wait and scan time of each acquisition are stored in the meta data of its acquisition data.
+        The current acquisition parameters and sequence are restored afterwards.
+
+        Returns
+        -------
+            Protocol items with the acquisition data
+        """
+        parameter = console.parameter
+        state = (
+            self.seq_provider, self.unrolled_seq, self.streaming, self.unroll_workers, self._current_parameter_hash
+        )
+        items = []
+        try:
+            while len(self.protocol) > 0:
+                item = self.protocol.get()
+                self._set_protocol_item(item)
+                self.log.info("Protocol item %s: %s", item.name, self.seq_provider.definitions.get("Name", ""))
+
+                time_start = time.perf_counter()
+                item.data = self.run()
+                item.timing.scan_time = time.perf_counter() - time_start
+                item.data.meta["protocol"] = {"name": item.name, **item.timing.dict()}
+                items.append(item)
+                self.log.info(
+                    "Protocol item %s: unroll time %.3f s, wait time %.3f s, scan time %.3f s",
+                    item.name, item.timing.unroll_time, item.timing.wait_time, item.timing.scan_time,
+                )
+        finally:
+            console.parameter = parameter
+            (
+                self.seq_provider, self.unrolled_seq, self.streaming, self.unroll_workers, self._current_parameter_hash
+            ) = state
+        return items
+
+    def _prepare_protocol_item(self, item: ProtocolItem) -> None:
+        """Read and unroll the sequence of a protocol item with its acquisition parameters.
+
+        Called by the background worker of the protocol queue, the sequence is loaded into a separate
+        sequence provider, such that the sequence of the running acquisition is not modified.
+        """
+        provider = get_sequence_provider(self.configuration_file)
+        provider.output_limits = self.tx_card.max_amplitude
+        provider.max_amp_per_channel = self.tx_card.max_amplitude
+        provider.parameter = item.parameter
+        self._load_sequence(provider, item.sequence)
+        item.parameter_hash = hash(item.parameter)
+        item.unrolled_seq = self._unroll_sequence(
+            provider=provider, streaming=item.streaming, workers=item.unroll_workers
+        )
+        item.seq_provider = provider
+
+    def _set_protocol_item(self, item: ProtocolItem) -> None:
+        """Set the unrolled sequence and the acquisition parameters of a prepared protocol item."""
+        if item.seq_provider is None or item.unrolled_seq is None:
+            return
+        # The sequence provider reads the global acquisition parameters from now on
+        item.seq_provider.parameter = None
+        console.parameter = item.parameter
+        self.seq_provider = item.seq_provider
+        self.streaming = item.streaming
+        self.unroll_workers = item.unroll_workers
+        self.unrolled_seq = item.unrolled_seq
+        # The sequence is updated by run, if the parameters were modified after the sequence was unrolled
+        self._current_parameter_hash = item.parameter_hash if item.parameter_hash is not None else 0
+
+    def cancel(self) -> None:
+        """Cancel the running acquisition, e.g. from another thread.
+
+        The acquisition stops waiting for gates, both cards are stopped and ``run`` raises an
+        ``AcquisitionCancelledError``. If no acquisition is running, the call has no effect.
+        """
+        self._cancel_run(self._cancel)
+
+    def _cancel_run(self, cancel: threading.Event) -> None:
+        """Cancel the acquisition of a cancellation event, the receive card is only interrupted if it is running."""
+        cancel.set()
+        if cancel is self._cancel:
+            self.rx_card.interrupt()
+
+    def start_async(self, per_gate: bool = False) -> AsyncAcquisition:
+        """Start an acquisition job in a worker thread, which is awaited and iterated by asyncio.
+
+        Must be called from a running event loop.
+
+        Parameters
+        ----------
+        per_gate, optional
+            Iterate over the processed gates instead of the processed averages, by default False
+
+        Returns
+        -------
+            Awaitable acquisition, which yields ``ProcessedGates`` or ``ProcessedAverage`` when iterated.
+            Cancelling a task which awaits or iterates the acquisition stops both cards.
+        """
+        # The acquisition is cancelled, even if it is cancelled before the worker thread started it
+        cancel = threading.Event()
+        return AsyncAcquisition(
+            functools.partial(self._run, cancel), functools.partial(self._cancel_run, cancel), per_gate=per_gate
+        )
+
+    async def run_async(self) -> AcquisitionData:
+        """Run an acquisition job without blocking the event loop, see ``run``.
+
+        Returns
+        -------
+            Acquisition data
+        """
+        return await self.start_async()
+
+    def _acquire_averages(self, pipeline: GatePipeline | None, timeout: float) -> None:
+        """Acquire the averages one after another, both cards are started and stopped for each average.
+
+        Parameters
+        ----------
+        pipeline
+            Pipeline which processes the received gates, if None, each average is post-processed after it was received
+        timeout
+            Timeout of each average in s
+        """
+        if self.rx_store is None or self.unrolled_seq is None:
+            return
+        adc_count = self.unrolled_seq.adc_count
+        for k in range(console.parameter.num_averages):
+            if self._cancel.is_set():
+                break
+            self.log.info("Acquisition %s/%s", k + 1, console.parameter.num_averages)
+
+            # Start masurement card operations
+            self.rx_store.start_average(k)
+            self._start_cards(pipeline, timeout)
+
+            # Wait until all gates of the average were read, at least one gate is expected
+            if not self.rx_card.wait_for_gates(max(adc_count, 1), timeout) and not self._cancel.is_set():
+                # Could not receive all the data before timeout
+                self.log.warning(
+                    "Acquisition Timeout: Only received %s/%s adc events", self.rx_store.received[k], adc_count
+                )
+            self._record_first_gate()
+
+            if self.rx_store.received[k] > 0 and pipeline is None and not self._cancel.is_set():
+                self.post_processing(console.parameter, average=k)
+
+            self.tx_card.stop_operation()
+            self.rx_card.stop_operation()
+
+            if console.parameter.averaging_delay > 0:
+                self._cancel.wait(console.parameter.averaging_delay)
+
+    def _acquire_continuous(self, pipeline: GatePipeline | None, timeout: float) -> None:
+        """Acquire all averages back-to-back in one session of both cards.
+
+        The transmit card replays the sequence for all averages within one FIFO session,
+        separated by the averaging delay, and the receive card records one gated stream.
+        The acquisition store starts the next average after the last gate of an average.
+        Without a pipeline, each average is post-processed as soon as all of its gates were received.
+
+        Parameters
+        ----------
+        pipeline
+            Pipeline which processes the received gates, if None, each average is post-processed after it was received
+        timeout
+            Timeout of a single average in s, extended by the duration of the other averages
+        """
+        if self.rx_store is None or self.unrolled_seq is None:
+            return
+        num_averages = console.parameter.num_averages
+        adc_count = self.unrolled_seq.adc_count
+        self.log.info("Continuous acquisition of %s averages", num_averages)
+
+        # Start masurement card operations once for all averages
+        self.rx_store.start_average(0)
+        self._start_cards(
+            pipeline, timeout, repetitions=num_averages, repetition_delay=console.parameter.averaging_delay
+        )
+        timeout += (num_averages - 1) * (self.unrolled_seq.duration + console.parameter.averaging_delay)
+        deadline = time.perf_counter() + timeout
+
+        for k in range(num_averages):
+            # Averages are complete once all their gates were read, subsequent gates are written to the next average
+            if not self.rx_card.wait_for_gates(max((k + 1) * adc_count, 1), deadline - time.perf_counter()):
+                if self._cancel.is_set():
+                    break
+                # Could not receive all the data before timeout
+                self.log.warning(
+                    "Acquisition Timeout: Only received %s/%s adc events",
+                    int(self.rx_store.received.sum()), num_averages * adc_count
+                )
+                if pipeline is None and self.rx_store.received[k] > 0:
+                    self.post_processing(console.parameter, average=k)
+                break
+            if pipeline is None:
+                self.post_processing(console.parameter, average=k)
+        self._record_first_gate()
+
+        self.tx_card.stop_operation()
+        self.rx_card.stop_operation()
+
+    def _start_cards(self, pipeline: GatePipeline | None, timeout: float, **replay) -> None:
+        """Start the receive card and, once it was started, the transmit card.
+
+        Parameters
+        ----------
+        pipeline
+            Pipeline which processes the received gates
+        timeout
+            Timeout for the start of each card in s
+        replay
+            Keyword arguments of the transmit card operation, e.g. the number of repetitions
+        """
+        time_start = time.perf_counter()
+        self.rx_card.start_operation(self.rx_store, pipeline)
+        if self._cancel.is_set():
+            # Cancelled before the receive operation was started, which resets the interrupt
+            self.rx_card.interrupt()
+        # The receive card must be started before the transmit card replays the first gate
+        if not self.rx_card.started.wait(timeout):
+            self.log.warning("Receive card was not started within %s s", timeout)
+        self.timing.rx_start.append(time.perf_counter() - time_start)
+
+        time_start = time.perf_counter()
+        self.tx_card.start_operation(self.unrolled_seq, **replay)
+        if not self.tx_card.armed.wait(timeout):
+            self.log.warning("Transmit card was not armed within %s s", timeout)
+        self.timing.tx_arm.append(time.perf_counter() - time_start)
+
+    def _record_first_gate(self) -> None:
+        """Record the latency between the armed transmit card and the first gate read by the receive card."""
+        if self.tx_card.arm_time is None or self.rx_card.first_gate_time is None:
+            return
+        latency = self.rx_card.first_gate_time - self.tx_card.arm_time
+        self.timing.arm_to_first_gate.append(latency)
+        self.log.debug("Arm to first gate latency: %.3f ms", latency * 1e3)
+
+    def post_processing(self, parameter: AcquisitionParameter, average: int = 0) -> None:
         """Proces acquired NMR data.
 
         Data is sorted according to readout size which might vary between different reout windows.
-        Unprocessed and raw data are stored in class attributes _raw and _unproc.
-        Both attributes are list, which store numpy arrays of readout data with the same number
-        of readout sample points.
+        The receive store already groups the gates by readout size.
+        Unprocessed and raw data are written to the preallocated slot of the average in the average accumulator,
+        or added to the running mean. Both are lists, which store numpy arrays of readout data with the same
+        number of readout sample points.
 
         Post processing contains the following steps (per readout sample size):
         (1) Extraction of reference signal and scaling to float values [mV]
         (2) Concatenate reference data and signal data in coil dimensions
         (3) Demodulation along readout dimensions
-        (4) Decimation along readout dimension
+        (4) Decimation along readout dimension, fused with the demodulation for FIR and AVG
         (5) Phase correction with reference signal
 
         Dimensions: [averages, coils, phase encoding, readout]
@@ -311,63 +827,106 @@ class AcquisitionControl:
         ----------
         parameter
             Acquisition parameter
+        average, optional
+            Index of the average in the receive store, by default 0
         """
-        readout_sizes = [data.shape[-1] for data in self.rx_card.rx_data]
-        grouped_gates: dict[int, list] = {
-            readout_sizes[k]: [] for k in sorted(np.unique(readout_sizes, return_index=True)[1])
-        }
-        for data in self.rx_card.rx_data:
-            grouped_gates[data.shape[-1]].append(data)
+        if self.rx_store is None or self.averages is None:
+            return
+        print("Demodulation at freq.:", parameter.larmor_frequency)
 
-        gate_lengths = [np.stack(group, axis=1) for group in grouped_gates.values()]
-        raw_size = len(self._raw)
+        for k, group in enumerate(self.rx_store.data):
+            # Gates of the average with dimensions [coils, phase encoding, readout]
+            results = self._process_gates(np.moveaxis(group[average], 1, 0), parameter)
 
-        # Define channel dependent scaling
-        scaling = np.expand_dims(self.rx_card.rx_scaling[:self.rx_card.num_channels.value], axis=(-1, -2))
+            # Unprocessed data without post processing (last coil dimension entry contains reference)
+            # and processed data of all gates of the group
+            self.averages.add(average, k, slice(None), results)
 
-        for k, data in enumerate(gate_lengths):
-            # Extract digital reference signal from channel 0
-            _ref = (data[0, ...].astype(np.uint16) >> 15).astype(float)[None, ...]
+    def _process_gates(self, gates: np.ndarray, parameter: AcquisitionParameter) -> tuple[np.ndarray, np.ndarray]:
+        """Scale, demodulate, decimate and phase correct received gates of the same readout size.
 
-            # Remove digital signal from channel 0
-            data[0, ...] = data[0, ...] << 1
-            data = data.astype(np.int16) * scaling
+        The gates are processed in the floating point precision of the acquisition parameter.
+        If the precision is validated, the gates are processed in float64 as well and the deviation is recorded.
 
-            # Stack signal and reference in coil dimension
-            data = np.concatenate((data, _ref), axis=0)
+        Parameters
+        ----------
+        gates
+            Received gates with dimensions [coils, phase encoding, readout], the data is not modified
+        parameter
+            Acquisition parameter
 
-            # Append unprocessed data without post processing (last coil dimension entry contains reference)
-            if raw_size > 0:
-                self._unproc[k] = np.concatenate((self._unproc[k], data[None, ...]), axis=0)
-            else:
-                self._unproc.append(data[None, ...])
-
-            print("Demodulation at freq.:", parameter.larmor_frequency)
-
-            # Demodulation and decimation
-            data = data * np.exp(2j * np.pi * np.arange(data.shape[-1]) * parameter.larmor_frequency / self.f_spcm)
-
-            # Always decimate the reference signal with moving average filter
-            ref_dec = ddc.filter_moving_average(data[-1, ...], decimation=parameter.decimation, overlap=8)[None, ...]
-            # Extract the demodulated signal data
-            data = data[:-1, ...]
-
-            # Switch case for DDC function
-            match console.parameter.ddc_method:
-                case DDCMethod.CIC:
-                    data = ddc.filter_cic_fir_comp(data, decimation=parameter.decimation, number_of_stages=5)
-                case DDCMethod.AVG:
-                    data = ddc.filter_moving_average(data, decimation=parameter.decimation, overlap=8)
-                case _:
-                    # Default case is FIR decimation
-                    data = signal.decimate(data, q=parameter.decimation, ftype="fir")
-
-            # Apply phase correction with mean value
-            # data = data * np.exp(-1j * np.mean(np.angle(ref_dec), axis = -1))[..., None]
-            data = data * np.exp(-1j * np.angle(ref_dec))
-
-            # Append to global raw data list
-            if raw_size > 0:
-                self._raw[k] = np.concatenate((self._raw[k], data[None, ...]), axis=0)
-            else:
-                self._raw.append(data[None, ...])
+        Returns
+        -------
+            Unprocessed data with the reference signal in the last entry of the coil dimension and
+            processed data with dimensions [coils, phase encoding, decimated readout]
+        """
+        unprocessed, data = self._demodulate_gates(gates, parameter, parameter.precision)
+        if (validation := self.precision_validation) is not None:
+            _, reference = self._demodulate_gates(gates, parameter, Precision.DOUBLE)
+            max_abs_error = float(np.max(np.abs(data - reference), initial=0))
+            max_magnitude = float(np.max(np.abs(reference), initial=0))
+            with self._validation_lock:
+                validation.gates += gates.shape[1]
+                validation.max_abs_error = max(validation.max_abs_error, max_abs_error)
+                validation.max_magnitude = max(validation.max_magnitude, max_magnitude)
+        return unprocessed, data
+
+    def _demodulate_gates(
+        self, gates: np.ndarray, parameter: AcquisitionParameter, precision: Precision
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Post-process received gates in the given floating point precision, see ``_process_gates``."""
+        real_type = np.dtype(precision.value).type
+        complex_type = np.result_type(real_type, np.complex64).type
+
+        # Define channel dependent scaling
+        scaling = np.expand_dims(
+            np.asarray(self.rx_card.rx_scaling[:self.rx_card.num_channels.value], dtype=real_type), axis=(-1, -2)
+        )
+
+        # Extract digital reference signal from channel 0
+        _ref = (gates[0, ...].astype(np.uint16) >> 15).astype(real_type)[None, ...]
+
+        # Remove digital signal from channel 0
+        samples = np.concatenate((gates[:1, ...] << 1, gates[1:, ...]), axis=0)
+        data = samples * scaling
+
+        # Stack signal and reference in coil dimension
+        unprocessed = np.concatenate((data, _ref), axis=0)
+
+        # Demodulation and decimation, mixer and modulated filter kernels are cached per readout size
+        frequency = parameter.larmor_frequency
+        decimation = parameter.decimation
+
+        # Always decimate the reference signal with moving average filter
+        ref_dec = ddc.demodulate_decimate(
+            unprocessed[-1, ...], frequency, self.f_spcm, decimation=decimation, method="avg", dtype=complex_type
+        )[None, ...]
+
+        # Switch case for DDC function
+        match parameter.ddc_method:
+            case DDCMethod.CIC:
+                # Integer CIC filter on the int16 samples, scaling is applied to the decimated signal
+                data = ddc.filter_cic_int(
+                    samples, frequency, self.f_spcm, decimation=decimation, number_of_stages=5, dtype=complex_type
+                ) * scaling
+            case DDCMethod.MULTISTAGE:
+                # CIC, half-band and compensation stages, the plan is cached per decimation and readout size
+                data = ddc.decimate_multistage(
+                    unprocessed[:-1, ...], frequency, self.f_spcm, decimation=decimation, dtype=complex_type
+                )
+            case DDCMethod.AVG:
+                data = ddc.demodulate_decimate(
+                    unprocessed[:-1, ...], frequency, self.f_spcm, decimation=decimation, method="avg",
+                    dtype=complex_type,
+                )
+            case _:
+                # Default case is FIR decimation
+                data = ddc.demodulate_decimate(
+                    unprocessed[:-1, ...], frequency, self.f_spcm, decimation=decimation, method="fir",
+                    dtype=complex_type,
+                )
+
+        # Apply phase correction with mean value
+        # data = data * np.exp(-1j * np.mean(np.angle(ref_dec), axis = -1))[..., None]
+        data = data * np.exp(-1j * np.angle(ref_dec)).astype(complex_type, copy=False)
+        return unprocessed, data
@@ -0,0 +1,178 @@
+"""Preallocated store of the gates received by the receive card."""
+import logging
+
+import numpy as np
+
+
+class AcquisitionStore:
+    """Store of the received gates of all averages of an acquisition.
+
+    The store is preallocated from the ADC layout of the sequence.
+    Gates are grouped by their number of samples in the order of their first occurrence,
+    each group is stored in one array with dimensions ``[averages, gates, channels, samples]``.
+    The receive card copies each gate from its DMA buffer once into the slot of the gate.
+
+    Gates are received in the order of the sequence, the position of the next gate is set
+    by ``start_average`` at the beginning of each average.
+    If the averages are received as one continuous stream, the average boundaries are given by the gate count:
+    In continuous mode, a gate which exceeds the number of gates of an average starts the next average.
+    """
+
+    def __init__(self, gate_samples: list[int], num_averages: int, num_channels: int, continuous: bool = False):
+        """Init function of the acquisition store.
+
+        Parameters
+        ----------
+        gate_samples
+            Number of samples (per channel) of each gate in the order of the sequence
+        num_averages
+            Number of averages
+        num_channels
+            Number of receive channels
+        continuous, optional
+            Start the next average after the last gate of an average was received, by default False
+        """
+        self.log = logging.getLogger("AcqStore")
+        self.gate_samples = list(gate_samples)
+        self.num_averages = num_averages
+        self.num_channels = num_channels
+        self.continuous = continuous
+
+        # Gate sizes in the order of their first occurrence
+        self.sizes = list(dict.fromkeys(self.gate_samples))
+        group_index = {size: k for k, size in enumerate(self.sizes)}
+        group_counts = [0] * len(self.sizes)
+        # Group and index within the group of each gate
+        self._slots: list[tuple[int, int]] = []
+        for size in self.gate_samples:
+            self._slots.append((group_index[size], group_counts[group_index[size]]))
+            group_counts[group_index[size]] += 1
+
+        self.data: list[np.ndarray] = [
+            np.zeros((num_averages, count, num_channels, size), dtype=np.int16)
+            for size, count in zip(self.sizes, group_counts, strict=True)
+        ]
+        """Gate data per group of gate size with dimensions [averages, gates, channels, samples]."""
+
+        self.received = np.zeros(num_averages, dtype=int)
+        """Number of received gates per average."""
+
+        self.mismatches = 0
+        """Number of gates, of which the number of samples differs from the ADC layout."""
+
+        self.dropped = 0
+        """Number of gates which exceeded the number of gates of an average."""
+
+        self._average = 0
+
+    @property
+    def num_gates(self) -> int:
+        """Number of gates per average."""
+        return len(self.gate_samples)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the preallocated gate data in bytes."""
+        return sum(data.nbytes for data in self.data)
+
+    @property
+    def average(self) -> int:
+        """Index of the average of the subsequently received gates."""
+        return self._average
+
+    def start_average(self, average: int) -> None:
+        """Set the average of the subsequently received gates and reset its gate count.
+
+        Parameters
+        ----------
+        average
+            Index of the average
+        """
+        self._average = average
+        self.received[average] = 0
+
+    def slot(self, average: int, gate: int) -> np.ndarray:
+        """Return the slot of a gate with dimensions [channels, samples].
+
+        Parameters
+        ----------
+        average
+            Index of the average
+        gate
+            Index of the gate in the order of the sequence
+        """
+        group, index = self._slots[gate]
+        return self.data[group][average, index]
+
+    def group_index(self, gate: int) -> tuple[int, int]:
+        """Return the gate size group of a gate and the index of the gate within the group.
+
+        Parameters
+        ----------
+        gate
+            Index of the gate in the order of the sequence
+        """
+        return self._slots[gate]
+
+    def write(self, samples: np.ndarray, gate_samples: int) -> int | None:
+        """Copy the interleaved samples of the next gate to its slot.
+
+        Parameters
+        ----------
+        samples
+            Interleaved samples of all channels
+        gate_samples
+            Number of received samples per channel
+
+        Returns
+        -------
+            Index of the written gate, None if the gate was dropped
+        """
+        return self.write_sections((samples,), gate_samples)
+
+    def write_sections(self, sections: tuple[np.ndarray, ...], gate_samples: int) -> int | None:
+        """Copy the interleaved samples of the next gate, given by consecutive sections, to its slot.
+
+        If the number of received samples differs from the ADC layout, the samples are truncated
+        or the remaining samples of the slot are set to zero.
+
+        Parameters
+        ----------
+        sections
+            Consecutive sections of interleaved samples of all channels,
+            e.g. a gate which wraps around the end of a ring buffer
+        gate_samples
+            Number of received samples per channel
+
+        Returns
+        -------
+            Index of the written gate, None if the gate was dropped
+        """
+        gate = int(self.received[self._average])
+        if gate >= self.num_gates and self.continuous and self._average + 1 < self.num_averages:
+            self.start_average(self._average + 1)
+            gate = 0
+        if gate >= self.num_gates:
+            self.dropped += 1
+            self.log.warning("Dropped gate %s, average %s has %s gates", gate, self._average, self.num_gates)
+            return None
+        slot = self.slot(self._average, gate)
+        if gate_samples != slot.shape[-1]:
+            self.mismatches += 1
+            # Warn once, subsequent mismatches are only counted
+            log = self.log.warning if self.mismatches == 1 else self.log.debug
+            log("Gate %s has %s samples, expected %s samples", gate, gate_samples, slot.shape[-1])
+            slot[:, gate_samples:] = 0
+
+        # Copy sample by sample position, the interleaved samples are transposed to [channels, samples]
+        position = 0
+        end = min(gate_samples, slot.shape[-1])
+        for section in sections:
+            num_samples = min(section.size // self.num_channels, end - position)
+            if num_samples <= 0:
+                break
+            section_view = section[:num_samples * self.num_channels].reshape(num_samples, self.num_channels)
+            slot[:, position:position + num_samples] = section_view.T
+            position += num_samples
+        self.received[self._average] = gate + 1
+        return gate
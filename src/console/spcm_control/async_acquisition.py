@@ -0,0 +1,115 @@
+"""Asyncio interface of an acquisition, which runs in a worker thread."""
+import asyncio
+import functools
+from collections.abc import Callable, Generator
+from typing import Any
+
+from console.interfaces.acquisition_data import AcquisitionData
+from console.spcm_control.average_accumulator import ProcessedAverage, ProcessedGates
+
+
+class AsyncAcquisition:
+    """Acquisition job, which runs in a worker thread of the event loop and is awaited or iterated by asyncio.
+
+    The blocking acquisition is executed by the default executor of the event loop.
+    The processed gates or averages are passed from the acquisition threads to the event loop
+    and are yielded in the order they were processed. Awaiting the acquisition returns the acquisition data.
+
+    Cancelling a task, which awaits or iterates the acquisition, cancels the acquisition
+    and waits until both cards were stopped, before the cancellation is propagated.
+    If the task which started the acquisition is cancelled elsewhere, the acquisition is cancelled as well.
+
+    Example
+    -------
+    >>> acquisition = acq.start_async()
+    >>> async for average in acquisition:
+    >>>     plot(average.results)
+    >>> data = await acquisition
+    """
+
+    def __init__(
+        self,
+        run: Callable[..., AcquisitionData],
+        cancel: Callable[[], None],
+        per_gate: bool = False,
+    ):
+        """Start the acquisition, must be called from a running event loop.
+
+        Parameters
+        ----------
+        run
+            Blocking acquisition, which accepts a ``gate_listener`` and an ``average_listener``,
+            e.g. ``AcquisitionControl.run``
+        cancel
+            Function which cancels the blocking acquisition from another thread
+        per_gate, optional
+            Yield the processed gates instead of the processed averages, by default False
+        """
+        self._loop = asyncio.get_running_loop()
+        self._cancel = cancel
+        self._items: asyncio.Queue[ProcessedGates | ProcessedAverage | None] = asyncio.Queue()
+        listener = {"gate_listener" if per_gate else "average_listener": self._put}
+        self._future = self._loop.run_in_executor(None, functools.partial(run, **listener))
+        # End of the iteration, scheduled after all items which were put by the acquisition
+        self._future.add_done_callback(lambda _: self._items.put_nowait(None))
+        if (task := asyncio.current_task()) is not None:
+            task.add_done_callback(self._task_done)
+
+    def done(self) -> bool:
+        """Return True if the acquisition has finished, was cancelled or failed."""
+        return self._future.done()
+
+    def cancel(self) -> None:
+        """Cancel the acquisition, awaiting the acquisition raises an ``AcquisitionCancelledError``.
+
+        Has no effect, if the acquisition has already finished.
+        """
+        if not self._future.done():
+            self._cancel()
+
+    def __await__(self) -> Generator[Any, None, AcquisitionData]:
+        """Wait for the acquisition data."""
+        return self._result().__await__()
+
+    def __aiter__(self) -> "AsyncAcquisition":
+        """Iterate over the processed gates or averages."""
+        return self
+
+    async def __anext__(self) -> ProcessedGates | ProcessedAverage:
+        """Wait for the next processed gates or average."""
+        try:
+            item = await self._items.get()
+        except asyncio.CancelledError:
+            await self._stop()
+            raise
+        if item is None:
+            # Subsequent iterations end as well
+            self._items.put_nowait(None)
+            raise StopAsyncIteration
+        return item
+
+    async def _result(self) -> AcquisitionData:
+        """Wait for the acquisition, the acquisition is cancelled if the waiting task is cancelled."""
+        try:
+            return await asyncio.shield(self._future)
+        except asyncio.CancelledError:
+            await self._stop()
+            raise
+
+    async def _stop(self) -> None:
+        """Cancel the acquisition and wait until the acquisition thread has stopped both cards."""
+        if not self._future.done():
+            self._cancel()
+        await asyncio.wait([self._future])
+        if not self._future.cancelled():
+            # The cancellation error of the acquisition is replaced by the cancellation of the task
+            self._future.exception()
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        """Cancel the acquisition, if the task which started the acquisition was cancelled."""
+        if task.cancelled() and not self._future.done():
+            self._cancel()
+
+    def _put(self, item: ProcessedGates | ProcessedAverage) -> None:
+        """Pass processed data from an acquisition thread to the event loop."""
+        self._loop.call_soon_threadsafe(self._items.put_nowait, item)
@@ -0,0 +1,198 @@
+"""Preallocated accumulation of the post-processed averages of an acquisition."""
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import numpy as np
+
+from console.spcm_control.acquisition_store import AcquisitionStore
+
+
+@dataclass
+class ProcessedGates:
+    """Results of processed gates, which were added to the average accumulator."""
+
+    average: int
+    """Index of the average."""
+
+    group: int
+    """Index of the gate size group."""
+
+    gates: slice
+    """Indices of the gates within the group."""
+
+    results: tuple[np.ndarray, ...]
+    """Results of the processing function, the second to last dimension is the gate dimension."""
+
+
+@dataclass
+class ProcessedAverage:
+    """Results of an average, of which all gates were added to the average accumulator."""
+
+    average: int
+    """Index of the average."""
+
+    results: list[list[np.ndarray]]
+    """Copy of the results per group with dimensions [1, ..., gates, samples], the current mean in running mean mode."""
+
+
+class AverageAccumulator:
+    """Results of the post-processing of all averages of an acquisition, or their running mean.
+
+    The processing function is called with the int16 gate data of dimensions ``[channels, gates, samples]``
+    and returns a tuple of arrays, of which the second to last dimension is the gate dimension.
+    For each result and gate size group of the acquisition store, an output array with dimensions
+    ``[averages, ..., gates, samples]`` is allocated once from the result of a zero-filled gate,
+    such that the results of each average are written to their slot instead of being appended.
+
+    In running mean mode, the outputs have a single average and accumulate the sum of all averages.
+    Additionally, the sum of squared magnitudes of the last result is accumulated,
+    from which the variance across the averages is calculated.
+    The number of accumulated averages is counted per gate, such that missing gates do not bias the mean.
+
+    Listeners are called with the added gates and with each average, once all of its gates were added.
+    They are called from the thread which adds the gates, e.g. a worker thread of the gate pipeline.
+    """
+
+    def __init__(
+        self,
+        store: AcquisitionStore,
+        process: Callable[[np.ndarray], tuple[np.ndarray, ...]],
+        running_mean: bool = False,
+        gate_listener: Callable[[ProcessedGates], None] | None = None,
+        average_listener: Callable[[ProcessedAverage], None] | None = None,
+    ):
+        """Init function of the average accumulator.
+
+        Parameters
+        ----------
+        store
+            Acquisition store, which defines the number of averages and the gate size groups
+        process
+            Processing function of the gates of a group
+        running_mean, optional
+            Accumulate the sum and the sum of squares instead of the individual averages, by default False
+        gate_listener, optional
+            Function which is called with the results of each call of ``add``, by default None
+        average_listener, optional
+            Function which is called with the results of each complete average, by default None
+        """
+        self.running_mean = running_mean
+        self.gate_listener = gate_listener
+        self.average_listener = average_listener
+        num_averages = 1 if running_mean else store.num_averages
+
+        self.outputs: list[list[np.ndarray]] = []
+        """Results per group with dimensions [averages, ..., gates, samples], sums in running mean mode."""
+
+        self.sum_squares: list[np.ndarray] = []
+        """Sum of squared magnitudes of the last result per group, only in running mean mode."""
+
+        self.counts: list[np.ndarray] = []
+        """Number of accumulated averages per group and gate."""
+
+        self.added = np.zeros(store.num_averages, dtype=int)
+        """Number of added gates per average."""
+        self._num_gates = store.num_gates
+
+        for size, data in zip(store.sizes, store.data, strict=True):
+            results = process(np.zeros((store.num_channels, 1, size), dtype=np.int16))
+            num_gates = data.shape[1]
+            self.outputs.append([
+                np.zeros((num_averages, *result.shape[:-2], num_gates, result.shape[-1]), dtype=result.dtype)
+                for result in results
+            ])
+            if running_mean:
+                last = results[-1]
+                self.sum_squares.append(
+                    np.zeros((1, *last.shape[:-2], num_gates, last.shape[-1]), dtype=np.finfo(last.dtype).dtype)
+                )
+            self.counts.append(np.zeros(num_gates, dtype=int))
+
+        self._lock = threading.Lock()
+
+    def add(self, average: int, group: int, gates: slice, results: tuple[np.ndarray, ...]) -> None:
+        """Add the results of processed gates.
+
+        Gates of different averages can be added concurrently.
+
+        Parameters
+        ----------
+        average
+            Index of the average
+        group
+            Index of the gate size group
+        gates
+            Indices of the gates within the group
+        results
+            Results of the processing function, the second to last dimension is the gate dimension
+        """
+        num_gates = len(range(self.counts[group].size)[gates])
+        if not self.running_mean:
+            # Slots of different averages do not overlap, only the counts are shared
+            for output, result in zip(self.outputs[group], results, strict=True):
+                output[average, ..., gates, :] = result
+            with self._lock:
+                self.counts[group][gates] += 1
+                self.added[average] += num_gates
+                complete = self.added[average] == self._num_gates
+        else:
+            squares = np.abs(results[-1]) ** 2
+            with self._lock:
+                for output, result in zip(self.outputs[group], results, strict=True):
+                    output[0, ..., gates, :] += result
+                self.sum_squares[group][0, ..., gates, :] += squares
+                self.counts[group][gates] += 1
+                self.added[average] += num_gates
+                complete = self.added[average] == self._num_gates
+
+        if self.gate_listener is not None:
+            self.gate_listener(ProcessedGates(average, group, gates, results))
+        if complete and self.average_listener is not None:
+            self.average_listener(ProcessedAverage(average, self._copy(average)))
+
+    def results(self, averages: np.ndarray | None = None) -> list[list[np.ndarray]]:
+        """Return the results per group, the mean of the averages in running mean mode.
+
+        Parameters
+        ----------
+        averages, optional
+            Indices of the averages which are returned, by default all averages.
+            Ignored in running mean mode.
+
+        Returns
+        -------
+            Results per group with dimensions [averages, ..., gates, samples]
+        """
+        if not self.running_mean:
+            if averages is None:
+                return self.outputs
+            return [[output[averages] for output in outputs] for outputs in self.outputs]
+        return [
+            [self._mean(output, counts) for output in outputs]
+            for outputs, counts in zip(self.outputs, self.counts, strict=True)
+        ]
+
+    def _copy(self, average: int) -> list[list[np.ndarray]]:
+        """Return a copy of the results of an average per group, the current mean in running mean mode."""
+        if self.running_mean:
+            with self._lock:
+                return self.results()
+        return [[output[average:average + 1].copy() for output in outputs] for outputs in self.outputs]
+
+    def variances(self) -> list[np.ndarray]:
+        """Return the variance of the last result across the averages per group, only in running mean mode.
+
+        Returns
+        -------
+            Variance per group with dimensions [1, ..., gates, samples]
+        """
+        return [
+            np.maximum(self._mean(sum_squares, counts) - np.abs(self._mean(outputs[-1], counts)) ** 2, 0)
+            for outputs, sum_squares, counts in zip(self.outputs, self.sum_squares, self.counts, strict=True)
+        ]
+
+    @staticmethod
+    def _mean(total: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """Divide an accumulated sum by the number of averages per gate, gates without averages remain zero."""
+        return total / np.maximum(counts, 1)[:, None].astype(np.finfo(total.dtype).dtype)
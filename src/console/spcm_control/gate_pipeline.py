@@ -0,0 +1,160 @@
+"""Pipelined processing of received gates while the acquisition is running."""
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+from console.spcm_control.acquisition_store import AcquisitionStore
+from console.spcm_control.average_accumulator import AverageAccumulator
+
+
+@dataclass
+class PipelineStatistics:
+    """Statistics of the gate pipeline."""
+
+    gates: int = 0
+    """Number of processed gates."""
+
+    max_queue_size: int = 0
+    """Max. number of gates which were waiting in the queue."""
+
+    busy_time: float = 0.
+    """Processing time of all workers in s."""
+
+    drain_time: float = 0.
+    """Time between the end of the acquisition and the last processed gate in s."""
+
+    def dict(self) -> dict:
+        """Return the statistics as dictionary."""
+        return asdict(self)
+
+
+class GatePipeline:
+    """Process the gates of an acquisition store by a pool of worker threads.
+
+    The receive card puts the index of each gate, which was written to the store, to a bounded queue.
+    Worker threads take the gates from the queue and add the processed results to the preallocated
+    outputs of an average accumulator, such that only the gates in the queue are pending when the acquisition ends.
+
+    The processing function is called with the int16 gate data of dimensions ``[channels, 1, samples]``
+    and returns a tuple of arrays, of which the second to last dimension is the gate dimension.
+    It must not modify the gate data.
+    """
+
+    def __init__(
+        self,
+        store: AcquisitionStore,
+        process: Callable[[np.ndarray], tuple[np.ndarray, ...]],
+        accumulator: AverageAccumulator,
+        workers: int = 2,
+        queue_size: int = 64,
+    ):
+        """Init function of the gate pipeline.
+
+        Parameters
+        ----------
+        store
+            Acquisition store, to which the receive card writes the gates
+        process
+            Processing function of a single gate
+        accumulator
+            Average accumulator, to which the processed gates are added
+        workers, optional
+            Number of worker threads, by default 2
+        queue_size, optional
+            Max. number of gates in the queue, by default 64.
+            If the queue is full, the receive card waits for the workers.
+        """
+        self.log = logging.getLogger("GatePipe")
+        self.store = store
+        self.process = process
+        self.accumulator = accumulator
+        self.num_workers = workers
+        self.queue: queue.Queue[tuple[int, int] | None] = queue.Queue(maxsize=queue_size)
+        self.stats = PipelineStatistics()
+
+        # Gate index within its size group
+        self._group_index: list[tuple[int, int]] = [store.group_index(gate) for gate in range(store.num_gates)]
+
+        self._lock = threading.Lock()
+        self._error: Exception | None = None
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        """Start the worker threads."""
+        self.stats = PipelineStatistics()
+        self._error = None
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.num_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def join(self) -> None:
+        """Process the remaining gates in the queue and stop the worker threads.
+
+        Raises
+        ------
+        RuntimeError
+            Processing of a gate failed
+        """
+        time_start = time.perf_counter()
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.stats.drain_time = time.perf_counter() - time_start
+        self.log.info(
+            "Processed %s gates; max. queue size: %s; busy time: %.3f s; drain time: %.3f s",
+            self.stats.gates, self.stats.max_queue_size, self.stats.busy_time, self.stats.drain_time,
+        )
+        try:
+            if self._error is not None:
+                raise RuntimeError("Processing of received gates failed.") from self._error
+        except RuntimeError as err:
+            self.log.exception(err, exc_info=True)
+            raise err
+
+    def _work(self) -> None:
+        """Process gates from the queue until a stop item is received."""
+        while (item := self.queue.get()) is not None:
+            if self._error is not None:
+                # Skip the remaining gates after an error, the queue is still emptied
+                continue
+            average, gate = item
+            group, index = self._group_index[gate]
+            time_start = time.perf_counter()
+            try:
+                results = self.process(self.store.slot(average, gate)[:, None, :])
+                self.accumulator.add(average, group, slice(index, index + 1), results)
+            except Exception as exc:
+                self._error = exc
+                continue
+            with self._lock:
+                self.stats.gates += 1
+                self.stats.busy_time += time.perf_counter() - time_start
+
+    def put(self, average: int, gate: int, stop: threading.Event) -> None:
+        """Put a gate to the queue, wait while the queue is full.
+
+        Parameters
+        ----------
+        average
+            Index of the average
+        gate
+            Index of the gate in the order of the sequence
+        stop
+            Event which cancels waiting for a free queue entry, e.g. the stop flag of the receive card
+        """
+        while not stop.is_set():
+            try:
+                self.queue.put((average, gate), timeout=0.01)
+            except queue.Full:
+                continue
+            with self._lock:
+                self.stats.max_queue_size = max(self.stats.max_queue_size, self.queue.qsize())
+            return
+        self.log.warning("Gate %s of average %s was not processed, pipeline is stopped", gate, average)
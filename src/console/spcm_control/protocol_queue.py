@@ -0,0 +1,180 @@
+"""Queue of acquisitions, of which the upcoming sequences are unrolled in the background."""
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+
+from pypulseq.Sequence.sequence import Sequence
+
+from console.interfaces.acquisition_data import AcquisitionData
+from console.interfaces.acquisition_parameter import AcquisitionParameter
+from console.interfaces.unrolled_sequence import UnrolledSequence
+from console.pulseq_interpreter.sequence_provider import SequenceProvider
+
+
+@dataclass
+class ProtocolTiming:
+    """Timing of a protocol item."""
+
+    unroll_time: float = 0.
+    """Time to read and unroll the sequence in the background in s."""
+
+    wait_time: float = 0.
+    """Time, which the acquisition waited for the unrolled sequence, in s."""
+
+    scan_time: float = 0.
+    """Duration of the acquisition in s."""
+
+    def dict(self) -> dict:
+        """Return the timing as dictionary."""
+        return asdict(self)
+
+
+@dataclass
+class ProtocolItem:
+    """Sequence and acquisition parameters of an acquisition in the protocol queue."""
+
+    sequence: str | Sequence
+    """Path to a pulseq sequence file or pypulseq sequence."""
+
+    parameter: AcquisitionParameter
+    """Acquisition parameters of the acquisition."""
+
+    name: str = ""
+    """Name of the protocol item."""
+
+    streaming: bool = False
+    """Unroll the sequence incrementally during the replay, see ``AcquisitionControl.set_sequence``."""
+
+    unroll_workers: int = 1
+    """Number of threads to unroll the sequence."""
+
+    timing: ProtocolTiming = field(default_factory=ProtocolTiming)
+    """Unroll, wait and scan time of the item."""
+
+    seq_provider: SequenceProvider | None = None
+    """Sequence provider, which holds the sequence once it was read."""
+
+    unrolled_seq: UnrolledSequence | None = None
+    """Unrolled sequence, once the sequence was unrolled."""
+
+    parameter_hash: int | None = None
+    """Hash of the acquisition parameters, with which the sequence was unrolled."""
+
+    data: AcquisitionData | None = None
+    """Acquisition data, once the acquisition has finished."""
+
+
+class ProtocolQueue:
+    """Queue of protocol items, of which the upcoming items are prepared by a background worker.
+
+    The preparation of an item, i.e. reading and unrolling its sequence, is started when the item is put
+    to the queue and fewer than ``prefetch`` items are prepared ahead, or when an item is taken from the queue.
+    Thus, the next item is unrolled while the current item is acquired.
+    Items are prepared one after another in the order of the queue.
+    """
+
+    def __init__(self, prepare: Callable[[ProtocolItem], None], prefetch: int = 1):
+        """Init function of the protocol queue.
+
+        Parameters
+        ----------
+        prepare
+            Function which reads and unrolls the sequence of an item, called by the background worker
+        prefetch, optional
+            Max. number of upcoming items, which are prepared ahead, by default 1
+        """
+        self.log = logging.getLogger("Protocol")
+        self.prepare = prepare
+        self.prefetch = prefetch
+        self._items: deque[tuple[ProtocolItem, Future | None]] = deque()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="protocol")
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of items in the queue."""
+        return len(self._items)
+
+    @property
+    def items(self) -> list[ProtocolItem]:
+        """Items in the queue."""
+        return [item for item, _ in self._items]
+
+    def put(self, item: ProtocolItem) -> ProtocolItem:
+        """Append an item to the queue.
+
+        Parameters
+        ----------
+        item
+            Protocol item
+
+        Returns
+        -------
+            Protocol item
+        """
+        with self._lock:
+            self._items.append((item, None))
+            self._schedule()
+        return item
+
+    def get(self) -> ProtocolItem:
+        """Take the next item from the queue, wait until it was prepared.
+
+        The preparation of the subsequent items is started.
+
+        Returns
+        -------
+            Prepared protocol item
+
+        Raises
+        ------
+        IndexError
+            The queue is empty
+        Exception
+            The preparation of the item failed, e.g. the sequence file was not found
+        """
+        with self._lock:
+            if not self._items:
+                raise IndexError("Protocol queue is empty.")
+            item, future = self._items.popleft()
+            if future is None:
+                future = self._executor.submit(self._prepare, item)
+            self._schedule()
+        time_start = time.perf_counter()
+        try:
+            future.result()
+        except Exception as err:
+            self.log.exception(err, exc_info=True)
+            raise err
+        item.timing.wait_time = time.perf_counter() - time_start
+        return item
+
+    def clear(self) -> None:
+        """Remove all items from the queue, pending preparations are cancelled."""
+        with self._lock:
+            for _, future in self._items:
+                if future is not None:
+                    future.cancel()
+            self._items.clear()
+
+    def shutdown(self) -> None:
+        """Clear the queue and stop the background worker."""
+        self.clear()
+        self._executor.shutdown(wait=True)
+
+    def _schedule(self) -> None:
+        """Start the preparation of the first ``prefetch`` items, which are not prepared yet."""
+        for k in range(min(self.prefetch, len(self._items))):
+            item, future = self._items[k]
+            if future is None:
+                self._items[k] = (item, self._executor.submit(self._prepare, item))
+
+    def _prepare(self, item: ProtocolItem) -> None:
+        """Prepare an item and measure the unroll time."""
+        time_start = time.perf_counter()
+        self.prepare(item)
+        item.timing.unroll_time = time.perf_counter() - time_start
+        self.log.info("Prepared protocol item %s in %.3f s", item.name, item.timing.unroll_time)
@@ -1,16 +1,19 @@
 """Implementation of receive card."""
 import logging
 import threading
-from ctypes import POINTER, addressof, byref, c_short, cast, sizeof
-from dataclasses import dataclass
-from decimal import Decimal, getcontext
+import time
+from collections import deque
+from ctypes import Array, byref
+from dataclasses import asdict, dataclass
 from itertools import compress
 
 import numpy as np
 
 import console.spcm_control.spcm.pyspcm as sp
 from console.spcm_control.abstract_device import SpectrumDevice
-from console.spcm_control.spcm.tools import create_dma_buffer, translate_status, type_to_name
+from console.spcm_control.acquisition_store import AcquisitionStore
+from console.spcm_control.gate_pipeline import GatePipeline
+from console.spcm_control.spcm.tools import dma_buffer_pool, translate_status, type_to_name
 
 # Define registers lists
 CH_SELECT = [
@@ -45,8 +48,48 @@ IMP_SELECT = [
 ]
 
 
-# Set precision for precise gate samples calculation
-getcontext().prec = 28
+@dataclass
+class GateReaderStatistics:
+    """Counters of the receive thread, which reads the gates."""
+
+    gates: int = 0
+    """Number of received gates."""
+
+    wakeups: int = 0
+    """Number of DMA waits, which returned with a transferred notify size block."""
+
+    timeouts: int = 0
+    """Number of DMA waits, which returned with timeout."""
+
+    max_batch_size: int = 0
+    """Max. number of gates, which were read after one wakeup."""
+
+    cpu_time: float = 0.0
+    """CPU time of the receive thread in s, including the DMA waits."""
+
+    latency_sum: float = 0.0
+    """Sum of the gate latencies in s, see ``mean_latency``."""
+
+    latency_max: float = 0.0
+    """Max. latency between the end of a gate and the time it was read in s."""
+
+    @property
+    def cpu_time_per_gate(self) -> float:
+        """CPU time of the receive thread per gate in s."""
+        return self.cpu_time / self.gates if self.gates > 0 else 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        """Mean latency between the end of a gate, given by its timestamp, and the time it was read in s."""
+        return self.latency_sum / self.gates if self.gates > 0 else 0.0
+
+    def dict(self) -> dict:
+        """Return the counters as dictionary, including the derived values."""
+        return {
+            **asdict(self),
+            "cpu_time_per_gate": self.cpu_time_per_gate,
+            "mean_latency": self.mean_latency,
+        }
 
 
 @dataclass
@@ -70,14 +113,28 @@ class RxCard(SpectrumDevice):
 
         self.worker: threading.Thread | None = None
         self.is_running = threading.Event()
+        # Set by the worker once the card was started
+        self.started = threading.Event()
+        # Notified by the worker whenever gates were read and when the operation ends
+        self._gates_read = threading.Condition()
+        self._reading = False
+        self._interrupted = False
+        self.start_time: float | None = None
+        """Time (``time.perf_counter``) at which the card was started."""
+        self.first_gate_time: float | None = None
+        """Time (``time.perf_counter``) at which the first gate of the operation was read."""
+        # DMA buffers of the worker, which are returned to the pool when the card is stopped
+        self._dma_buffers: list[Array] = []
 
         # Define pre and post trigger time.
         # Pre trigger is set to minimum and post trigger size is at least one notify size to avoid data loss.
         self.pre_trigger = 8
         self.post_trigger = 4096
-        self.post_trigger_size = 0  # TODO: only use one variable for post trigger
 
         self.rx_data = []
+        self.store: AcquisitionStore | None = None
+        self.pipeline: GatePipeline | None = None
+        self.reader_stats = GateReaderStatistics()
         self.rx_scaling = [amp / (2**15) for amp in self.max_amplitude]
 
     def dict(self) -> dict:
@@ -87,7 +144,7 @@ class RxCard(SpectrumDevice):
         -------
             Dictionary containing class variables.
         """
-        return super().dict()
+        return {**super().dict(), "reader_stats": self.reader_stats.dict()}
 
     def setup_card(self):
         """Set up spectrum card in transmit (TX) mode.
@@ -190,9 +247,8 @@ class RxCard(SpectrumDevice):
         sp.spcm_dwSetParam_i32(self.card, sp.SPCM_X2_MODE, sp.SPCM_XMODE_DIGIN)
         sp.spcm_dwSetParam_i32(self.card, sp.SPC_DIGMODE0, (sp.DIGMODEMASK_BIT15 & sp.SPCM_DIGMODE_X2))
 
-        # TODO: Double check, why is the post trigger divided by number of channels and multiplied by 2?
+        # Post trigger samples of each gate fill 8 kB (two notify size blocks), the DMA wait returns after each gate
         self.post_trigger = 4096 // self.num_channels.value
-        self.post_trigger_size = self.post_trigger * 2
         # Set the memory size, pre and post trigger and loop paramaters, SPC_LOOPS = 0 => runs infinitely long
         sp.spcm_dwSetParam_i32(self.card, sp.SPC_POSTTRIGGER, self.post_trigger)
         sp.spcm_dwSetParam_i32(self.card, sp.SPC_PRETRIGGER, self.pre_trigger)
@@ -216,15 +272,64 @@ class RxCard(SpectrumDevice):
         self.log.debug("Device setup completed")
         self.log_card_status()
 
-    def start_operation(self):
-        """Start card operation."""
+    def start_operation(self, store: AcquisitionStore | None = None, pipeline: GatePipeline | None = None):
+        """Start card operation.
+
+        Parameters
+        ----------
+        store, optional
+            Preallocated store, to which the received gates are copied, by default None.
+            If None, each gate is copied to a separate array, which is appended to ``rx_data``.
+        pipeline, optional
+            Pipeline, to which each gate is passed after it was written to the store, by default None.
+            The pipeline must process the gates of the given store.
+        """
         # Clear the emergency stop flag
         self.is_running.clear()
+        self.store = store
+        self.pipeline = pipeline if store is not None else None
         self.rx_data = []
+        self.reader_stats = GateReaderStatistics()
+        self.started.clear()
+        self.start_time = None
+        self.first_gate_time = None
+        with self._gates_read:
+            self._reading = True
+            self._interrupted = False
         # Start card thread. if time stamp mode is not available use the example function.
         self.worker = threading.Thread(target=self._gated_timestamps_stream)
         self.worker.start()
 
+    def wait_for_gates(self, num_gates: int, timeout: float | None = None) -> bool:
+        """Block until a number of gates was read by the current operation.
+
+        Parameters
+        ----------
+        num_gates
+            Number of gates since the start of the operation
+        timeout, optional
+            Timeout in s, by default None (no timeout)
+
+        Returns
+        -------
+            True if the gates were read, False if the timeout was reached, the operation ended
+            or the wait was interrupted before
+        """
+        with self._gates_read:
+            self._gates_read.wait_for(
+                lambda: self.reader_stats.gates >= num_gates or not self._reading or self._interrupted, timeout
+            )
+            return self.reader_stats.gates >= num_gates
+
+    def interrupt(self) -> None:
+        """Wake up all threads, which wait for gates of the current operation, e.g. to cancel an acquisition.
+
+        Subsequent waits return immediately until the next operation is started.
+        """
+        with self._gates_read:
+            self._interrupted = True
+            self._gates_read.notify_all()
+
     def stop_operation(self):
         """Stop card thread."""
         # Check if thread is running
@@ -242,10 +347,17 @@ class RxCard(SpectrumDevice):
             )
             self.handle_error(error)
             self.worker = None
+            self._release_dma_buffers()
         else:
             # No thread is running
             self.log.error("No active process found")
 
+    def _release_dma_buffers(self) -> None:
+        """Return the DMA buffers of the stopped operation to the pool."""
+        for buffer in self._dma_buffers:
+            dma_buffer_pool.release(buffer)
+        self._dma_buffers = []
+
     def _gated_timestamps_stream(self):
         # >> Define RX data buffer
         # RX buffer size must be a multiple of notify size. Min. notify size is 4096 bytes/4 kBytes.
@@ -255,7 +367,9 @@ class RxCard(SpectrumDevice):
         rx_size = 1024**3
         rx_buffer_size = sp.uint64(rx_size)
 
-        rx_buffer = create_dma_buffer(rx_buffer_size.value)
+        # The buffers are reused across operations, the card overwrites the data of a previous operation
+        rx_buffer = dma_buffer_pool.acquire(rx_buffer_size.value)
+        self._dma_buffers.append(rx_buffer)
         sp.spcm_dwDefTransfer_i64(
             self.card,
             sp.SPCM_BUF_DATA,
@@ -272,7 +386,8 @@ class RxCard(SpectrumDevice):
         # Define timestamp buffer, must be multiple of timestamps notify size
         ts_buffer_size = sp.uint64(2 * 4096)
 
-        ts_buffer = create_dma_buffer(ts_buffer_size.value)
+        ts_buffer = dma_buffer_pool.acquire(ts_buffer_size.value)
+        self._dma_buffers.append(ts_buffer)
         sp.spcm_dwDefTransfer_i64(
             self.card,
             sp.SPCM_BUF_TIMESTAMP,
@@ -283,14 +398,16 @@ class RxCard(SpectrumDevice):
             ts_buffer_size,
         )
 
-        pll_data = cast(ts_buffer, sp.ptr64)  # cast to pointer to 64bit integer
-        rx_data = cast(rx_buffer, sp.ptr16)  # cast to pointer to 16bit integer
+        # Views of the ring buffers: 16 bit samples and timestamp entries of 16 bytes (timestamp, extra data)
+        rx_data = np.frombuffer(rx_buffer, dtype=np.int16)
+        timestamps = np.frombuffer(ts_buffer, dtype=np.int64).reshape(-1, 2)
 
-        # Setup polling mode
+        # Setup polling mode for the timestamps.
+        # A DMA wait for timestamps would only return after a full timestamp notify size (128 gates).
+        # Instead the thread is woken up by the data DMA, since each gate is followed by the post trigger samples,
+        # which fill at least one notify size block.
         sp.spcm_dwSetParam_i32(self.card, sp.SPC_M2CMD, sp.M2CMD_EXTRA_POLL)
 
-        # TODO: Move all the stuff up to here to setup function?
-
         # >> Start everything
         err = sp.spcm_dwSetParam_i32(
             self.card,
@@ -298,147 +415,129 @@ class RxCard(SpectrumDevice):
             sp.M2CMD_CARD_START | sp.M2CMD_CARD_ENABLETRIGGER | sp.M2CMD_DATA_STARTDMA,
         )
         self.handle_error(err)
-
-        available_timestamp_bytes = sp.int32(0)
-        available_timestamp_postion = sp.int32(0)
-        available_user_databytes = sp.int32(0)
-        data_user_position = sp.int32(0)
-        total_gates = 0
-        bytes_leftover = 0
-        total_leftover = 0
+        # Timestamps are reset on card start
+        time_start = time.perf_counter()
+        cpu_time_start = time.thread_time()
+        self.start_time = time_start
+        self.started.set()
+
+        available_timestamp_bytes = sp.int64(0)
+        timestamp_position = sp.int64(0)
+        available_user_bytes = sp.int64(0)
+        num_channels = self.num_channels.value
+        stats = self.reader_stats
+
+        # Gates given by start and end timestamp, of which the data was not read yet
+        pending_gates: deque[tuple[int, int]] = deque()
+        # Stream position of the next gate and bytes which were released to the card (multiple of notify size)
+        read_bytes = 0
+        released_bytes = 0
 
         # Start receiver
         self.log.debug("Starting receive")
 
         while not self.is_running.is_set():
-            sp.spcm_dwSetParam_i32(self.card, sp.SPC_M2CMD, sp.M2CMD_DATA_WAITDMA)
+            # Block until the next notify size block was transferred or the timeout (SPC_TIMEOUT) is reached
+            err = sp.spcm_dwSetParam_i32(self.card, sp.SPC_M2CMD, sp.M2CMD_DATA_WAITDMA)
+            if err == sp.ERR_TIMEOUT:
+                stats.timeouts += 1
+            elif err:
+                self.handle_error(err)
+                break
+            else:
+                stats.wakeups += 1
+
+            # Read all complete gates (two timestamps) from the timestamp buffer
             sp.spcm_dwGetParam_i64(self.card, sp.SPC_TS_AVAIL_USER_LEN, byref(available_timestamp_bytes))
-            if available_timestamp_bytes.value >= 32:
-                # read position
-                sp.spcm_dwGetParam_i64(
-                    self.card,
-                    sp.SPC_TS_AVAIL_USER_POS,
-                    byref(available_timestamp_postion),
-                )
-
-                # Read two timestamps
-                timestamp_0 = pll_data[int(available_timestamp_postion.value / 8)] / (self.sample_rate * 1e6)
-                timestamp_1 = pll_data[int(available_timestamp_postion.value / 8) + 2] / (self.sample_rate * 1e6)
-
-                # Calculate gate duration
-                gate_length = Decimal(str(timestamp_1)) - Decimal(str(timestamp_0))
-
-                # Calculate the number of adc gate sample points (per channel)
-                gate_sample = int(round(gate_length * (Decimal(str(self.sample_rate)) * Decimal("1e6"))))
-
-                self.log.info(
-                    "Gate: (%s s, %s s); ADC duration: %s ms ; Samples/gate/channel: % s",
-                    timestamp_0,
-                    timestamp_1,
-                    float(gate_length) * 1e3,  # Can be trimmed.
-                    gate_sample,
-                )
-
-                sp.spcm_dwSetParam_i32(self.card, sp.SPC_TS_AVAIL_CARD_LEN, 32)
-                sp.spcm_dwGetParam_i64(
-                    self.card,
-                    sp.SPC_TS_AVAIL_USER_LEN,
-                    byref(available_timestamp_bytes),
-                )
+            if (num_gates := available_timestamp_bytes.value // 32) > 0:
+                sp.spcm_dwGetParam_i64(self.card, sp.SPC_TS_AVAIL_USER_POS, byref(timestamp_position))
+                index = (timestamp_position.value // 16 + np.arange(2 * num_gates)) % timestamps.shape[0]
+                pending_gates.extend(map(tuple, timestamps[index, 0].reshape(-1, 2).tolist()))
+                sp.spcm_dwSetParam_i32(self.card, sp.SPC_TS_AVAIL_CARD_LEN, 32 * num_gates)
+
+            if not pending_gates:
+                continue
+
+            # Process all gates, of which the data was transferred
+            sp.spcm_dwGetParam_i64(self.card, sp.SPC_DATA_AVAIL_USER_LEN, byref(available_user_bytes))
+            transferred_bytes = released_bytes + available_user_bytes.value
+            batch_size = 0
+            while pending_gates:
+                gate_start, gate_end = pending_gates[0]
+                gate_samples = gate_end - gate_start
+                # Pre trigger and gate samples are required, post trigger samples are skipped
+                if read_bytes + (self.pre_trigger + gate_samples) * 2 * num_channels > transferred_bytes:
+                    break
+                pending_gates.popleft()
+                sections = self._gate_sections(rx_data, read_bytes, gate_samples)
+                if self.store is not None:
+                    gate = self.store.write_sections(sections, gate_samples)
+                    if self.pipeline is not None and gate is not None:
+                        self.pipeline.put(self.store.average, gate, stop=self.is_running)
+                else:
+                    gate_data = np.concatenate(sections).reshape((num_channels, gate_samples), order="F")
+                    self.rx_data.append(gate_data)
+                read_bytes += (self.pre_trigger + gate_samples + self.post_trigger) * 2 * num_channels
+                batch_size += 1
+
+                latency = time.perf_counter() - time_start - gate_end / (self.sample_rate * 1e6)
+                stats.latency_sum += latency
+                stats.latency_max = max(stats.latency_max, latency)
+                self.log.debug("Gate %s: %s samples/channel", stats.gates + batch_size, gate_samples)
+
+            # Tell the card that we have read the data, released in multiples of the notify size
+            release_bytes = min(read_bytes, transferred_bytes)
+            release_bytes -= release_bytes % rx_notify.value + released_bytes
+            if release_bytes > 0:
+                sp.spcm_dwSetParam_i64(self.card, sp.SPC_DATA_AVAIL_CARD_LEN, release_bytes)
+                released_bytes += release_bytes
+
+            if batch_size > 0:
+                with self._gates_read:
+                    if self.first_gate_time is None:
+                        self.first_gate_time = time.perf_counter()
+                    stats.gates += batch_size
+                    self._gates_read.notify_all()
+            stats.max_batch_size = max(stats.max_batch_size, batch_size)
+            stats.cpu_time = time.thread_time() - cpu_time_start
+
+        stats.cpu_time = time.thread_time() - cpu_time_start
+        with self._gates_read:
+            self._reading = False
+            self._gates_read.notify_all()
+        self.log.debug("Card operation stopped")
+        self.log.info(
+            "Received %s gates; %s wakeups, %s timeouts; CPU time per gate: %.3f ms; mean latency: %.3f ms",
+            stats.gates,
+            stats.wakeups,
+            stats.timeouts,
+            stats.cpu_time_per_gate * 1e3,
+            stats.mean_latency * 1e3,
+        )
 
-                # Check for rounding errors
-                total_bytes = (gate_sample + self.pre_trigger) * 2 * self.num_channels.value
-                bytes_sequence = (gate_sample + self.pre_trigger + self.post_trigger) * 2 * self.num_channels.value
+    def _gate_sections(self, rx_data: np.ndarray, position: int, gate_samples: int) -> tuple[np.ndarray, ...]:
+        """Get the interleaved samples of a gate from the ring buffer without copy.
 
-                # Read/update available user bytes
-                sp.spcm_dwGetParam_i32(
-                    self.card,
-                    sp.SPC_DATA_AVAIL_USER_LEN,
-                    byref(available_user_databytes),
-                )
-                sp.spcm_dwGetParam_i32(self.card, sp.SPC_DATA_AVAIL_USER_POS, byref(data_user_position))
-
-                # Debug log statements
-                # self.log.debug("Available timestamp buffer size: %s", available_timestamp_bytes.value)
-                self.log.debug("Expected adc data in bytes: %s", total_bytes)
-                self.log.debug("User position (adc buffer): %s", data_user_position.value)
-                self.log.debug("Number of segments in notify size: %s", total_bytes // rx_notify.value)
-                self.log.debug("Left over in bytes: %s", bytes_leftover)
-
-                while not self.is_running.is_set():
-                    # Read/update available user bytes
-                    sp.spcm_dwGetParam_i32(
-                        self.card,
-                        sp.SPC_DATA_AVAIL_USER_LEN,
-                        byref(available_user_databytes),
-                    )
-                    self.log.debug("Available user length in bytes (adc buffer): %s", available_user_databytes.value)
-
-                    if available_user_databytes.value >= total_bytes:
-                        total_gates += 1
-
-                        sp.spcm_dwGetParam_i32(
-                            self.card,
-                            sp.SPC_DATA_AVAIL_USER_POS,
-                            byref(data_user_position),
-                        )
-
-                        byte_position = data_user_position.value // 2
-                        total_bytes_to_read = available_user_databytes.value
-                        index_0 = byte_position + total_leftover // 2
-
-                        if total_bytes_to_read + data_user_position.value >= rx_size:
-                            # >> We need two indices in case of memory position overflows the total memory length
-                            # Get the last position available and subtract it from current byte position
-                            index_1 = rx_size // 2 - index_0
-
-                            # Get the remaining length after overflow. Then subtract it from the total bytes.
-                            index_2 = total_bytes // 2 - index_1
-
-                            # Numpy array conversation. Get the first part of the slice
-                            offset_bytes_1 = index_1 * sizeof(c_short)
-                            ptr_to_slice_1 = cast(addressof(rx_data.contents) + offset_bytes_1, POINTER(c_short))
-                            slice_1 = np.ctypeslib.as_array(ptr_to_slice_1, ((index_1),))
-
-                            # Get the second part of the numpy slice
-                            offset_bytes_2 = index_2 * sizeof(c_short)
-                            ptr_to_slice_2 = cast(addressof(rx_data.contents) + offset_bytes_2, POINTER(c_short))
-                            slice_2 = np.ctypeslib.as_array(ptr_to_slice_2, ((index_2),))
-
-                            # Combine the slices
-                            gate_data = np.concatenate((slice_1, slice_2))
-
-                        else:
-                            # If there is no memory position overflow, just get the data.
-                            offset_bytes = index_0 * sizeof(c_short)
-                            ptr_to_slice = cast(addressof(rx_data.contents) + offset_bytes, POINTER(c_short))
-                            gate_data = np.ctypeslib.as_array(ptr_to_slice, ((total_bytes // 2),))
-
-                        # Cut the pretrigger, we do not need it.
-                        pre_trigger_cut = (self.pre_trigger) * self.num_channels.value
-                        gate_data = gate_data[pre_trigger_cut:]
-                        self.rx_data.append(gate_data.reshape((self.num_channels.value, gate_sample), order="F"))
-
-                        # Most probably we have not filled the whole page.
-                        # There should be some bytes in the buffer, which are not readable yet.
-                        bytes_leftover = (total_bytes + self.post_trigger_size * self.num_channels.value) \
-                            % rx_notify.value
-
-                        # Calculate the accumulation of the leftover bytes.
-                        # If it is bigger than the notify value read the page.
-                        total_leftover += bytes_leftover
-                        if total_leftover >= rx_notify.value:
-                            total_leftover = total_leftover - rx_notify.value
-                            available_card_len = bytes_sequence - (bytes_leftover) + rx_notify.value
-                        else:
-                            available_card_len = bytes_sequence - (bytes_leftover)
-
-                        # Tell the card that we have read the data.
-                        # It is better for tracking if the card length is in the order of notify (page) size.
-                        sp.spcm_dwSetParam_i32(self.card, sp.SPC_DATA_AVAIL_CARD_LEN, available_card_len)
-                        break
+        Parameters
+        ----------
+        rx_data
+            Ring buffer of interleaved receive samples
+        position
+            Stream position of the gate data (including pre trigger) in bytes
+        gate_samples
+            Number of samples per channel within the gate
 
-        self.log.debug("Card operation stopped")
+        Returns
+        -------
+            Views of the ring buffer, two sections if the gate wraps around the end of the ring buffer
+        """
+        num_channels = self.num_channels.value
+        # Cut the pre trigger, we do not need it
+        start = (position // 2 + self.pre_trigger * num_channels) % rx_data.size
+        end = start + gate_samples * num_channels
+        if end <= rx_data.size:
+            return (rx_data[start:end],)
+        return (rx_data[start:], rx_data[:end - rx_data.size])
 
     def get_status(self) -> int:
         """Get the current card status.
@@ -46,8 +46,14 @@ uptr32 = ctypes.POINTER(uint32)
 uptr64 = ctypes.POINTER(uint64)
 
 
+# Use the software simulation of the driver, e.g. to test the streaming without measurement cards
+if os.getenv("NEXUS_SPCM_SIMULATION"):
+    from console.spcm_control.spcm import simulation
+
+    simulation.install(sys.modules[__name__])
+
 # Check if code is running in an github actions
-if not os.getenv("GITHUB_ACTIONS"):
+elif not os.getenv("GITHUB_ACTIONS"):
     # Windows
     if os.name == "nt":
         sys.stdout.write("Python Version: {0} on Windows\n\n".format(platform.python_version()))
@@ -0,0 +1,701 @@
+"""Software simulation of the spectrum-instrumentation card driver.
+
+The simulation implements the driver functions of ``pyspcm`` which are used by ``TxCard`` and ``RxCard``,
+such that the streaming paths can be run and profiled without measurement cards.
+It is selected by setting the environment variable ``NEXUS_SPCM_SIMULATION`` before ``pyspcm`` is imported
+or by calling ``install()``, which replaces the driver functions of an already imported ``pyspcm`` module.
+
+Model
+-----
+- Transmit card (M2p.65xx) in FIFO replay mode: The DMA moves data from the host ring buffer
+  to the onboard memory of the card, as long as there is free onboard memory.
+  The card consumes the onboard memory at the consumption rate, by default the sample rate.
+  If the onboard memory runs empty, an underrun is counted.
+- Receive card (M2p.59xx) in FIFO gate mode: The output of the transmit card is looped back.
+  The ADC gate (bit 15 of channel 1) defines the gates, the reference signal (bit 15 of channel 2) is
+  the digital input X2 which replaces bit 15 of receive channel 0, if the digital mode is enabled.
+  Each enabled receive channel records the RF channel 0 of the transmit card.
+  Per gate, pre trigger, gate and post trigger samples are written to the host ring buffer
+  and a start and an end timestamp (in samples) are written to the timestamp buffer.
+- Available bytes are reported in notify size granularity, timestamps are available immediately (poll mode).
+- ``M2CMD_DATA_WAITDMA`` and ``M2CMD_EXTRA_WAITDMA`` block until a notify size block is available (transmit)
+  or the next notify size block was transferred (receive), or the timeout (``SPC_TIMEOUT`` in ms, 0: infinite)
+  is reached.
+- Timestamps count the samples since the start of the receive card,
+  the transmit card is assumed to replay at the sample rate of the receive card.
+
+The simulation time is derived from the wall clock. Card states are updated on every driver call,
+the data of the elapsed time is processed by the calling thread.
+
+Example
+-------
+>>> tx_sim, rx_sim = configure(consumption_rate=None)
+>>> tx_card.connect()  # TxCard with path "/dev/spcm1"
+>>> rx_card.connect()  # RxCard with path "/dev/spcm0"
+>>> tx_sim.stats()
+"""
+import ctypes
+import math
+import os
+import threading
+import time
+from types import ModuleType
+from typing import Any
+
+import numpy as np
+
+import console.spcm_control.spcm.errors as errs
+import console.spcm_control.spcm.registers as regs
+
+# Environment variable which selects the simulated driver in pyspcm
+ENV_SIMULATION = "NEXUS_SPCM_SIMULATION"
+
+# Buffer types and directions of spcm_dwDefTransfer_i64, as defined in pyspcm
+_BUF_DATA = 1000
+_BUF_TIMESTAMP = 3000
+_DIR_PCTOCARD = 0
+_DIR_CARDTOPC = 1
+
+# Card types: M2p.6546-x4 (transmit) and M2p.5933-x4 (receive)
+TX_CARD_TYPE = regs.TYP_M2PEXPSERIES | 0x6546
+RX_CARD_TYPE = regs.TYP_M2PEXPSERIES | 0x5933
+
+# Max. number of samples which are replayed at once
+_CHUNK_SAMPLES = 2**20
+# Poll interval of the DMA wait commands in s
+_POLL_INTERVAL = 2e-4
+# Size of a timestamp entry in bytes: timestamp and extra data (int64 each)
+_TIMESTAMP_BYTES = 16
+
+_DIGITAL_BIT = np.uint16(1 << 15)
+
+# Lock of all simulated cards, the simulation state is updated by the calling thread
+_lock = threading.RLock()
+
+
+def _address(buffer: Any) -> int:
+    """Return the address of a ctypes buffer, pointer or integer address."""
+    if isinstance(buffer, int):
+        return buffer
+    if isinstance(buffer, ctypes.c_void_p):
+        return buffer.value or 0
+    return ctypes.addressof(buffer)
+
+
+def _value(value: Any) -> int:
+    """Return the integer value of a ctypes integer or integer."""
+    return int(getattr(value, "value", value))
+
+
+def _store(reference: Any, value: int) -> None:
+    """Write a value to the ctypes integer referenced by byref() or pointer()."""
+    target = getattr(reference, "_obj", None)
+    if target is None:
+        target = reference.contents
+    target.value = value
+
+
+class _Transfer:
+    """Host ring buffer of a DMA transfer.
+
+    The user position is given by the bytes the user released to the card (``SPC_DATA_AVAIL_CARD_LEN``),
+    the card position by the bytes transferred by DMA.
+    """
+
+    def __init__(self, direction: int, notify: int, address: int, length: int, poll: bool = False):
+        self.direction = direction
+        self.notify = notify
+        self.address = address
+        self.length = length
+        # Report available bytes immediately instead of notify size blocks
+        self.poll = poll
+        self.user_bytes = 0
+        self.card_bytes = 0
+
+    def available(self) -> int:
+        """Return the bytes which are available to the user."""
+        card_bytes = self.card_bytes if self.poll else self.card_bytes - self.card_bytes % self.notify
+        if self.direction == _DIR_PCTOCARD:
+            # Free bytes of the ring buffer which can be written by the user
+            return max(0, self.length - (self.user_bytes - card_bytes))
+        # Bytes which were written by the card and can be read by the user
+        return max(0, card_bytes - self.user_bytes)
+
+    def user_position(self) -> int:
+        """Return the position of the user within the ring buffer."""
+        return self.user_bytes % self.length
+
+    def write(self, data: np.ndarray) -> bool:
+        """Write bytes from the card to the host ring buffer, returns False if the buffer overruns."""
+        size = data.nbytes
+        if size > self.length - (self.card_bytes - self.user_bytes):
+            return False
+        position = self.card_bytes % self.length
+        first = min(size, self.length - position)
+        ctypes.memmove(self.address + position, data.ctypes.data, first)
+        if first < size:
+            ctypes.memmove(self.address, data.ctypes.data + first, size - first)
+        self.card_bytes += size
+        return True
+
+
+class SimulatedCard:
+    """Simulated spectrum card with register storage and DMA transfers."""
+
+    def __init__(self, path: str, card_type: int):
+        """Initialize simulated card.
+
+        Parameters
+        ----------
+        path
+            Device path of the card, e.g. /dev/spcm0
+        card_type
+            Card type which is returned for ``SPC_PCITYP``
+        """
+        self.path = path
+        self.card_type = card_type
+        self.registers: dict[int, int] = {}
+        self.transfers: dict[int, _Transfer] = {}
+        self.running = False
+        self.dma_running = False
+        self.error = errs.ERR_OK
+        self.error_text = ""
+
+    def reset(self) -> None:
+        """Reset registers and transfers."""
+        self.registers = {regs.SPC_SAMPLERATE: regs.MEGA(20)}
+        self.transfers = {}
+        self.running = False
+        self.dma_running = False
+
+    def set_param(self, register: int, value: int) -> int:
+        """Set a register value or execute a command."""
+        if register == regs.SPC_M2CMD:
+            return self.command(value)
+        if register == regs.SPC_DATA_AVAIL_CARD_LEN:
+            return self._release(_BUF_DATA, value)
+        if register == regs.SPC_TS_AVAIL_CARD_LEN:
+            return self._release(_BUF_TIMESTAMP, value)
+        self.registers[register] = value
+        return errs.ERR_OK
+
+    def get_param(self, register: int) -> int:
+        """Get a register value."""
+        match register:
+            case regs.SPC_PCITYP:
+                return self.card_type
+            case regs.SPC_M2STATUS:
+                return self.status()
+            case regs.SPC_CHCOUNT:
+                return bin(self.registers.get(regs.SPC_CHENABLE, 0)).count("1")
+            case regs.SPC_DATA_AVAIL_USER_LEN:
+                return self.transfers[_BUF_DATA].available() if _BUF_DATA in self.transfers else 0
+            case regs.SPC_DATA_AVAIL_USER_POS:
+                return self.transfers[_BUF_DATA].user_position() if _BUF_DATA in self.transfers else 0
+            case regs.SPC_TS_AVAIL_USER_LEN:
+                return self.transfers[_BUF_TIMESTAMP].available() if _BUF_TIMESTAMP in self.transfers else 0
+            case regs.SPC_TS_AVAIL_USER_POS:
+                return self.transfers[_BUF_TIMESTAMP].user_position() if _BUF_TIMESTAMP in self.transfers else 0
+        return self.registers.get(register, 0)
+
+    def define_transfer(self, buffer_type: int, direction: int, notify: int, address: int, length: int) -> int:
+        """Define a DMA transfer."""
+        self.transfers[buffer_type] = _Transfer(
+            direction, notify, address, length, poll=buffer_type == _BUF_TIMESTAMP
+        )
+        return errs.ERR_OK
+
+    def command(self, command: int) -> int:
+        """Execute a card command, commands are executed in the order of the bits."""
+        if command & regs.M2CMD_CARD_RESET:
+            self.reset()
+        if command & regs.M2CMD_DATA_STARTDMA:
+            if _BUF_DATA not in self.transfers:
+                return self._set_error(errs.ERR_SEQUENCE, "No data transfer defined")
+            self.dma_running = True
+            _advance()
+        if command & regs.M2CMD_CARD_START:
+            self.start()
+        if command & (regs.M2CMD_CARD_STOP | regs.M2CMD_DATA_STOPDMA):
+            _advance()
+        if command & regs.M2CMD_CARD_STOP:
+            self.running = False
+        if command & regs.M2CMD_DATA_STOPDMA:
+            self.dma_running = False
+        if command & regs.M2CMD_DATA_WAITDMA:
+            return self._wait(_BUF_DATA)
+        if command & regs.M2CMD_EXTRA_WAITDMA:
+            return self._wait(_BUF_TIMESTAMP)
+        return errs.ERR_OK
+
+    def start(self) -> None:
+        """Start the card."""
+        self.running = True
+
+    def status(self) -> int:
+        """Return the card status."""
+        status = regs.M2STAT_CARD_TRIGGER if self.running else regs.M2STAT_CARD_READY
+        if (transfer := self.transfers.get(_BUF_DATA)) is not None and transfer.available() >= transfer.notify:
+            status |= regs.M2STAT_DATA_BLOCKREADY
+        return status
+
+    def advance(self, now: float) -> None:
+        """Update the card state to the given time."""
+
+    def stats(self) -> dict:
+        """Return statistics of the simulated card."""
+        return {}
+
+    def _release(self, buffer_type: int, size: int) -> int:
+        if (transfer := self.transfers.get(buffer_type)) is None:
+            return self._set_error(errs.ERR_SEQUENCE, "No transfer defined for buffer %s" % buffer_type)
+        transfer.user_bytes += size
+        return errs.ERR_OK
+
+    def _wait(self, buffer_type: int) -> int:
+        """Wait for the next notify size block, the lock is released while waiting."""
+        if (transfer := self.transfers.get(buffer_type)) is None:
+            return self._set_error(errs.ERR_SEQUENCE, "No transfer defined for buffer %s" % buffer_type)
+        timeout = self.registers.get(regs.SPC_TIMEOUT, 0) * 1e-3
+        deadline = time.perf_counter() + timeout
+        _advance()
+        notified_blocks = transfer.card_bytes // transfer.notify
+        while True:
+            if transfer.direction == _DIR_PCTOCARD:
+                if transfer.available() >= min(transfer.notify, transfer.length):
+                    return errs.ERR_OK
+            elif transfer.card_bytes // transfer.notify > notified_blocks:
+                return errs.ERR_OK
+            if not self.dma_running and buffer_type == _BUF_DATA:
+                return self._set_error(errs.ERR_ABORT, "DMA transfer stopped")
+            if timeout > 0 and time.perf_counter() >= deadline:
+                return self._set_error(errs.ERR_TIMEOUT, "Timeout of DMA wait")
+            _lock.release()
+            try:
+                time.sleep(_POLL_INTERVAL)
+            finally:
+                _lock.acquire()
+            _advance()
+
+    def _set_error(self, error: int, text: str) -> int:
+        self.error = error
+        self.error_text = text
+        return error
+
+
+class SimulatedTxCard(SimulatedCard):
+    """Simulated transmit card in FIFO replay mode."""
+
+    def __init__(
+        self,
+        path: str,
+        consumption_rate: float | None = None,
+        onboard_bytes: int = 64 * 1024**2,
+        loopback: "SimulatedRxCard | None" = None,
+    ):
+        """Initialize simulated transmit card.
+
+        Parameters
+        ----------
+        path
+            Device path of the card
+        consumption_rate, optional
+            Number of samples per second and channel, which are replayed, by default None.
+            If None, the sample rate of the card is used, if ``math.inf``, data is replayed as fast as possible.
+        onboard_bytes, optional
+            Size of the onboard memory in bytes, by default 64 MB
+        loopback, optional
+            Receive card which records the replayed data, by default None
+        """
+        super().__init__(path, TX_CARD_TYPE)
+        self.consumption_rate = consumption_rate
+        self.onboard_bytes = onboard_bytes - onboard_bytes % 8
+        self.loopback = loopback
+        self._onboard = np.zeros(0, dtype=np.uint8)
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset registers, transfers and replay state."""
+        super().reset()
+        self._reset_replay()
+
+    def define_transfer(self, buffer_type: int, direction: int, notify: int, address: int, length: int) -> int:
+        """Define a DMA transfer, the onboard memory is cleared."""
+        self._reset_replay()
+        return super().define_transfer(buffer_type, direction, notify, address, length)
+
+    def start(self) -> None:
+        """Start the replay."""
+        super().start()
+        self._start_time = time.perf_counter()
+        if self.loopback is not None and self.loopback.running:
+            # Replay starts after the recording, timestamps count the samples since the start of the recording
+            rx_rate = self.loopback.registers[regs.SPC_SAMPLERATE]
+            self.loopback.sample_offset = round((self._start_time - self.loopback.start_time) * rx_rate)
+
+    def advance(self, now: float) -> None:
+        """Transfer data to the onboard memory and replay the data of the elapsed time."""
+        if (transfer := self.transfers.get(_BUF_DATA)) is None:
+            return
+        while True:
+            self._dma(transfer)
+            if not self.running or not self._replay(transfer, now):
+                break
+
+    def stats(self) -> dict:
+        """Return replayed samples, DMA bytes, number of underruns and max. onboard memory fill in bytes."""
+        return {
+            "replayed_samples": self.replayed_samples,
+            "dma_bytes": self.dma_bytes,
+            "underruns": self.underruns,
+            "max_fill": self.max_fill,
+        }
+
+    def _reset_replay(self) -> None:
+        self._start_time = 0.0
+        self.replayed_samples = 0
+        self.dma_bytes = 0
+        self.underruns = 0
+        self._underrun = False
+        self.max_fill = 0
+
+    def _dma(self, transfer: _Transfer) -> None:
+        """Move the data released by the user to the free onboard memory."""
+        if not self.dma_running:
+            return
+        if self._onboard.size != self.onboard_bytes:
+            self._onboard = np.zeros(self.onboard_bytes, dtype=np.uint8)
+        fill = transfer.card_bytes - 8 * self.replayed_samples
+        size = min(transfer.user_bytes - transfer.card_bytes, self.onboard_bytes - fill)
+        while size > 0:
+            host_position = transfer.card_bytes % transfer.length
+            onboard_position = transfer.card_bytes % self.onboard_bytes
+            num_bytes = min(size, transfer.length - host_position, self.onboard_bytes - onboard_position)
+            ctypes.memmove(
+                self._onboard.ctypes.data + onboard_position, transfer.address + host_position, num_bytes
+            )
+            transfer.card_bytes += num_bytes
+            self.dma_bytes += num_bytes
+            size -= num_bytes
+        self.max_fill = max(self.max_fill, transfer.card_bytes - 8 * self.replayed_samples)
+
+    def _replay(self, transfer: _Transfer, now: float) -> bool:
+        """Replay the onboard data of the elapsed time, returns True if samples were replayed."""
+        available = transfer.card_bytes // 8
+        rate = self.consumption_rate if self.consumption_rate is not None else self.registers[regs.SPC_SAMPLERATE]
+        target = available if math.isinf(rate) else int((now - self._start_time) * rate)
+        if target > available:
+            # Onboard memory ran empty before the replay time
+            if not self._underrun:
+                self.underruns += 1
+            self._underrun = True
+            target = available
+        else:
+            self._underrun = False
+
+        num_samples = min(target - self.replayed_samples, _CHUNK_SAMPLES)
+        if num_samples <= 0:
+            return False
+        onboard = self._onboard.view(np.int16).reshape(-1, 4)
+        position = self.replayed_samples % onboard.shape[0]
+        samples = onboard[position:position + num_samples]
+        if samples.shape[0] < num_samples:
+            samples = np.concatenate((samples, onboard[:num_samples - samples.shape[0]]))
+        if self.loopback is not None:
+            self.loopback.receive(samples, self.replayed_samples)
+        self.replayed_samples += num_samples
+        return True
+
+
+class SimulatedRxCard(SimulatedCard):
+    """Simulated receive card in FIFO gate mode with timestamps."""
+
+    def __init__(self, path: str):
+        """Initialize simulated receive card.
+
+        Parameters
+        ----------
+        path
+            Device path of the card
+        """
+        super().__init__(path, RX_CARD_TYPE)
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset registers, transfers and gate state."""
+        super().reset()
+        self.start_time = 0.0
+        self.sample_offset = 0
+        self.gates = 0
+        self.recorded_bytes = 0
+        self.overruns = 0
+        self._gate_level = False
+        self._in_gate = False
+        self._post_remaining = 0
+        self._history = np.zeros((0, 4), dtype=np.int16)
+
+    def start(self) -> None:
+        """Start the recording."""
+        super().start()
+        self.start_time = time.perf_counter()
+        self.sample_offset = 0
+        self.gates = 0
+        self.recorded_bytes = 0
+        self.overruns = 0
+        self._gate_level = False
+        self._in_gate = False
+        self._post_remaining = 0
+        self._history = np.zeros((0, 4), dtype=np.int16)
+
+    def stats(self) -> dict:
+        """Return number of gates, recorded bytes and number of overruns."""
+        return {"gates": self.gates, "recorded_bytes": self.recorded_bytes, "overruns": self.overruns}
+
+    def receive(self, samples: np.ndarray, first_sample: int) -> None:
+        """Record the gates of replayed transmit samples.
+
+        Parameters
+        ----------
+        samples
+            Interleaved transmit samples with shape (samples, 4)
+        first_sample
+            Index of the first sample, used as timestamp
+        """
+        if not self.running or not self.dma_running:
+            return
+        pre_trigger = self.registers.get(regs.SPC_PRETRIGGER, 0)
+        post_trigger = self.registers.get(regs.SPC_POSTTRIGGER, 0)
+
+        gate = (samples[:, 1].view(np.uint16) & _DIGITAL_BIT).astype(bool)
+        edges = np.diff(gate.astype(np.int8), prepend=np.int8(self._gate_level))
+        rising = np.flatnonzero(edges == 1)
+        falling = np.flatnonzero(edges == -1)
+
+        position = 0
+        num_samples = samples.shape[0]
+        while position < num_samples:
+            if self._post_remaining > 0:
+                end = min(num_samples, position + self._post_remaining)
+                self._record(samples[position:end])
+                self._post_remaining -= end - position
+                position = end
+            elif self._in_gate:
+                k = int(np.searchsorted(falling, position))
+                end = int(falling[k]) if k < falling.size else num_samples
+                self._record(samples[position:end])
+                if k < falling.size:
+                    self._timestamp(first_sample + end)
+                    self._in_gate = False
+                    self._post_remaining = post_trigger
+                position = end
+            else:
+                k = int(np.searchsorted(rising, position))
+                if k == rising.size:
+                    break
+                start = int(rising[k])
+                history = np.concatenate((self._history, samples[:start]))
+                self._record(history[history.shape[0] - min(pre_trigger, history.shape[0]):])
+                self._timestamp(first_sample + start)
+                self.gates += 1
+                self._in_gate = True
+                position = start
+
+        self._gate_level = bool(gate[-1])
+        self._history = np.concatenate((self._history, samples[-pre_trigger:] if pre_trigger else samples[:0]))
+        self._history = self._history[self._history.shape[0] - min(pre_trigger, self._history.shape[0]):]
+
+    def _record(self, samples: np.ndarray) -> None:
+        """Convert transmit samples to receive samples of the enabled channels and write them to the host buffer."""
+        if samples.shape[0] == 0:
+            return
+        num_channels = max(1, self.get_param(regs.SPC_CHCOUNT))
+        # Each receive channel records the RF channel of the transmit card
+        data = np.repeat(samples[:, :1], num_channels, axis=1)
+        if self.registers.get(regs.SPC_DIGMODE0, 0):
+            # Digital input X2 (reference signal) replaces bit 15 of channel 0
+            channel = data[:, 0].view(np.uint16)
+            reference = samples[:, 2].view(np.uint16) & _DIGITAL_BIT
+            data[:, 0] = ((channel >> 1) | reference).view(np.int16)
+        if not self.transfers[_BUF_DATA].write(data):
+            self.overruns += 1
+            self.running = False
+            self._set_error(errs.ERR_ABORT, "Receive buffer overrun")
+            return
+        self.recorded_bytes += data.nbytes
+
+    def _timestamp(self, sample: int) -> None:
+        if (transfer := self.transfers.get(_BUF_TIMESTAMP)) is not None:
+            transfer.write(np.array([sample + self.sample_offset, 0], dtype=np.int64))
+
+
+# Simulated cards by device path
+cards: dict[str, SimulatedCard] = {}
+
+
+def configure(
+    tx_path: str = "/dev/spcm1",
+    rx_path: str = "/dev/spcm0",
+    consumption_rate: float | None = None,
+    onboard_bytes: int = 64 * 1024**2,
+    loopback: bool = True,
+) -> tuple[SimulatedTxCard, SimulatedRxCard]:
+    """Configure a simulated transmit and receive card, existing simulated cards are removed.
+
+    Parameters
+    ----------
+    tx_path, optional
+        Device path of the transmit card, by default "/dev/spcm1"
+    rx_path, optional
+        Device path of the receive card, by default "/dev/spcm0"
+    consumption_rate, optional
+        Replay rate in samples per second, by default the sample rate, see ``SimulatedTxCard``
+    onboard_bytes, optional
+        Onboard memory of the transmit card in bytes, by default 64 MB
+    loopback, optional
+        Record the output of the transmit card with the receive card, by default True
+
+    Returns
+    -------
+        Simulated transmit and receive card
+    """
+    with _lock:
+        rx_card = SimulatedRxCard(rx_path)
+        tx_card = SimulatedTxCard(
+            tx_path, consumption_rate=consumption_rate, onboard_bytes=onboard_bytes,
+            loopback=rx_card if loopback else None,
+        )
+        cards.clear()
+        cards[tx_path] = tx_card
+        cards[rx_path] = rx_card
+    return tx_card, rx_card
+
+
+def _advance() -> None:
+    """Update all simulated cards to the current time."""
+    now = time.perf_counter()
+    for card in list(cards.values()):
+        card.advance(now)
+
+
+def _card(handle: Any) -> SimulatedCard:
+    if not isinstance(handle, SimulatedCard):
+        raise ConnectionError("No simulated device.")
+    return handle
+
+
+# >> Driver functions of pyspcm
+
+def spcm_hOpen(path: Any) -> SimulatedCard | None:
+    """Open a simulated card by its device path, the default cards are configured on first use."""
+    device = path.value.decode() if hasattr(path, "value") else str(path)
+    with _lock:
+        if not cards:
+            configure()
+        return cards.get(device)
+
+
+def spcm_vClose(handle: Any) -> None:
+    """Close a simulated card."""
+    with _lock:
+        card = _card(handle)
+        card.running = False
+        card.dma_running = False
+
+
+def spcm_dwGetErrorInfo_i32(handle: Any, register: Any, value: Any, text: Any) -> int:
+    """Write the last error text of a card to the text buffer and return the error code."""
+    with _lock:
+        card = _card(handle)
+        if text is not None:
+            text.value = card.error_text.encode()[:regs.ERRORTEXTLEN - 1]
+        return card.error
+
+
+def spcm_dwGetParam_i32(handle: Any, register: int, value: Any) -> int:
+    """Read a register of a simulated card."""
+    with _lock:
+        card = _card(handle)
+        _advance()
+        _store(value, card.get_param(_value(register)))
+        return errs.ERR_OK
+
+
+spcm_dwGetParam_i64 = spcm_dwGetParam_i32
+
+
+def spcm_dwSetParam_i32(handle: Any, register: int, value: Any) -> int:
+    """Write a register of a simulated card or execute a command."""
+    with _lock:
+        card = _card(handle)
+        _advance()
+        return card.set_param(_value(register), _value(value))
+
+
+spcm_dwSetParam_i64 = spcm_dwSetParam_i32
+
+
+def spcm_dwSetParam_i64m(handle: Any, register: int, value_high: Any, value_low: Any) -> int:
+    """Write a 64 bit register of a simulated card given by high and low 32 bit values."""
+    return spcm_dwSetParam_i32(handle, register, (_value(value_high) << 32) | (_value(value_low) & 0xFFFFFFFF))
+
+
+def spcm_dwDefTransfer_i64(
+    handle: Any, buffer_type: int, direction: int, notify: Any, buffer: Any, offset: Any, length: Any
+) -> int:
+    """Define a DMA transfer of a simulated card."""
+    with _lock:
+        card = _card(handle)
+        return card.define_transfer(
+            _value(buffer_type),
+            _value(direction),
+            _value(notify),
+            _address(buffer) + _value(offset),
+            _value(length),
+        )
+
+
+def spcm_dwInvalidateBuf(handle: Any, buffer_type: int) -> int:
+    """Remove a DMA transfer of a simulated card."""
+    with _lock:
+        _card(handle).transfers.pop(_value(buffer_type), None)
+        return errs.ERR_OK
+
+
+def spcm_dwGetContBuf_i64(handle: Any, buffer_type: int, buffer: Any, length: Any) -> int:
+    """Continuous memory is not available on simulated cards, the length is set to zero."""
+    _store(length, 0)
+    return errs.ERR_OK
+
+
+DRIVER_FUNCTIONS = [
+    "spcm_hOpen",
+    "spcm_vClose",
+    "spcm_dwGetErrorInfo_i32",
+    "spcm_dwGetParam_i32",
+    "spcm_dwGetParam_i64",
+    "spcm_dwSetParam_i32",
+    "spcm_dwSetParam_i64",
+    "spcm_dwSetParam_i64m",
+    "spcm_dwDefTransfer_i64",
+    "spcm_dwInvalidateBuf",
+    "spcm_dwGetContBuf_i64",
+]
+
+
+def install(module: ModuleType | None = None) -> None:
+    """Replace the driver functions of the pyspcm module by the simulated driver functions.
+
+    If pyspcm is not imported yet, the environment variable ``NEXUS_SPCM_SIMULATION`` is set,
+    such that pyspcm does not load the driver library.
+
+    Parameters
+    ----------
+    module, optional
+        pyspcm module, by default the module is imported
+    """
+    os.environ[ENV_SIMULATION] = "1"
+    if module is None:
+        import console.spcm_control.spcm.pyspcm as module
+
+    for name in DRIVER_FUNCTIONS:
+        setattr(module, name, globals()[name])
@@ -1,8 +1,17 @@
 """Tools for spectrum card."""
 
+import logging
+import mmap
+import os
+import threading
+import time
+from collections.abc import Iterable
 from ctypes import *
+from dataclasses import asdict, dataclass
 from typing import Any
 
+import numpy as np
+
 # load registers for easier access
 import console.spcm_control.spcm.registers as regs
 from console.spcm_control.spcm.errors import ERR_OK, error_reg
@@ -120,3 +129,244 @@ def create_dma_buffer(buffer_size: int):
     else:
         dwOffset = 0
     return (c_char * buffer_size).from_buffer(pvNonAlignedBuf, dwOffset)
+
+
+@dataclass
+class DMABufferPoolStatistics:
+    """Statistics of the DMA buffer pool."""
+
+    allocations: int = 0
+    """Number of allocated buffers."""
+
+    allocated_bytes: int = 0
+    """Total size of the allocated buffers in bytes."""
+
+    allocation_time: float = 0.
+    """Time spent on allocating (and populating or locking) buffers in s."""
+
+    reuses: int = 0
+    """Number of requests, which were served by a buffer of a previous request."""
+
+    lock_failures: int = 0
+    """Number of buffers, which could not be locked in physical memory."""
+
+    in_use_bytes: int = 0
+    """Total size of the buffers, which are currently handed out, in bytes."""
+
+    pooled_bytes: int = 0
+    """Total size of all buffers of the pool in bytes."""
+
+    def dict(self) -> dict:
+        """Return the statistics as dictionary."""
+        return asdict(self)
+
+
+class DMABufferPool:
+    """Process-wide pool of page-aligned DMA buffers.
+
+    Allocating the DMA buffers of the cards for each operation is expensive:
+    A buffer of 1 GiB is zero-filled on allocation and its pages are faulted in during the first transfer.
+    The pool allocates each buffer once and hands it out again to subsequent requests of the same or a smaller size.
+    A free buffer, which is too small for a request, is replaced by a new buffer,
+    such that the pool holds at most the buffers which are used at the same time.
+
+    By default, buffers are allocated by an anonymous memory map, which is page-aligned and zero-filled
+    by the operating system on demand. With ``populate``, the pages are mapped on allocation (``MAP_POPULATE``),
+    with ``lock``, the pages are locked in physical memory (``mlock``), which requires a sufficient ``RLIMIT_MEMLOCK``.
+    Both options are only available on Linux and are ignored otherwise.
+
+    Example
+    -------
+    >>> buffer = dma_buffer_pool.acquire(2**30)
+    >>> ...
+    >>> dma_buffer_pool.release(buffer)
+    """
+
+    def __init__(self, use_mmap: bool = True, populate: bool = False, lock: bool = False):
+        """Init function of the DMA buffer pool.
+
+        Parameters
+        ----------
+        use_mmap, optional
+            Allocate buffers by an anonymous memory map instead of a ctypes array, by default True
+        populate, optional
+            Map the pages of a buffer on allocation, by default False
+        lock, optional
+            Lock the pages of a buffer in physical memory, by default False
+        """
+        self.log = logging.getLogger("DMAPool")
+        self.use_mmap = use_mmap
+        self.populate = populate
+        self.lock = lock
+        self.stats = DMABufferPoolStatistics()
+        # Pooled buffers which are free and which are handed out, keyed by the address of the handed out view
+        self._free: list[Array] = []
+        self._in_use: dict[int, Array] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, buffer_size: int):
+        """Return a page-aligned buffer, either from the pool or newly allocated.
+
+        The content of a buffer from the pool is undefined, a newly allocated buffer is zero-filled.
+
+        Parameters
+        ----------
+        buffer_size
+            Size of the buffer in bytes
+
+        Returns
+        -------
+            Buffer of the requested size
+        """
+        with self._lock:
+            # Smallest free buffer which fits the requested size
+            candidates = [buffer for buffer in self._free if sizeof(buffer) >= buffer_size]
+            if candidates:
+                pooled = min(candidates, key=sizeof)
+                self._free.remove(pooled)
+                self.stats.reuses += 1
+            else:
+                # Free buffers are too small and are replaced
+                for buffer in self._free:
+                    self.stats.pooled_bytes -= sizeof(buffer)
+                self._free = []
+                pooled = self._allocate(buffer_size)
+            buffer = (c_char * buffer_size).from_buffer(pooled)
+            self._in_use[addressof(buffer)] = pooled
+            self.stats.in_use_bytes += sizeof(pooled)
+        return buffer
+
+    def release(self, buffer: Array) -> None:
+        """Return a buffer to the pool.
+
+        Parameters
+        ----------
+        buffer
+            Buffer, which was returned by ``acquire``.
+            The buffer must not be used by the card anymore, i.e. the card DMA must be stopped.
+
+        Raises
+        ------
+        ValueError
+            Buffer was not acquired from the pool
+        """
+        with self._lock:
+            if (pooled := self._in_use.pop(addressof(buffer), None)) is None:
+                raise ValueError("Buffer was not acquired from the DMA buffer pool.")
+            self._free.append(pooled)
+            self.stats.in_use_bytes -= sizeof(pooled)
+
+    def clear(self) -> None:
+        """Remove all free buffers from the pool, their memory is released once no view references it."""
+        with self._lock:
+            for buffer in self._free:
+                self.stats.pooled_bytes -= sizeof(buffer)
+            self._free = []
+
+    def _allocate(self, buffer_size: int) -> Array:
+        """Allocate a page-aligned buffer of a size which is rounded up to the page size."""
+        time_start = time.perf_counter()
+        buffer_size = -(-max(buffer_size, 1) // mmap.PAGESIZE) * mmap.PAGESIZE
+        if not self.use_mmap:
+            buffer = create_dma_buffer(buffer_size)
+        elif hasattr(mmap, "MAP_ANONYMOUS"):
+            flags = mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS
+            if self.populate:
+                flags |= getattr(mmap, "MAP_POPULATE", 0)
+            buffer = (c_char * buffer_size).from_buffer(mmap.mmap(-1, buffer_size, flags=flags))
+        else:
+            buffer = (c_char * buffer_size).from_buffer(mmap.mmap(-1, buffer_size))
+        if self.lock and not self._mlock(buffer):
+            self.stats.lock_failures += 1
+            self.log.warning("Could not lock DMA buffer of %s bytes in physical memory", buffer_size)
+
+        elapsed = time.perf_counter() - time_start
+        self.stats.allocations += 1
+        self.stats.allocated_bytes += buffer_size
+        self.stats.allocation_time += elapsed
+        self.stats.pooled_bytes += buffer_size
+        self.log.debug("Allocated DMA buffer of %s bytes in %.3f s", buffer_size, elapsed)
+        return buffer
+
+    @staticmethod
+    def _mlock(buffer: Array) -> bool:
+        """Lock the pages of a buffer in physical memory, return False if locking is not possible."""
+        if os.name != "posix":
+            return False
+        try:
+            libc = CDLL(None, use_errno=True)
+            return libc.mlock(c_void_p(addressof(buffer)), c_size_t(sizeof(buffer))) == 0
+        except (OSError, AttributeError):
+            return False
+
+
+dma_buffer_pool = DMABufferPool()
+"""Process-wide DMA buffer pool of the transmit and receive cards."""
+
+
+class ReplayDataReader:
+    """Sequential reader which gathers replay data from a sequence of arrays.
+
+    The arrays, e.g. the per block arrays of an unrolled sequence or the chunks of a sequence stream,
+    are copied piece by piece to the destination without concatenating them first.
+    Once all arrays are consumed, the destination is filled with zeros.
+
+    Example
+    -------
+    >>> reader = ReplayDataReader([unrolled_seq.data])
+    >>> reader.read_into(addressof(ring_buffer), notify_size)
+    """
+
+    def __init__(self, data: Iterable[np.ndarray]):
+        """Initialize the reader.
+
+        Parameters
+        ----------
+        data
+            Iterable of C-contiguous int16 arrays, the replay data is given by their concatenation
+        """
+        self._arrays = iter(data)
+        self._current: np.ndarray | None = None
+        self._offset: int = 0
+        self.exhausted: bool = False
+        self.bytes_read: int = 0
+
+    def read_into(self, address: int, size: int) -> int:
+        """Copy the next bytes of replay data to a destination address.
+
+        Parameters
+        ----------
+        address
+            Destination address, e.g. a position within the DMA ring buffer
+        size
+            Number of bytes to write to the destination
+
+        Returns
+        -------
+            Number of replay data bytes, the remaining bytes up to size are zeros
+
+        Raises
+        ------
+        ValueError
+            Replay data array is not a C-contiguous int16 array
+        """
+        copied = 0
+        while copied < size and not self.exhausted:
+            if self._current is None or self._offset >= self._current.nbytes:
+                # Get the next non-empty replay data array
+                if (array := next(self._arrays, None)) is None:
+                    self.exhausted = True
+                    break
+                if array.dtype != np.int16 or not array.flags.c_contiguous:
+                    raise ValueError("Replay data must be given as C-contiguous int16 arrays.")
+                self._current, self._offset = array, 0
+                continue
+            num_bytes = min(size - copied, self._current.nbytes - self._offset)
+            memmove(address + copied, self._current.ctypes.data + self._offset, num_bytes)
+            self._offset += num_bytes
+            copied += num_bytes
+
+        if copied < size:
+            memset(address + copied, 0, size - copied)
+        self.bytes_read += copied
+        return copied
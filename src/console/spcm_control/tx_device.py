@@ -2,6 +2,8 @@
 import ctypes
 import logging
 import threading
+import time
+from collections.abc import Iterator
 from dataclasses import dataclass
 
 import numpy as np
@@ -10,7 +12,7 @@ import console.spcm_control.spcm.pyspcm as spcm
 from console.interfaces.acquisition_parameter import Dimensions
 from console.interfaces.unrolled_sequence import UnrolledSequence
 from console.spcm_control.abstract_device import SpectrumDevice
-from console.spcm_control.spcm.tools import create_dma_buffer, translate_status, type_to_name
+from console.spcm_control.spcm.tools import ReplayDataReader, dma_buffer_pool, translate_status, type_to_name
 
 
 @dataclass
@@ -78,6 +80,12 @@ class TxCard(SpectrumDevice):
         # Threading class attributes
         self.worker: threading.Thread | None = None
         self.is_running = threading.Event()
+        # Set by the worker once the card buffer was filled and the card waits for the trigger
+        self.armed = threading.Event()
+        self.arm_time: float | None = None
+        """Time (``time.perf_counter``) at which the card was armed."""
+        # DMA buffers of the worker, which are returned to the pool when the card is stopped
+        self._dma_buffers: list[ctypes.Array] = []
 
     def dict(self) -> dict:
         """Returnt class variables which are json serializable as dictionary.
@@ -273,7 +281,9 @@ class TxCard(SpectrumDevice):
                 offsets.x, offsets.y, offsets.z
             )
 
-    def start_operation(self, data: UnrolledSequence | None = None) -> None:
+    def start_operation(
+        self, data: UnrolledSequence | None = None, repetitions: int = 1, repetition_delay: float = 0.
+    ) -> None:
         """Start transmit (TX) card operation.
 
         Steps:
@@ -281,12 +291,23 @@ class TxCard(SpectrumDevice):
         (2) Clear emergency stop flag, reset to False
         (3) Start worker thread (card streaming mode), with provided replay data
 
+        If the sequence was unrolled in streaming mode, the replay data is unrolled on demand
+        by the worker thread in chunks of notify size.
+
+        The sequence can be replayed several times back-to-back within one FIFO session,
+        e.g. for the averages of an acquisition. The same replay data is gathered into the ring buffer
+        for each repetition, a streamed sequence is unrolled again for each repetition.
+
         Parameters
         ----------
         data
             Sequence replay data as int16 numpy array in correct order.
             Checkout `prepare_sequence` function for reference of correct replay data format.
             This value is None per default
+        repetitions, optional
+            Number of replays of the sequence, by default 1
+        repetition_delay, optional
+            Delay between two replays in s, by default 0. Zeros are replayed during the delay.
 
         Raises
         ------
@@ -297,30 +318,31 @@ class TxCard(SpectrumDevice):
             # Data must have a default value as start_operation is an abstract method and data is optional
             if not data:
                 raise ValueError("No unrolled sequence data provided.")
-            sqnc = np.concatenate(data.seq)
-
-            # Check if sequence datatype is valid
-            if sqnc.dtype != np.int16:
-                raise ValueError("Sequence replay data is not int16, please unroll sequence to int16.")
 
             # Check if card connection is established
             if not self.card:
                 raise ConnectionError("No connection to card established...")
 
-            # Extend the provided data array with zeros to obtain a multiple of ring buffer size in memory
-            if (rest := sqnc.nbytes % self.ring_buffer_size.value) != 0:
-                rest = self.ring_buffer_size.value - rest
-                if rest % 2 != 0:
-                    raise MemoryError("Providet data array size is not a multiple of 2 bytes (size of one sample)")
+            if repetitions < 1:
+                raise ValueError(f"Invalid number of repetitions: {repetitions}")
 
-                fill_size = int((rest) / 2)
-                sqnc = np.append(sqnc, np.zeros(fill_size, dtype=np.int16))
-                self.log.debug("Appended %s zeros to data array", fill_size)
+            if data.stream is None and data.data.dtype != np.int16:
+                # Check if sequence datatype is valid
+                raise ValueError("Sequence replay data is not int16, please unroll sequence to int16.")
 
         except Exception as exc:
             self.log.exception(exc, exc_info=True)
             raise exc
 
+        delay_samples = round(repetition_delay / data.dwell_time)
+        replay_data = self._repeat_replay_data(data, repetitions, delay_samples)
+
+        # Total size of the data to be played out (4 channels, 2 bytes per sample),
+        # only the last notify size chunk is padded with zeros
+        sample_count = repetitions * data.sample_count + (repetitions - 1) * delay_samples
+        self.data_buffer_size = -(-sample_count * self.num_ch * 2 // self.notify_size.value)
+        self.data_buffer_size *= self.notify_size.value
+
         # Check if sequence dwell time is valid
         if sqnc_sample_rate := 1 / (data.dwell_time * 1e6) != self.sample_rate:
             self.log.warning(
@@ -331,9 +353,46 @@ class TxCard(SpectrumDevice):
 
         # Setup card, clear emergency stop thread event and start thread
         self.is_running.clear()
-        self.worker = threading.Thread(target=self._fifo_stream_worker, args=(sqnc,))
+        self.armed.clear()
+        self.arm_time = None
+        self.worker = threading.Thread(target=self._fifo_stream_worker, args=(replay_data,))
         self.worker.start()
 
+    def _repeat_replay_data(
+        self, data: UnrolledSequence, repetitions: int, delay_samples: int
+    ) -> Iterator[np.ndarray]:
+        """Return an iterator over the replay data of all repetitions, separated by zeros of the delay.
+
+        Parameters
+        ----------
+        data
+            Unrolled sequence
+        repetitions
+            Number of replays of the sequence
+        delay_samples
+            Number of zero samples (per channel) between two replays
+        """
+        # Zeros of the delay are yielded in chunks of max. notify size
+        zeros = np.zeros(min(delay_samples * self.num_ch, self.notify_size.value // 2), dtype=np.int16)
+        num_full_chunks, remainder = divmod(delay_samples * self.num_ch, max(zeros.size, 1))
+        delay = [zeros] * num_full_chunks + ([zeros[:remainder]] if remainder > 0 else [])
+
+        for repetition in range(repetitions):
+            if repetition > 0:
+                yield from delay
+            if data.stream is not None:
+                # Replay data is unrolled just ahead of the DMA position. The zero padding of the last chunk
+                # is removed, such that the repetitions follow each other without gap, as the contiguous data
+                remaining = data.sample_count * self.num_ch
+                for chunk in data.stream(self.notify_size.value):
+                    yield chunk[:remaining]
+                    remaining -= chunk.size
+                    if remaining <= 0:
+                        break
+            else:
+                # The contiguous replay data is read by the worker in chunks of notify size, no copy required
+                yield data.data
+
     def stop_operation(self) -> None:
         """Stop card operation by thread event and stop card."""
         if self.worker is not None:
@@ -348,23 +407,32 @@ class TxCard(SpectrumDevice):
 
             self.handle_error(error)
             self.worker = None
+            self._release_dma_buffers()
         else:
             print("No active replay thread found...")
 
-    def _fifo_stream_worker(self, data: np.ndarray) -> None:
+    def _release_dma_buffers(self) -> None:
+        """Return the DMA buffers of the stopped operation to the pool."""
+        for buffer in self._dma_buffers:
+            dma_buffer_pool.release(buffer)
+        self._dma_buffers = []
+
+    def _fifo_stream_worker(self, replay_data: Iterator[np.ndarray]) -> None:
         """Continuous FIFO mode examples.
 
         Parameters
         ----------
-        data
-            Numpy array of data to be replayed by card.
+        replay_data
+            Iterator over the replay data arrays, e.g. the per block arrays of an unrolled sequence
+            or the chunks of a sequence stream. The arrays are gathered into the ring buffer,
+            whenever the card has consumed notify size bytes.
             Replay data should be in the format:
             >>> [c0_0, c1_0, c2_0, c3_0, c0_1, c1_1, c2_1, c3_1, ..., cX_N]
             Here, X denotes the channel and the subsequent index N the sample index.
+            The last notify size chunk is padded with zeros.
         """
         try:
-            # Get total size of data buffer to be played out
-            self.data_buffer_size = int(data.nbytes)
+            # Total size of data buffer to be played out is set when starting the operation
             if self.data_buffer_size % (self.num_ch * 2) != 0:
                 raise MemoryError(
                     "Replay data size is not a multiple of enabled channels times 2 (bytes per sample)..."
@@ -376,24 +444,17 @@ class TxCard(SpectrumDevice):
         self.log.debug("Replay data buffer: %s bytes", self.data_buffer_size)
 
         # >> Define software buffer
-        # Setup replay data buffer
-        data_buffer = data.ctypes.data_as(ctypes.POINTER(ctypes.c_int16))
-        # Allocate continuous ring buffer as defined by class attribute
-        ring_buffer = create_dma_buffer(self.ring_buffer_size.value)
-
-        try:
-            # Perform initial memory transfer: Fill the whole ring buffer
-            if _ring_buffer_pos := ctypes.cast(ring_buffer, ctypes.c_void_p).value:
-                if _data_buffer_pos := ctypes.cast(data_buffer, ctypes.c_void_p).value:
-                    ctypes.memmove(_ring_buffer_pos, _data_buffer_pos, self.ring_buffer_size.value)
-                    transferred_bytes = self.ring_buffer_size.value
-                else:
-                    raise RuntimeError("Could not get data buffer position")
-            else:
-                raise RuntimeError("Could not get ring buffer position")
-        except RuntimeError as err:
-            self.log.exception(err, exc_info=True)
-            raise err
+        reader = ReplayDataReader(replay_data)
+        # Allocate continuous ring buffer as defined by class attribute,
+        # a short sequence only requires a buffer of its own size (multiple of notify size)
+        buffer_size = spcm.uint64(min(self.ring_buffer_size.value, self.data_buffer_size))
+        ring_buffer = dma_buffer_pool.acquire(buffer_size.value)
+        self._dma_buffers.append(ring_buffer)
+        ring_buffer_address = ctypes.addressof(ring_buffer)
+
+        # Perform initial memory transfer: Fill the whole ring buffer
+        reader.read_into(ring_buffer_address, buffer_size.value)
+        transferred_bytes = buffer_size.value
 
         # Perform initial data transfer to completely fill continuous buffer
         spcm.spcm_dwDefTransfer_i64(
@@ -403,9 +464,9 @@ class TxCard(SpectrumDevice):
             self.notify_size,
             ring_buffer,
             spcm.uint64(0),
-            self.ring_buffer_size,
+            buffer_size,
         )
-        spcm.spcm_dwSetParam_i64(self.card, spcm.SPC_DATA_AVAIL_CARD_LEN, self.ring_buffer_size)
+        spcm.spcm_dwSetParam_i64(self.card, spcm.SPC_DATA_AVAIL_CARD_LEN, buffer_size)
 
         self.log.debug("Starting card memory transfer")
         error = spcm.spcm_dwSetParam_i32(
@@ -423,6 +484,8 @@ class TxCard(SpectrumDevice):
             spcm.M2CMD_CARD_START | spcm.M2CMD_CARD_ENABLETRIGGER,
         )
         self.handle_error(error)
+        self.arm_time = time.perf_counter()
+        self.armed.set()
 
         avail_bytes = spcm.int32(0)
         usr_position = spcm.int32(0)
@@ -436,24 +499,8 @@ class TxCard(SpectrumDevice):
             # Calculate new data for the transfer, when notify_size is available on continous buffer
             if avail_bytes.value >= self.notify_size.value:
                 transfer_count += 1
-
-                # Get new buffer positions
-                if ring_buffer_position := ctypes.cast(
-                    (ctypes.c_char * (self.ring_buffer_size.value - usr_position.value)).from_buffer(
-                        ring_buffer, usr_position.value
-                    ),
-                    ctypes.c_void_p,
-                ).value:
-                    if current_data_buffer := ctypes.cast(data_buffer, ctypes.c_void_p).value:
-                        data_buffer_position = current_data_buffer + transferred_bytes
-
-                        # Move memory: Current ring buffer position,
-                        # position in sequence data and amount to transfer (=> notify size)
-                        ctypes.memmove(
-                            ring_buffer_position,
-                            data_buffer_position,
-                            self.notify_size.value,
-                        )
+                # Gather the next notify size bytes at the current ring buffer position
+                reader.read_into(ring_buffer_address + usr_position.value, self.notify_size.value)
 
                 spcm.spcm_dwSetParam_i32(self.card, spcm.SPC_DATA_AVAIL_CARD_LEN, self.notify_size)
                 transferred_bytes += self.notify_size.value
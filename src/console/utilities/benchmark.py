@@ -0,0 +1,484 @@
+"""Benchmarks of the sequence unrolling with representative pulseq workloads and of the DDC methods.
+
+The benchmarks can be run from the command line and write the results to a JSON file,
+such that the performance of the sequence provider and the post-processing can be compared across releases:
+
+.. code-block:: bash
+
+   python -m console.utilities.benchmark --output benchmark.json --repeats 5
+   python -m console.utilities.benchmark --ddc --output ddc-benchmark.json
+"""
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+import warnings
+from collections.abc import Callable, Sequence
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from importlib import metadata
+
+import numpy as np
+import pypulseq as pp
+
+import console
+from console.interfaces.acquisition_parameter import AcquisitionParameter
+from console.interfaces.dimensions import Dimensions
+from console.interfaces.enums import DDCMethod
+from console.pulseq_interpreter.sequence_provider import SequenceProvider
+from console.utilities import ddc
+from console.utilities.sequences import se_tx_adjust, t2_relaxation, tse_3d
+from console.utilities.sequences.spectrometry import fid
+from console.utilities.sequences.system_settings import system
+
+# Version of the result format, incremented if fields are changed
+RESULT_VERSION = 2
+
+
+def _tse_3d(n_enc: Dimensions) -> Callable[[], pp.Sequence]:
+    def _constructor() -> pp.Sequence:
+        return tse_3d.constructor(n_enc=n_enc, etl=8, echo_time=15e-3, repetition_time=200e-3)[0]
+    return _constructor
+
+
+WORKLOADS: dict[str, Callable[[], pp.Sequence]] = {
+    "fid": fid.constructor,
+    "se_tx_adjust": lambda: se_tx_adjust.constructor(repetition_time=100e-3)[0],
+    "t2_relaxation": lambda: t2_relaxation.constructor(repetition_time=200e-3)[0],
+    "tse_3d_16x16x4": _tse_3d(Dimensions(16, 16, 4)),
+    "tse_3d_32x32x4": _tse_3d(Dimensions(32, 32, 4)),
+    "tse_3d_64x64x4": _tse_3d(Dimensions(64, 64, 4)),
+}
+"""Sequence constructors of the benchmark workloads, TSE with different matrix sizes."""
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    """Result of the unrolling benchmark of one workload."""
+
+    name: str
+    """Name of the workload."""
+
+    num_blocks: int
+    """Number of sequence blocks."""
+
+    sample_count: int
+    """Number of unrolled samples per channel."""
+
+    duration: float
+    """Sequence duration in s."""
+
+    unroll_times: list[float] = field(default_factory=list)
+    """Wall clock time of each repetition of ``unroll_sequence`` with filled RF waveform cache in s."""
+
+    cold_unroll_times: list[float] = field(default_factory=list)
+    """Wall clock time of each repetition of ``unroll_sequence`` with empty RF waveform cache in s,
+    includes the resampling of the RF waveforms as for a newly set sequence."""
+
+    peak_memory: int = 0
+    """Peak memory allocated during ``unroll_sequence`` in bytes, traced by ``tracemalloc``."""
+
+    @property
+    def unroll_time(self) -> float:
+        """Best unroll time of all repetitions in s."""
+        return min(self.unroll_times)
+
+    @property
+    def cold_unroll_time(self) -> float:
+        """Best unroll time of all repetitions with empty RF waveform cache in s."""
+        return min(self.cold_unroll_times)
+
+    @property
+    def samples_per_second(self) -> float:
+        """Unrolled samples per channel and second, calculated from the best unroll time."""
+        return self.sample_count / self.unroll_time
+
+    def dict(self) -> dict:
+        """Return the result as dictionary, including the derived values."""
+        return {
+            **asdict(self),
+            "unroll_time": self.unroll_time,
+            "cold_unroll_time": self.cold_unroll_time,
+            "samples_per_second": self.samples_per_second,
+        }
+
+
+def default_provider() -> SequenceProvider:
+    """Construct a sequence provider with fixed device parameters for the benchmark."""
+    return SequenceProvider(
+        gradient_efficiency=[0.4, 0.4, 0.4],
+        gpa_gain=[1.0, 1.0, 1.0],
+        output_limits=[200, 6000, 6000, 6000],
+        spcm_dwell_time=5e-8,
+        rf_to_mvolt=5e-3,
+        high_impedance=[False, True, True, True],
+        system=system,
+    )
+
+
+def run_benchmark(
+    workloads: list[str] | None = None,
+    repeats: int = 3,
+    vectorized: bool = True,
+    workers: int = 1,
+) -> list[BenchmarkResult]:
+    """Run the unrolling benchmark.
+
+    The unrolling of each workload is timed ``repeats`` times with an empty RF waveform cache,
+    as for a newly set sequence, which includes the resampling of the RF waveforms.
+    Afterwards it is timed ``repeats`` times with the filled RF waveform cache,
+    as it would be the case for repeated acquisitions.
+    The peak memory is traced in a separate run, since tracing slows down the unrolling.
+
+    Parameters
+    ----------
+    workloads, optional
+        Names of the workloads, see ``WORKLOADS``, by default all workloads
+    repeats, optional
+        Number of timed repetitions per workload, by default 3
+    vectorized, optional
+        Use the vectorized unrolling engine, by default True
+    workers, optional
+        Number of threads to unroll a sequence, by default 1
+
+    Returns
+    -------
+        Benchmark result per workload
+
+    Raises
+    ------
+    ValueError
+        Unknown workload
+    """
+    names = list(WORKLOADS) if workloads is None else workloads
+    if unknown := set(names) - set(WORKLOADS):
+        raise ValueError(f"Unknown benchmark workloads: {sorted(unknown)}")
+
+    # Use default acquisition parameters, which are not saved
+    parameter = console.parameter
+    console.parameter = AcquisitionParameter()
+    results = []
+    try:
+        for name in names:
+            with warnings.catch_warnings():
+                # Constructors warn about RF delays which are increased to the dead time
+                warnings.simplefilter("ignore", UserWarning)
+                sequence = WORKLOADS[name]()
+            provider = default_provider()
+            provider.from_pypulseq(sequence)
+
+            cold_unroll_times = []
+            for _ in range(repeats):
+                provider.rf_cache.clear()
+                time_start = time.perf_counter()
+                unrolled = provider.unroll_sequence(vectorized=vectorized, workers=workers)
+                cold_unroll_times.append(time.perf_counter() - time_start)
+                del unrolled
+
+            # RF waveform cache is filled by the last cold run
+            unroll_times = []
+            for _ in range(repeats):
+                time_start = time.perf_counter()
+                unrolled = provider.unroll_sequence(vectorized=vectorized, workers=workers)
+                unroll_times.append(time.perf_counter() - time_start)
+                del unrolled
+
+            tracemalloc.start()
+            unrolled = provider.unroll_sequence(vectorized=vectorized, workers=workers)
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results.append(BenchmarkResult(
+                name=name,
+                num_blocks=len(provider.block_events),
+                sample_count=unrolled.sample_count,
+                duration=unrolled.duration,
+                unroll_times=unroll_times,
+                cold_unroll_times=cold_unroll_times,
+                peak_memory=peak_memory,
+            ))
+            del unrolled
+    finally:
+        console.parameter = parameter
+    return results
+
+
+DDC_WORKLOADS: dict[str, tuple[int, int, int]] = {
+    "spectrum_2x1x200000": (2, 1, 200000),
+    "tse_2x64x40000": (2, 64, 40000),
+    "tse_2x128x10000": (2, 128, 10000),
+}
+"""Gate dimensions [coils, phase encoding, readout] of the DDC benchmark workloads at 20 MHz sample rate."""
+
+DDC_SAMPLE_RATE = 20e6
+DDC_FREQUENCY = 2.0e6
+
+
+def _ddc(method: DDCMethod, samples: np.ndarray, decimation: int) -> np.ndarray:
+    """Apply a DDC method to int16 samples, the floating point methods process float64 samples."""
+    match method:
+        case DDCMethod.CIC:
+            return ddc.filter_cic_int(samples, DDC_FREQUENCY, DDC_SAMPLE_RATE, decimation, number_of_stages=5)
+        case DDCMethod.AVG:
+            return ddc.demodulate_decimate(samples, DDC_FREQUENCY, DDC_SAMPLE_RATE, decimation, method="avg")
+        case DDCMethod.MULTISTAGE:
+            return ddc.decimate_multistage(samples, DDC_FREQUENCY, DDC_SAMPLE_RATE, decimation)
+        case _:
+            return ddc.demodulate_decimate(samples, DDC_FREQUENCY, DDC_SAMPLE_RATE, decimation, method="fir")
+
+
+@dataclass(frozen=True)
+class DDCBenchmarkResult:
+    """Result of the DDC benchmark of one method and gate size."""
+
+    name: str
+    """Name of the workload."""
+
+    method: str
+    """DDC method."""
+
+    shape: tuple[int, ...]
+    """Gate dimensions [coils, phase encoding, readout]."""
+
+    decimation: int
+    """Decimation factor."""
+
+    times: list[float] = field(default_factory=list)
+    """Wall clock time of each repetition in s."""
+
+    passband_ripple: float = 0.
+    """Peak to peak ripple of the magnitude response up to 80 % of the output Nyquist frequency in dB."""
+
+    alias_attenuation: float = 0.
+    """Min. attenuation of frequencies, which are aliased into the passband, in dB."""
+
+    @property
+    def time(self) -> float:
+        """Best time of all repetitions in s."""
+        return min(self.times)
+
+    @property
+    def samples_per_second(self) -> float:
+        """Processed samples of all coils per second, calculated from the best time."""
+        return int(np.prod(self.shape)) / self.time
+
+    def dict(self) -> dict:
+        """Return the result as dictionary, including the derived values."""
+        return {
+            **asdict(self),
+            "time": self.time,
+            "samples_per_second": self.samples_per_second,
+        }
+
+
+def frequency_response(
+    method: DDCMethod, decimation: int, offsets: np.ndarray, num_samples: int = 40000
+) -> np.ndarray:
+    """Measure the magnitude response of a DDC method to tones with an offset from the demodulation frequency.
+
+    The tones are quantized to int16, the magnitude is averaged over the decimated samples,
+    excluding the filter transients at the readout boundaries.
+
+    Parameters
+    ----------
+    method
+        DDC method
+    decimation
+        Decimation factor
+    offsets
+        Frequency offsets of the tones in Hz
+    num_samples, optional
+        Number of samples of each tone, by default 40000
+
+    Returns
+    -------
+        Magnitude response per offset, relative to the response at the demodulation frequency
+    """
+    time_points = np.arange(num_samples) / DDC_SAMPLE_RATE
+    frequencies = DDC_FREQUENCY + np.append(0, offsets)
+    tones = np.round(2**14 * np.cos(2 * np.pi * frequencies[:, None] * time_points)).astype(np.int16)
+    samples = tones if method == DDCMethod.CIC else tones.astype(float)
+    decimated = _ddc(method, samples, decimation)
+    transient = decimated.shape[-1] // 8
+    magnitude = np.mean(np.abs(decimated[:, transient:-transient]), axis=-1)
+    return magnitude[1:] / magnitude[0]
+
+
+def run_ddc_benchmark(
+    workloads: list[str] | None = None,
+    methods: list[DDCMethod] | None = None,
+    repeats: int = 3,
+    decimation: int = 200,
+) -> list[DDCBenchmarkResult]:
+    """Run the DDC benchmark.
+
+    Each method processes random int16 gates of the workload dimensions once without timing,
+    to fill the caches of mixer and filter kernels, and is timed ``repeats`` times afterwards.
+    The floating point methods process float64 samples, the conversion is not timed.
+    Passband ripple and alias attenuation are measured per method, see ``frequency_response``.
+
+    Parameters
+    ----------
+    workloads, optional
+        Names of the workloads, see ``DDC_WORKLOADS``, by default all workloads
+    methods, optional
+        DDC methods, by default all methods
+    repeats, optional
+        Number of timed repetitions per workload and method, by default 3
+    decimation, optional
+        Decimation factor, by default 200
+
+    Returns
+    -------
+        Benchmark result per workload and method
+
+    Raises
+    ------
+    ValueError
+        Unknown workload
+    """
+    names = list(DDC_WORKLOADS) if workloads is None else workloads
+    if unknown := set(names) - set(DDC_WORKLOADS):
+        raise ValueError(f"Unknown DDC benchmark workloads: {sorted(unknown)}")
+    methods = list(DDCMethod) if methods is None else methods
+
+    output_rate = DDC_SAMPLE_RATE / decimation
+    passband = 0.8 * output_rate / 2
+    responses = {}
+    for method in methods:
+        passband_response = frequency_response(method, decimation, np.linspace(0, passband, 17))
+        alias_offsets = np.linspace(output_rate - passband, 4 * output_rate, 64)
+        alias_response = frequency_response(method, decimation, alias_offsets)
+        responses[method] = (
+            float(20 * np.log10(passband_response.max() / passband_response.min())),
+            float(-20 * np.log10(alias_response.max())),
+        )
+
+    rng = np.random.default_rng(seed=0)
+    results = []
+    for name in names:
+        shape = DDC_WORKLOADS[name]
+        samples = rng.integers(-2**14, 2**14, size=shape, dtype=np.int16)
+        for method in methods:
+            gates = samples if method == DDCMethod.CIC else samples.astype(float)
+            _ddc(method, gates, decimation)
+            times = []
+            for _ in range(repeats):
+                time_start = time.perf_counter()
+                _ddc(method, gates, decimation)
+                times.append(time.perf_counter() - time_start)
+            results.append(DDCBenchmarkResult(
+                name=name,
+                method=method.name.lower(),
+                shape=shape,
+                decimation=decimation,
+                times=times,
+                passband_ripple=responses[method][0],
+                alias_attenuation=responses[method][1],
+            ))
+    return results
+
+
+def environment() -> dict:
+    """Return information on the benchmark environment."""
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "console": metadata.version("nexus-console"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+    }
+
+
+def write_results(path: str, results: Sequence[BenchmarkResult | DDCBenchmarkResult], **options) -> None:
+    """Write benchmark results to a JSON file.
+
+    Parameters
+    ----------
+    path
+        Path of the JSON file
+    results
+        Benchmark results
+    options
+        Benchmark options which are stored along with the results
+    """
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({
+            "version": RESULT_VERSION,
+            "environment": environment(),
+            "options": options,
+            "results": [result.dict() for result in results],
+        }, file, indent=4)
+
+
+def main(args: list[str] | None = None) -> None:
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description="Benchmark of the pulseq sequence unrolling and the DDC methods.")
+    parser.add_argument("--output", "-o", help="Path of the JSON result file")
+    parser.add_argument(
+        "--workloads", "-w", nargs="+", choices=list(WORKLOADS) + list(DDC_WORKLOADS),
+        help="Workloads of the unrolling or (with --ddc) the DDC benchmark, default: all"
+    )
+    parser.add_argument("--repeats", "-r", type=int, default=3, help="Timed repetitions per workload")
+    parser.add_argument("--blockwise", action="store_true", help="Use the block-wise unrolling engine")
+    parser.add_argument("--workers", type=int, default=1, help="Number of unrolling threads")
+    parser.add_argument("--ddc", action="store_true", help="Benchmark the DDC methods instead of the unrolling")
+    parser.add_argument("--decimation", type=int, default=200, help="Decimation factor of the DDC benchmark")
+    options = parser.parse_args(args)
+
+    # Workloads of the selected benchmark
+    workloads = DDC_WORKLOADS if options.ddc else WORKLOADS
+    if options.workloads is not None and (unknown := set(options.workloads) - set(workloads)):
+        parser.error(
+            f"workloads {sorted(unknown)} are not available for the {'DDC' if options.ddc else 'unrolling'} "
+            f"benchmark, choose from {list(workloads)}"
+        )
+
+    if options.ddc:
+        ddc_results = run_ddc_benchmark(
+            workloads=options.workloads, repeats=options.repeats, decimation=options.decimation
+        )
+        print(
+            f"{'workload':<20} {'method':<11} {'time [s]':>9} {'MSamples/s':>11} {'ripple [dB]':>12} {'alias [dB]':>11}"
+        )
+        for ddc_result in ddc_results:
+            print(
+                f"{ddc_result.name:<20} {ddc_result.method:<11} {ddc_result.time:>9.4f} "
+                f"{ddc_result.samples_per_second * 1e-6:>11.1f} {ddc_result.passband_ripple:>12.3f} "
+                f"{ddc_result.alias_attenuation:>11.1f}"
+            )
+        if options.output:
+            write_results(options.output, ddc_results, repeats=options.repeats, decimation=options.decimation)
+        return
+
+    results = run_benchmark(
+        workloads=options.workloads,
+        repeats=options.repeats,
+        vectorized=not options.blockwise,
+        workers=options.workers,
+    )
+
+    print(
+        f"{'workload':<18} {'blocks':>7} {'samples':>11} {'cold [s]':>9} {'time [s]':>9} {'MSamples/s':>11} "
+        f"{'peak [MB]':>10}"
+    )
+    for result in results:
+        print(
+            f"{result.name:<18} {result.num_blocks:>7} {result.sample_count:>11} {result.cold_unroll_time:>9.3f} "
+            f"{result.unroll_time:>9.3f} {result.samples_per_second * 1e-6:>11.1f} {result.peak_memory * 1e-6:>10.1f}"
+        )
+
+    if options.output:
+        write_results(
+            options.output,
+            results,
+            repeats=options.repeats,
+            vectorized=not options.blockwise,
+            workers=options.workers,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,27 @@
 """Digital down converter (DDC) function."""
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+
 import numpy as np
-from scipy.signal import decimate
+from scipy.signal import decimate, firwin, firwin2, kaiserord
 
 
-def filter_moving_average(signal, decimation: int = 100, overlap: int = 8):
-    r"""Decimate data using a moving average filter.
+def moving_average_kernel(decimation: int = 100, overlap: int = 8) -> np.ndarray:
+    r"""Return the normalized kernel of the moving average filter.
 
     $kernel = e^{\frac{-1}{1 - x^2}} * \sin{2.073 * \pi \ x} / x, \; x = -1, ..., 1$
 
     Parameters
     ----------
-    signal
-        Unprocessed raw signal to be decimated and filtered.
-        Input signal shape is supposed to be [averages, coils, phase encoding, readout].
-        Downsampling is applied to the readout dimension.
     decimation, optional
         Decimation factor, by default 100
     overlap, optional
-        Overlap factor of the kernel.
-        If 2, kernel is applied every kernel_size/2, if 4 every kerne_size/4 and so on.
-        By default 4
+        Overlap factor of the kernel, by default 8
 
     Returns
     -------
-        Downsampled signal
+        Kernel with ``overlap * decimation`` taps, normalized to a DC gain of 2
     """
     # Calculate kernel size
     kernel_size = int(overlap * decimation)
@@ -35,27 +33,283 @@ def filter_moving_average(signal, decimation: int = 100, overlap: int = 8):
     # Define kernel
     kernel = np.exp(-1 / (1 - kernel_space**2)) * np.sin(kernel_space * 2.073 * np.pi) / kernel_space
     # Integral for normalization
-    norm = np.sum(kernel)
+    return 2 * kernel / np.sum(kernel)
+
+
+def fir_kernel(decimation: int) -> np.ndarray:
+    """Return the kernel of the FIR decimation, which is used by ``scipy.signal.decimate``.
 
+    Parameters
+    ----------
+    decimation
+        Decimation factor
+
+    Returns
+    -------
+        Hamming windowed low pass filter with ``20 * decimation + 1`` taps
+    """
+    return firwin(20 * decimation + 1, 1.0 / decimation, window="hamming")
+
+
+def filter_moving_average(signal, decimation: int = 100, overlap: int = 8):
+    """Decimate data using a moving average filter.
+
+    The kernel, see ``moving_average_kernel``, is applied every ``decimation`` samples.
+    It is calculated by polyphase decomposition with one matrix product for all leading dimensions.
+
+    Parameters
+    ----------
+    signal
+        Unprocessed raw signal to be decimated and filtered.
+        Input signal shape is supposed to be [averages, coils, phase encoding, readout].
+        Downsampling is applied to the readout dimension.
+    decimation, optional
+        Decimation factor, by default 100
+    overlap, optional
+        Overlap factor of the kernel.
+        If 2, kernel is applied every kernel_size/2, if 4 every kerne_size/4 and so on.
+        By default 4
+
+    Returns
+    -------
+        Downsampled signal
+    """
+    kernel = moving_average_kernel(decimation, overlap)
     # Calculate size of down-sampled signal
     # num_ddc_samples = signal.shape[-1] // decimation
     num_ddc_samples = round(signal.shape[-1] / decimation)
-    signal_filtered = np.zeros(signal.shape[:-1] + (num_ddc_samples,), dtype=complex)
-
     # Zero-padding of signal to center down-sampled signal
+    polyphase = _polyphase_filter(kernel, decimation, n_pad=int(kernel.size / 2))
+    return _polyphase_decimate(signal, polyphase, num_ddc_samples, dtype=np.complex128)
+
 
-    n_pad = [(0, 0)] * signal.ndim
-    n_pad[-1] = (int(overlap * decimation / 2),) * 2
-    signal_pad = np.pad(signal, pad_width=n_pad, mode="constant", constant_values=[0])
+@lru_cache(maxsize=32)
+def mixer(num_samples: int, frequency: float, sample_rate: float, dtype: type = np.complex128) -> np.ndarray:
+    """Return the read-only mixer signal to demodulate a readout, cached per readout size and frequency.
 
-    # 1D strided convolution
-    for k in range(num_ddc_samples):
-        # _tmp = np.sum(signal_pad[..., k * decimation : k * decimation + kernel_size] * kernel)
-        _tmp = signal_pad[..., k * decimation : k * decimation + kernel_size] @ kernel
-        signal_filtered[..., k] = 2 * _tmp / norm
+    Parameters
+    ----------
+    num_samples
+        Number of readout samples
+    frequency
+        Demodulation frequency in Hz, e.g. the Larmor frequency
+    sample_rate
+        Sample rate of the readout in Hz
+    dtype, optional
+        Complex data type of the mixer, by default complex128
+
+    Returns
+    -------
+        Mixer signal ``exp(2j * pi * frequency * n / sample_rate)``
+    """
+    signal = np.exp(2j * np.pi * np.arange(num_samples) * frequency / sample_rate).astype(dtype)
+    signal.flags.writeable = False
+    return signal
+
+
+def demodulate_decimate(
+    signal: np.ndarray,
+    frequency: float,
+    sample_rate: float,
+    decimation: int,
+    method: str = "fir",
+    overlap: int = 8,
+    dtype: type = np.complex128,
+) -> np.ndarray:
+    """Demodulate and decimate a signal in one step.
+
+    Decimation is applied by a kernel which is shifted by ``decimation`` samples per output sample.
+    Instead of mixing the signal at full rate before filtering, the kernel is modulated by the mixer
+    and the output is rotated by the mixer phase at the position of each kernel window.
+    A real signal is then filtered by the real and imaginary part of the kernel,
+    such that the complex signal at full rate is never calculated.
+    Modulated kernels and output rotation are cached per readout size, frequency and decimation.
+
+    The result equals demodulation with ``mixer`` followed by ``scipy.signal.decimate(..., ftype="fir")``
+    (method "fir") or by ``filter_moving_average`` (method "avg").
+
+    Parameters
+    ----------
+    signal
+        Real or complex signal, readout is the last dimension
+    frequency
+        Demodulation frequency in Hz
+    sample_rate
+        Sample rate of the signal in Hz
+    decimation
+        Decimation factor
+    method, optional
+        Decimation kernel, "fir" or "avg" (moving average), by default "fir"
+    overlap, optional
+        Overlap factor of the moving average kernel, by default 8
+    dtype, optional
+        Complex output data type, by default complex128.
+        With complex64, the filter is calculated in single precision.
+
+    Returns
+    -------
+        Demodulated and decimated signal
+
+    Raises
+    ------
+    ValueError
+        Unknown decimation method
+    """
+    tables = _demodulation_tables(
+        signal.shape[-1], frequency, sample_rate, decimation, method, overlap, np.dtype(dtype).name
+    )
+    return _polyphase_decimate(signal, tables.polyphase, tables.rotation.size, dtype=dtype) * tables.rotation
+
+
+@dataclass(frozen=True)
+class _PolyphaseFilter:
+    """Kernel of a decimating filter, decomposed into phases of the decimation factor."""
+
+    decimation: int
+    """Decimation factor."""
+
+    offset: int
+    """Number of zero blocks, by which the signal is padded in front."""
+
+    phases: np.ndarray
+    """Kernel phases with dimensions [decimation, phases], phase j is applied to block k + j for output sample k."""
+
+
+@dataclass(frozen=True)
+class _DemodulationTables:
+    """Precomputed tables of the fused demodulation and decimation."""
+
+    polyphase: _PolyphaseFilter
+    """Modulated kernel."""
+
+    rotation: np.ndarray
+    """Mixer phase at the start of each kernel window, i.e. per output sample."""
+
+
+def _polyphase_filter(kernel: np.ndarray, decimation: int, n_pad: int) -> _PolyphaseFilter:
+    """Decompose a kernel, output sample k is ``sum(kernel[i] * signal[k * decimation - n_pad + i])``."""
+    # Kernel is zero-padded, such that the padding and the kernel size are multiples of the decimation factor
+    front = -n_pad % decimation
+    kernel = np.concatenate((np.zeros(front, dtype=kernel.dtype), kernel))
+    kernel = np.concatenate((kernel, np.zeros(-kernel.size % decimation, dtype=kernel.dtype)))
+    num_phases = kernel.size // decimation
+    return _PolyphaseFilter(
+        decimation=decimation,
+        offset=(n_pad + front) // decimation,
+        phases=kernel.reshape(num_phases, decimation).T,
+    )
+
+
+def _polyphase_decimate(
+    signal: np.ndarray, polyphase: _PolyphaseFilter, num_samples: int, dtype: type
+) -> np.ndarray:
+    """Apply a polyphase filter to the last dimension of a signal.
+
+    Each kernel window consists of consecutive blocks of the zero-padded signal.
+    All blocks are multiplied with all kernel phases in one matrix product,
+    output sample k is the sum of block k + j multiplied with kernel phase j.
+    The padding consists of whole blocks, which do not contribute, such that the signal is only copied
+    if the readout is not a multiple of the decimation factor.
+    """
+    decimation = polyphase.decimation
+    real_type = np.finfo(dtype).dtype
+    phases = polyphase.phases
+    num_phases = phases.shape[1]
+    if np.iscomplexobj(signal):
+        signal = signal.astype(dtype, copy=False)
+        phases = phases.astype(dtype if np.iscomplexobj(phases) else real_type, copy=False)
+    else:
+        signal = signal.astype(real_type, copy=False)
+        if np.iscomplexobj(phases):
+            # Real and imaginary kernel phases in one real matrix product
+            phases = np.concatenate((phases.real, phases.imag), axis=1)
+        phases = phases.astype(real_type, copy=False)
+
+    batch_shape = signal.shape[:-1]
+    num_full_blocks, num_tail = divmod(signal.shape[-1], decimation)
+    num_blocks = max(polyphase.offset + num_full_blocks + 1, num_samples - 1 + num_phases)
+    # Block phases with dimensions [..., phases, blocks], such that the phases are accumulated along contiguous rows
+    block_phases = np.zeros((*batch_shape, phases.shape[1], num_blocks), dtype=np.result_type(signal, phases))
+
+    offset = polyphase.offset
+    blocks = signal[..., :num_full_blocks * decimation].reshape(*batch_shape, num_full_blocks, decimation)
+    block_phases[..., offset:offset + num_full_blocks] = phases.T @ blocks.swapaxes(-1, -2)
+    if num_tail > 0:
+        # Last block is zero-padded
+        tail = np.zeros((*batch_shape, decimation), dtype=signal.dtype)
+        tail[..., :num_tail] = signal[..., num_full_blocks * decimation:]
+        block_phases[..., offset + num_full_blocks] = tail @ phases
+
+    signal_filtered = np.zeros((*batch_shape, num_samples), dtype=dtype)
+    if phases.shape[1] > num_phases:
+        # Real and imaginary part are accumulated separately, without a complex copy of the block phases
+        for j in range(num_phases):
+            signal_filtered.real += block_phases[..., j, j:j + num_samples]
+            signal_filtered.imag += block_phases[..., num_phases + j, j:j + num_samples]
+        return signal_filtered
+    for j in range(num_phases):
+        signal_filtered += block_phases[..., j, j:j + num_samples]
     return signal_filtered
 
 
+def _fir_decimate(signal: np.ndarray, taps: np.ndarray, decimation: int, num_samples: int) -> np.ndarray:
+    """Apply a short centered FIR filter to the last dimension of a signal and decimate the output.
+
+    Output sample k is ``sum(taps[i] * signal[k * decimation - n_pad + i])`` with ``n_pad = (taps.size - 1) // 2``.
+    The filter is calculated by one strided slice per tap, zero taps, e.g. of half-band filters, are skipped.
+    This is faster than the polyphase decomposition for small decimation factors.
+    """
+    n_pad = (taps.size - 1) // 2
+    padded_size = max(signal.shape[-1] + n_pad, (num_samples - 1) * decimation + taps.size)
+    padded = np.zeros((*signal.shape[:-1], padded_size), dtype=signal.dtype)
+    padded[..., n_pad:n_pad + signal.shape[-1]] = signal
+    signal_filtered = np.zeros((*signal.shape[:-1], num_samples), dtype=signal.dtype)
+    end = (num_samples - 1) * decimation + 1
+    for i in np.flatnonzero(taps):
+        signal_filtered += taps[i] * padded[..., i:i + end:decimation]
+    return signal_filtered
+
+
+@lru_cache(maxsize=32)
+def _demodulation_tables(
+    num_samples: int, frequency: float, sample_rate: float, decimation: int, method: str, overlap: int, dtype: str
+) -> _DemodulationTables:
+    """Calculate modulated kernel and output rotation of the fused demodulation and decimation."""
+    match method:
+        case "fir":
+            kernel = fir_kernel(decimation)
+            n_pad = 10 * decimation
+            num_output = -(-num_samples // decimation)
+        case "avg":
+            kernel = moving_average_kernel(decimation, overlap)
+            n_pad = int(kernel.size / 2)
+            num_output = round(num_samples / decimation)
+        case _:
+            raise ValueError(f"Unknown decimation method: {method}")
+    return _modulated_tables(kernel, decimation, n_pad, num_output, frequency, sample_rate, dtype)
+
+
+def _modulated_tables(
+    kernel: np.ndarray,
+    decimation: int,
+    n_pad: int,
+    num_output: int,
+    frequency: float,
+    sample_rate: float,
+    dtype: str,
+) -> _DemodulationTables:
+    """Modulate a decimation kernel by the mixer and calculate the output rotation."""
+    # Output sample k is the sum of kernel[i] * signal[n] * mixer[n] with n = k * decimation - n_pad + i,
+    # mixer[n] = mixer phase of the window start * mixer[i]
+    omega = 2 * np.pi * frequency / sample_rate
+    modulated_kernel = (kernel * np.exp(1j * omega * np.arange(kernel.size))).astype(dtype)
+    rotation = np.exp(1j * omega * (np.arange(num_output) * decimation - n_pad)).astype(dtype)
+    rotation.flags.writeable = False
+    polyphase = _polyphase_filter(modulated_kernel, decimation, n_pad)
+    polyphase.phases.flags.writeable = False
+    return _DemodulationTables(polyphase=polyphase, rotation=rotation)
+
+
 def filter_cic_fir_comp(signal, decimation, number_of_stages):
     """Decimate data using CIC filter and FIR compensation.
 
@@ -93,18 +347,17 @@ def filter_cic_fir_comp(signal, decimation, number_of_stages):
     cic_samples = 2 * (signal.shape[-1] // decimation)
     cic_decimation = signal.shape[-1] // cic_samples
 
-    # CIC integrator Stages
-    for _ in range(number_of_stages):
-        signal = np.cumsum(signal, axis=-1)
+    # CIC integrator stages, the first stage copies the signal, further stages are calculated in place
+    signal = np.cumsum(signal, axis=-1)
+    for _ in range(number_of_stages - 1):
+        np.cumsum(signal, axis=-1, out=signal)
 
     # CIC decimation, truncate decimated signal to cic_samples (throw last sample if present)
-    decimated_signal = signal[..., :: int(cic_decimation)][..., :cic_samples]
+    decimated_signal = signal[..., :: int(cic_decimation)][..., :cic_samples].copy()
 
-    # Comb Stages
+    # Comb stages in place, the sample before the first sample is zero
     for _ in range(number_of_stages):
-        delayed_signal = np.zeros_like(decimated_signal)
-        delayed_signal[..., 1:] = decimated_signal[..., :-1]
-        decimated_signal = decimated_signal - delayed_signal
+        decimated_signal[..., 1:] -= decimated_signal[..., :-1]
 
     # Normalization
     gain = np.power(cic_decimation, number_of_stages)
@@ -112,3 +365,450 @@ def filter_cic_fir_comp(signal, decimation, number_of_stages):
 
     # Apply FIR decimation with decimation factor of 2 along readout axis
     return decimate(x=decimated_signal, q=2, ftype="fir", axis=-1)
+
+
+def cic_decimate(
+    signal: np.ndarray, decimation: int, number_of_stages: int, input_bits: int | None = None
+) -> np.ndarray:
+    """Decimate integer samples by a CIC filter with exact integer arithmetic.
+
+    Integrators and combs are calculated with 64 bit integers, which wrap around on overflow.
+    The integrator values overflow for long readouts, but the output is exact as long as it fits into 64 bits,
+    i.e. ``input_bits + number_of_stages * log2(decimation) <= 64``.
+    The combs are calculated in place on the decimated signal.
+    Output sample k is the sum over the CIC impulse response of the samples up to ``(k + 1) * decimation - 1``.
+
+    Parameters
+    ----------
+    signal
+        Integer samples, e.g. int16 raw data, decimation is applied to the last dimension
+    decimation
+        Decimation factor of the CIC filter
+    number_of_stages
+        Number of integrator and comb stages
+    input_bits, optional
+        Number of bits (including sign) of the input samples, by default the bits of the signal data type
+
+    Returns
+    -------
+        Decimated signal as int64 with a DC gain of ``decimation**number_of_stages``
+
+    Raises
+    ------
+    ValueError
+        Signal is not of integer type or the output exceeds 64 bits
+    """
+    if not np.issubdtype(signal.dtype, np.integer):
+        raise ValueError(f"CIC decimation requires integer samples, got {signal.dtype}.")
+    _check_cic_bits(np.iinfo(signal.dtype).bits if input_bits is None else input_bits, decimation, number_of_stages)
+    return _cic_decimate_inplace(signal.astype(np.int64), decimation, number_of_stages)
+
+
+def _check_cic_bits(input_bits: int, decimation: int, number_of_stages: int) -> None:
+    """Raise a ValueError, if the CIC output exceeds 64 bits."""
+    if (output_bits := input_bits + math.ceil(number_of_stages * math.log2(decimation))) > 64:
+        raise ValueError(
+            f"CIC output requires {output_bits} bits, reduce decimation or number of stages of the CIC filter."
+        )
+
+
+def _default_cic_decimation(decimation: int, input_bits: int, number_of_stages: int) -> int:
+    """Return half the decimation factor if it is even, otherwise the decimation factor.
+
+    If the CIC output of this factor exceeds 64 bits, the largest divisor of the decimation factor is returned,
+    of which the CIC output fits into 64 bits.
+    """
+    preferred = decimation // 2 if decimation % 2 == 0 else decimation
+    for cic_decimation in range(preferred, 1, -1):
+        output_bits = input_bits + math.ceil(number_of_stages * math.log2(cic_decimation))
+        if decimation % cic_decimation == 0 and output_bits <= 64:
+            return cic_decimation
+    return 1
+
+
+def _cic_decimate_inplace(integrated: np.ndarray, decimation: int, number_of_stages: int) -> np.ndarray:
+    """Apply the CIC filter to int64 samples, the integrators overwrite the samples."""
+    # Integrator stages with wrap around arithmetic
+    for _ in range(number_of_stages):
+        np.cumsum(integrated, axis=-1, out=integrated)
+
+    # Decimation and comb stages in place
+    decimated = integrated[..., decimation - 1::decimation].copy()
+    for _ in range(number_of_stages):
+        decimated[..., 1:] -= decimated[..., :-1]
+    return decimated
+
+
+def cic_compensation_taps(
+    cic_decimation: int,
+    number_of_stages: int,
+    fir_decimation: int = 2,
+    num_taps: int | None = None,
+    input_decimation: int | None = None,
+    passband: float = 0.8,
+) -> np.ndarray:
+    """Design the FIR filter, which follows a CIC filter and compensates its passband droop.
+
+    The CIC filter attenuates the passband by ``|sin(pi f R) / (R sin(pi f))|**N``.
+    The FIR filter is designed at its input rate with the inverse response in its passband
+    and is a low pass filter for the subsequent decimation by ``fir_decimation``.
+    The passband ends at 80 % of the output Nyquist frequency by default.
+
+    Parameters
+    ----------
+    cic_decimation
+        Decimation factor R of the CIC filter
+    number_of_stages
+        Number of stages N of the CIC filter
+    fir_decimation, optional
+        Decimation factor of the FIR filter, by default 2
+    num_taps, optional
+        Number of taps, by default ``20 * fir_decimation + 1``
+    input_decimation, optional
+        Decimation factor between the CIC input and the FIR input, by default the CIC decimation factor.
+        Larger if further decimation stages are placed between CIC and FIR filter.
+    passband, optional
+        Passband edge relative to the output Nyquist frequency, by default 0.8
+
+    Returns
+    -------
+        Filter taps with a DC gain of 1
+    """
+    num_taps = 20 * fir_decimation + 1 if num_taps is None else num_taps
+    input_decimation = cic_decimation if input_decimation is None else input_decimation
+    # Frequency grid relative to the Nyquist frequency of the FIR input rate
+    cutoff = 1 / fir_decimation
+    freqs = np.linspace(0, passband * cutoff, 64)
+    cic_frequency = freqs / 2 / input_decimation
+    with np.errstate(invalid="ignore", divide="ignore"):
+        droop = np.sin(np.pi * cic_frequency * cic_decimation) / (cic_decimation * np.sin(np.pi * cic_frequency))
+    droop[0] = 1
+    gains = np.abs(droop) ** -number_of_stages
+    if cutoff < 1:
+        freqs, gains = np.append(freqs, [cutoff, 1]), np.append(gains, [0, 0])
+    else:
+        freqs, gains = np.append(freqs, 1), np.append(gains, gains[-1])
+    taps = firwin2(num_taps, freqs, gains)
+    return taps / np.sum(taps)
+
+
+@lru_cache(maxsize=32)
+def _integer_mixer(num_samples: int, frequency: float, sample_rate: float, mixer_bits: int) -> np.ndarray:
+    """Return the quantized mixer as int32 with dimensions [real/imaginary, samples]."""
+    signal = mixer(num_samples, frequency, sample_rate)
+    quantized = np.round(np.stack((signal.real, signal.imag)) * (2**mixer_bits - 1)).astype(np.int32)
+    quantized.flags.writeable = False
+    return quantized
+
+
+def filter_cic_int(
+    signal: np.ndarray,
+    frequency: float,
+    sample_rate: float,
+    decimation: int,
+    number_of_stages: int = 5,
+    cic_decimation: int | None = None,
+    mixer_bits: int = 14,
+    dtype: type = np.complex128,
+) -> np.ndarray:
+    """Demodulate and decimate integer samples with an integer CIC filter and a droop compensating FIR filter.
+
+    The samples are mixed with a quantized integer mixer and decimated by an exact integer CIC filter,
+    see ``cic_decimate``. The CIC output is normalized and decimated by the remaining decimation factor
+    with the FIR filter of ``cic_compensation_taps``, which compensates the passband droop of the CIC filter.
+
+    The signal size after decimation is ``signal.shape[-1] // decimation``.
+
+    Parameters
+    ----------
+    signal
+        Integer samples, e.g. int16 raw data, decimation is applied to the last dimension
+    frequency
+        Demodulation frequency in Hz
+    sample_rate
+        Sample rate of the signal in Hz
+    decimation
+        Total decimation factor
+    number_of_stages, optional
+        Number of CIC stages, by default 5
+    cic_decimation, optional
+        Decimation factor of the CIC filter, must divide the total decimation factor.
+        By default half the decimation factor if it is even, otherwise the decimation factor.
+        If the CIC output of the default factor exceeds 64 bits, the largest divisor of the decimation factor
+        with an output of max. 64 bits is used and the remaining decimation is done by the FIR filter.
+    mixer_bits, optional
+        Bits of the quantized mixer amplitude, by default 14
+    dtype, optional
+        Complex output data type, by default complex128.
+        With complex64, the compensation filter is calculated in single precision.
+
+    Returns
+    -------
+        Demodulated and decimated complex signal
+
+    Raises
+    ------
+    ValueError
+        CIC decimation factor does not divide the decimation factor
+        or the CIC output of the given CIC decimation factor exceeds 64 bits
+    """
+    # Magnitude of the mixer product is below 2**(signal bits - 1 + mixer bits)
+    input_bits = np.iinfo(signal.dtype).bits + mixer_bits
+    if cic_decimation is None:
+        cic_decimation = _default_cic_decimation(decimation, input_bits, number_of_stages)
+    if decimation % cic_decimation != 0:
+        raise ValueError(f"CIC decimation {cic_decimation} does not divide the decimation factor {decimation}.")
+    fir_decimation = decimation // cic_decimation
+    num_samples = signal.shape[-1]
+
+    # Integer mixer, real and imaginary part are stacked in the first dimension
+    integer_mixer = _integer_mixer(num_samples, frequency, sample_rate, mixer_bits)
+    _check_cic_bits(input_bits, cic_decimation, number_of_stages)
+    mixed = np.multiply(
+        signal[None, ...], integer_mixer.reshape((2,) + (1,) * (signal.ndim - 1) + (num_samples,)), dtype=np.int64
+    )
+    cic_output = _cic_decimate_inplace(mixed, cic_decimation, number_of_stages)
+
+    # Normalize by CIC gain and mixer amplitude
+    gain = float(cic_decimation) ** number_of_stages * (2**mixer_bits - 1)
+    decimated = (cic_output[0] + 1j * cic_output[1]) / gain
+
+    taps = cic_compensation_taps(cic_decimation, number_of_stages, fir_decimation)
+    polyphase = _polyphase_filter(taps, fir_decimation, n_pad=(taps.size - 1) // 2)
+    return _polyphase_decimate(decimated, polyphase, num_samples // decimation, dtype=dtype)
+
+
+@dataclass(frozen=True, eq=False)
+class DecimationStage:
+    """Stage of a multi-stage decimation."""
+
+    name: str
+    """Type of the stage, "cic", "half-band", "compensation" or "low-pass"."""
+
+    decimation: int
+    """Decimation factor of the stage."""
+
+    taps: np.ndarray
+    """Filter taps with a DC gain of 1."""
+
+    num_output: int
+    """Number of output samples of a readout."""
+
+
+@dataclass(frozen=True, eq=False)
+class DecimationPlan:
+    """Factorization of a decimation factor into stages, which are applied one after another."""
+
+    decimation: int
+    """Total decimation factor."""
+
+    num_samples: int
+    """Number of readout samples."""
+
+    stages: tuple[DecimationStage, ...]
+    """Decimation stages in the order of their application."""
+
+    @property
+    def num_output(self) -> int:
+        """Number of decimated samples."""
+        return self.stages[-1].num_output
+
+    @property
+    def macs_per_sample(self) -> float:
+        """Number of multiply-accumulate operations per input sample, a measure of the computational cost."""
+        rate, macs = 1.0, 0.0
+        for stage in self.stages:
+            macs += rate * stage.taps.size / stage.decimation
+            rate /= stage.decimation
+        return macs
+
+    def __str__(self) -> str:
+        """Return the stages, e.g. ``cic(25) -> half-band(2) -> compensation(2)``."""
+        return " -> ".join(f"{stage.name}({stage.decimation})" for stage in self.stages)
+
+
+def cic_kernel(decimation: int, number_of_stages: int) -> np.ndarray:
+    """Return the impulse response of a CIC filter, normalized to a DC gain of 1.
+
+    Parameters
+    ----------
+    decimation
+        Decimation factor R of the CIC filter
+    number_of_stages
+        Number of stages N of the CIC filter
+
+    Returns
+    -------
+        Kernel with ``number_of_stages * (decimation - 1) + 1`` taps
+    """
+    boxcar = np.ones(decimation)
+    kernel = np.ones(1)
+    for _ in range(number_of_stages):
+        kernel = np.convolve(kernel, boxcar)
+    return kernel / np.sum(kernel)
+
+
+def half_band_taps(passband: float, attenuation: float = 60.) -> np.ndarray:
+    """Design a Kaiser windowed half-band low pass filter for the decimation by 2.
+
+    The number of taps is estimated from the transition band between the passband edge and the
+    frequency, which is aliased to the passband edge by the decimation.
+
+    Parameters
+    ----------
+    passband
+        Passband edge relative to the input sample rate, must be below 0.25
+    attenuation, optional
+        Stopband attenuation in dB, by default 60
+
+    Returns
+    -------
+        Filter taps with a DC gain of 1
+    """
+    # Transition width relative to the input Nyquist frequency
+    num_taps, beta = kaiserord(attenuation, 2 * (0.5 - 2 * passband))
+    num_taps |= 1
+    taps = firwin(num_taps, 0.5, window=("kaiser", beta))
+    # Every second tap of a half-band filter is zero, except the center tap
+    center = num_taps // 2
+    taps[(np.arange(num_taps) - center) % 2 == 0] = 0
+    taps[center] = 0.5
+    return taps / np.sum(taps)
+
+
+@lru_cache(maxsize=32)
+def plan_decimation(
+    decimation: int,
+    num_samples: int,
+    number_of_stages: int = 4,
+    max_half_band_stages: int = 2,
+    attenuation: float = 60.,
+    cutoff: float = 0.25,
+) -> DecimationPlan:
+    """Factor a decimation factor into a CIC stage, half-band stages and a droop compensating stage.
+
+    All factors of 2 up to ``max_half_band_stages + 1`` are taken from the decimation factor.
+    The remaining factor is decimated by a CIC filter, which is cheap at the full input rate.
+    It is followed by half-band filters, each decimating by 2, and a FIR filter, which compensates
+    the droop of the CIC filter and decimates by the last factor of 2 (or 1 for an odd decimation factor).
+    The response is flat up to 80 % of the output Nyquist frequency.
+    Without decimation (decimation factor 1), the plan consists of a single low pass stage at ``cutoff``,
+    which removes the mixing image.
+    Plans and their filters are cached per decimation factor and readout size.
+
+    Parameters
+    ----------
+    decimation
+        Total decimation factor
+    num_samples
+        Number of readout samples
+    number_of_stages, optional
+        Number of stages of the CIC filter, by default 4
+    max_half_band_stages, optional
+        Max. number of half-band stages, by default 2
+    attenuation, optional
+        Stopband attenuation of the half-band stages in dB, by default 60
+    cutoff, optional
+        Cutoff frequency of the low pass stage without decimation relative to the input sample rate,
+        must be below 0.5, by default 0.25
+
+    Returns
+    -------
+        Decimation plan with ``ceil(num_samples / decimation)`` output samples
+
+    Raises
+    ------
+    ValueError
+        Decimation factor is smaller than 1
+    """
+    if decimation < 1:
+        raise ValueError(f"Invalid decimation factor: {decimation}")
+    if decimation == 1:
+        # The output bandwidth equals the input bandwidth, a low pass filter is required to suppress the image
+        taps = firwin(81, 2 * cutoff, window="hamming")
+        stage = DecimationStage(name="low-pass", decimation=1, taps=taps / np.sum(taps), num_output=num_samples)
+        return DecimationPlan(decimation=decimation, num_samples=num_samples, stages=(stage,))
+    num_factors_2 = 0
+    while decimation % 2 ** (num_factors_2 + 1) == 0 and num_factors_2 <= max_half_band_stages:
+        num_factors_2 += 1
+    cic_decimation = decimation // 2**num_factors_2
+    # Passband edge relative to the input sample rate
+    passband = 0.8 * 0.5 / decimation
+
+    stages: list[DecimationStage] = []
+    rate = 1
+    num_output = num_samples
+
+    def add_stage(name: str, stage_decimation: int, taps: np.ndarray) -> None:
+        nonlocal rate, num_output
+        rate *= stage_decimation
+        num_output = -(-num_output // stage_decimation)
+        stages.append(DecimationStage(name=name, decimation=stage_decimation, taps=taps, num_output=num_output))
+
+    if cic_decimation > 1:
+        add_stage("cic", cic_decimation, cic_kernel(cic_decimation, number_of_stages))
+    for _ in range(num_factors_2 - 1):
+        add_stage("half-band", 2, half_band_taps(passband * rate, attenuation))
+    fir_decimation = 2 if num_factors_2 > 0 else 1
+    # The compensation filter runs at the lowest rate, a long filter with a wide passband costs little
+    taps = cic_compensation_taps(
+        cic_decimation, number_of_stages, fir_decimation, 40 * fir_decimation + 1, input_decimation=rate, passband=0.9
+    )
+    add_stage("compensation", fir_decimation, taps)
+    return DecimationPlan(decimation=decimation, num_samples=num_samples, stages=tuple(stages))
+
+
+@lru_cache(maxsize=32)
+def _multistage_tables(
+    plan: DecimationPlan, frequency: float, sample_rate: float, dtype: str
+) -> _DemodulationTables:
+    """Calculate modulated kernel and output rotation of the first stage of a decimation plan."""
+    stage = plan.stages[0]
+    return _modulated_tables(
+        stage.taps, stage.decimation, (stage.taps.size - 1) // 2, stage.num_output, frequency, sample_rate, dtype
+    )
+
+
+def decimate_multistage(
+    signal: np.ndarray,
+    frequency: float,
+    sample_rate: float,
+    decimation: int,
+    dtype: type = np.complex128,
+) -> np.ndarray:
+    """Demodulate and decimate a signal by the stages of a decimation plan, see ``plan_decimation``.
+
+    The first stage is applied with the demodulation in one step, see ``demodulate_decimate``.
+    The subsequent stages filter the complex signal at the reduced sample rates.
+    Without decimation, the signal is low pass filtered at half the distance between zero frequency
+    and the mixing image at twice the demodulation frequency.
+
+    The signal size after decimation is ``ceil(signal.shape[-1] / decimation)``.
+
+    Parameters
+    ----------
+    signal
+        Real or complex signal, readout is the last dimension
+    frequency
+        Demodulation frequency in Hz
+    sample_rate
+        Sample rate of the signal in Hz
+    decimation
+        Total decimation factor
+    dtype, optional
+        Complex output data type, by default complex128
+
+    Returns
+    -------
+        Demodulated and decimated signal
+    """
+    if decimation == 1 and (image := abs(2 * frequency / sample_rate - round(2 * frequency / sample_rate))) > 0:
+        plan = plan_decimation(decimation, signal.shape[-1], cutoff=image / 2)
+    else:
+        plan = plan_decimation(decimation, signal.shape[-1])
+    tables = _multistage_tables(plan, frequency, sample_rate, np.dtype(dtype).name)
+    decimated = _polyphase_decimate(signal, tables.polyphase, tables.rotation.size, dtype=dtype) * tables.rotation
+    real_type = np.finfo(dtype).dtype
+    for stage in plan.stages[1:]:
+        decimated = _fir_decimate(decimated, stage.taps.astype(real_type), stage.decimation, stage.num_output)
+    return decimated
@@ -109,6 +109,50 @@ def get_instances(path_to_config: str) -> tuple[SequenceProvider, TxCard, RxCard
     return (config["SequenceProvider"], config["TxCard"], config["RxCard"])
 
 
+def get_sequence_provider(path_to_config: str) -> SequenceProvider:
+    """Construct only the sequence provider from yaml configuration file.
+
+    In contrast to ``get_instances``, transmit and receive card are not constructed,
+    their parameterization is read as mapping.
+
+    Parameters
+    ----------
+    path_to_config
+        Path to configuration yaml file
+
+    Returns
+    -------
+        SequenceProvider instance
+    """
+    file_path = os.path.normpath(path_to_config)
+    if not file_path.endswith(".yaml"):
+        raise FileNotFoundError("Invalid configuration file, yaml file required.")
+    with open(file_path, "rb") as file:
+        config = yaml.load(file, Loader=ProviderLoader)  # noqa: S506
+
+    # Set output limits of sequence provider to the maximum amplitudes from transmit card
+    config["SequenceProvider"].output_limits = config["TxCard"]["max_amplitude"]
+
+    return config["SequenceProvider"]
+
+
+def mapping_constructor(loader: yaml.SafeLoader, node: yaml.nodes.MappingNode) -> dict:
+    """Construct a dictionary instead of an object.
+
+    Parameters
+    ----------
+    loader
+        yaml loader
+    node
+        constructor mapping
+
+    Returns
+    -------
+        Dictionary of the constructor mapping
+    """
+    return loader.construct_mapping(node, deep=True)
+
+
 # >> Create yaml loader object
 Loader = yaml.SafeLoader
 
@@ -117,3 +161,14 @@ Loader.add_constructor("!RxCard", rx_card_constructor)
 Loader.add_constructor("!TxCard", tx_card_constructor)
 Loader.add_constructor("!SequenceProvider", sequence_provider_constructor)
 Loader.add_constructor("!Opts", opts_constructor)
+
+
+# >> Yaml loader, which only constructs the sequence provider
+class ProviderLoader(yaml.SafeLoader):
+    """Yaml loader, which reads transmit and receive card parameterization as mapping."""
+
+
+ProviderLoader.add_constructor("!RxCard", mapping_constructor)
+ProviderLoader.add_constructor("!TxCard", mapping_constructor)
+ProviderLoader.add_constructor("!SequenceProvider", sequence_provider_constructor)
+ProviderLoader.add_constructor("!Opts", opts_constructor)
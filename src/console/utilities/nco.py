@@ -0,0 +1,172 @@
+r"""Numerically controlled oscillator (NCO) for carrier and reference signal generation.
+
+The phase of the oscillator is represented by an unsigned 64 bit integer phase word, where the full
+range of the phase word corresponds to one period.
+Phase accumulation is pure integer arithmetic which wraps around at the end of a period,
+such that the phase can be continued across blocks without any loss of precision.
+Carrier samples are obtained by lookup in a table which contains one period of the complex carrier.
+
+Phase error bound
+-----------------
+The phase error of the generated carrier consists of three contributions:
+
+- Table lookup: The phase word is rounded to the nearest table entry,
+  the error is at most :math:`\pi / 2^{b}` for a table with :math:`2^{b}` entries.
+- Phase increment: The increment per sample is rounded to the phase word resolution,
+  the error accumulates to at most :math:`\pi n / 2^{64}` after :math:`n` samples.
+- Start phase: The start phase is rounded to the phase word resolution, the error is at most
+  :math:`\pi / 2^{64}`.
+
+For the default table size of :math:`2^{18}` entries, the phase error is below
+:math:`1.2 \cdot 10^{-5}` rad for up to :math:`2^{40}` samples (15 h at 20 MHz).
+The corresponding amplitude error is below 0.4 LSB for a full scale int16 waveform.
+The digital reference signal is calculated from the phase word directly and is exact up to the
+phase increment and start phase error.
+"""
+from fractions import Fraction
+from functools import lru_cache
+
+import numpy as np
+
+PHASE_WORD_BITS = 64
+DEFAULT_TABLE_BITS = 18
+
+_PHASE_RANGE = 2**PHASE_WORD_BITS
+
+
+def phase_word(cycles: float | Fraction) -> np.uint64:
+    """Convert a phase given in cycles to a phase word.
+
+    Parameters
+    ----------
+    cycles
+        Phase in cycles (1 cycle corresponds to 2 pi), only the fractional part is kept.
+
+    Returns
+    -------
+        Phase word rounded to the nearest integer
+    """
+    return np.uint64(round(Fraction(cycles) * _PHASE_RANGE) % _PHASE_RANGE)
+
+
+@lru_cache(maxsize=4)
+def phase_table(table_bits: int = DEFAULT_TABLE_BITS) -> np.ndarray:
+    r"""Return one period of the complex carrier :math:`e^{2 \pi i k / 2^{b}}`.
+
+    Parameters
+    ----------
+    table_bits, optional
+        Number of address bits b of the table, by default 18
+
+    Returns
+    -------
+        Read-only complex table with :math:`2^{b}` entries
+    """
+    table = np.exp(2j * np.pi * np.arange(2**table_bits) / 2**table_bits)
+    table.flags.writeable = False
+    return table
+
+
+class NumericallyControlledOscillator:
+    """Phase accumulator based oscillator.
+
+    Example
+    -------
+    >>> nco = NumericallyControlledOscillator(frequency=2e6, dwell_time=5e-8)
+    >>> phase = nco.phase(num_samples=1000)
+    >>> carrier = nco.carrier(phase)
+    >>> next_phase = nco.phase(num_samples=1000, start=nco.advance(phase[0], 1000))
+    """
+
+    def __init__(self, frequency: float, dwell_time: float, table_bits: int = DEFAULT_TABLE_BITS):
+        """Initialize the oscillator.
+
+        Parameters
+        ----------
+        frequency
+            Oscillator frequency in Hz
+        dwell_time
+            Time between two samples in s
+        table_bits, optional
+            Number of address bits of the carrier table, by default 18
+        """
+        self.frequency = frequency
+        self.dwell_time = dwell_time
+        self.table_bits = table_bits
+        # Phase increment per sample, calculated from the exact rational frequency and dwell time
+        self.phase_increment = phase_word(Fraction(frequency) * Fraction(dwell_time))
+
+        self._table = phase_table(table_bits)
+        self._shift = np.uint64(PHASE_WORD_BITS - table_bits)
+        # Half a table step, added to round to the nearest table entry
+        self._rounding = np.uint64(1 << (PHASE_WORD_BITS - table_bits - 1))
+
+    def advance(self, start: np.uint64, num_samples: int) -> np.uint64:
+        """Return the phase word after a given number of samples.
+
+        Parameters
+        ----------
+        start
+            Phase word at sample 0
+        num_samples
+            Number of samples to advance
+
+        Returns
+        -------
+            Phase word at sample num_samples
+        """
+        return np.uint64((int(start) + num_samples * int(self.phase_increment)) % _PHASE_RANGE)
+
+    def phase(self, num_samples: int | np.ndarray, start: np.uint64 | np.ndarray = np.uint64(0)) -> np.ndarray:
+        """Calculate the phase words of consecutive samples.
+
+        Parameters
+        ----------
+        num_samples
+            Number of samples or array of sample indices relative to the start phase
+        start, optional
+            Phase word at sample index 0, scalar or array which is broadcasted with the sample indices,
+            by default 0
+
+        Returns
+        -------
+            Phase words as uint64 array
+        """
+        if isinstance(num_samples, np.ndarray):
+            index = num_samples.astype(np.uint64, copy=False)
+        else:
+            index = np.arange(num_samples, dtype=np.uint64)
+        # Integer overflow wraps around at the end of a period
+        return index * self.phase_increment + np.asarray(start, dtype=np.uint64)
+
+    def carrier(self, phase: np.ndarray) -> np.ndarray:
+        """Look up the complex carrier samples for given phase words.
+
+        Parameters
+        ----------
+        phase
+            Phase words as uint64 array
+
+        Returns
+        -------
+            Complex carrier samples
+        """
+        return self._table[(phase + self._rounding) >> self._shift]
+
+    @staticmethod
+    def reference(phase: np.ndarray) -> np.ndarray:
+        """Calculate the digital reference signal for given phase words.
+
+        The reference signal is high if the real part of the carrier is positive,
+        i.e. if the phase is within [-1/4, 1/4) cycles.
+
+        Parameters
+        ----------
+        phase
+            Phase words as uint64 array
+
+        Returns
+        -------
+            Boolean reference signal
+        """
+        return (phase + np.uint64(1 << (PHASE_WORD_BITS - 2))) < np.uint64(1 << (PHASE_WORD_BITS - 1))
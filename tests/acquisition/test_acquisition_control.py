@@ -0,0 +1,361 @@
+"""Test the acquisition control with the simulated spectrum driver."""
+import asyncio
+import math
+import os
+import threading
+import time
+from dataclasses import replace
+
+import numpy as np
+import pypulseq as pp
+import pytest
+
+import console
+from console.interfaces.enums import DDCMethod, Precision
+from console.spcm_control.acquisition_control import AcquisitionCancelledError, AcquisitionControl
+from console.spcm_control.spcm import simulation
+
+CONFIG = os.path.join(os.path.dirname(__file__), "..", "..", "examples", "example_device_config.yaml")
+
+
+@pytest.fixture()
+def acquisition_control(tmp_path):
+    """Construct an acquisition control with simulated cards, data is written to a temporary directory."""
+    parameter = console.parameter
+    simulation.configure(consumption_rate=math.inf)
+    acq = AcquisitionControl(CONFIG, nexus_data_dir=str(tmp_path), sequence_cache_bytes=0)
+    console.parameter.save_on_mutation = False
+    yield acq
+    acq.tx_card.disconnect()
+    acq.rx_card.disconnect()
+    console.parameter = parameter
+
+
+@pytest.fixture()
+def multi_gate_sequence(test_sequence) -> pp.Sequence:
+    """Extend the test sequence by ADC events of different size, separated by delays.
+
+    The ADC events coincide with an RF pulse, which is recorded by the simulated receive card.
+    """
+    for num_samples in [100, 200, 100]:
+        test_sequence.add_block(pp.make_delay(1e-3))
+        test_sequence.add_block(
+            pp.make_block_pulse(flip_angle=np.pi / 2, duration=num_samples * 1e-5, delay=1e-4),
+            pp.make_adc(num_samples=num_samples, dwell=1e-5),
+        )
+    return test_sequence
+
+
+@pytest.mark.parametrize("ddc_method", [DDCMethod.FIR, DDCMethod.CIC, DDCMethod.MULTISTAGE])
+def test_pipelined_processing(acquisition_control, multi_gate_sequence, ddc_method):
+    """Test if gates which are processed during the acquisition yield the result of the processing per average."""
+    console.parameter.num_averages = 2
+    console.parameter.ddc_method = ddc_method
+    console.parameter.decimation = 200
+    acquisition_control.set_sequence(multi_gate_sequence)
+
+    batch = acquisition_control.run()
+    acquisition_control.ddc_workers = 2
+    acquisition_control.ddc_queue_size = 2
+    pipelined = acquisition_control.run()
+
+    # Gates are grouped by readout size: 200 samples (2 gates) and 100 samples (2 gates)
+    assert [data.shape for data in pipelined._raw] == [(2, 2, 2, 200), (2, 2, 2, 100)]
+    for expected, data in zip(batch._raw, pipelined._raw, strict=True):
+        assert data.shape == expected.shape
+        assert np.allclose(data, expected)
+    for expected, data in zip(batch.unprocessed_data, pipelined.unprocessed_data, strict=True):
+        assert np.array_equal(data, expected)
+    assert np.abs(pipelined._raw[1]).max() > 0
+    # DMA buffers of the first run are reused
+    assert pipelined.meta["dma_buffer_pool"]["allocations"] == batch.meta["dma_buffer_pool"]["allocations"]
+
+
+@pytest.mark.parametrize("ddc_method", list(DDCMethod))
+@pytest.mark.parametrize("ddc_workers", [0, 2])
+def test_single_precision(acquisition_control, multi_gate_sequence, ddc_method, ddc_workers):
+    """Test if the post-processing in single precision is validated against the float64 post-processing."""
+    console.parameter.ddc_method = ddc_method
+    console.parameter.decimation = 200
+    console.parameter.precision = Precision.SINGLE
+    acquisition_control.ddc_workers = ddc_workers
+    acquisition_control.validate_precision = True
+    acquisition_control.set_sequence(multi_gate_sequence)
+
+    single = acquisition_control.run()
+    assert all(data.dtype == np.complex64 for data in single._raw)
+    assert all(data.dtype == np.float32 for data in single.unprocessed_data)
+    validation = single.meta["precision_validation"]
+    assert validation["gates"] == 4
+    assert 0 < validation["relative_error"] < 1e-5
+
+    console.parameter.precision = Precision.DOUBLE
+    double = acquisition_control.run()
+    assert "precision_validation" not in double.meta
+    for expected, data in zip(double._raw, single._raw, strict=True):
+        assert np.allclose(data, expected, atol=1e-5 * validation["max_magnitude"])
+
+
+@pytest.mark.parametrize("ddc_workers", [0, 2])
+def test_running_mean(acquisition_control, multi_gate_sequence, ddc_workers):
+    """Test if the running mean mode yields mean and variance of the individual averages."""
+    console.parameter.num_averages = 3
+    console.parameter.decimation = 200
+    acquisition_control.ddc_workers = ddc_workers
+    acquisition_control.set_sequence(multi_gate_sequence)
+
+    individual = acquisition_control.run()
+    console.parameter.running_mean = True
+    running = acquisition_control.run()
+
+    assert running.meta["running_mean"] == {"averages": 3}
+    variances = [running._additional_data[f"raw_variance_{k}"] for k in range(len(running._raw))]
+    for expected, mean, variance in zip(individual._raw, running._raw, variances, strict=True):
+        assert mean.shape == (1, *expected.shape[1:])
+        assert np.allclose(mean, expected.mean(axis=0, keepdims=True))
+        assert np.allclose(variance, expected.var(axis=0, keepdims=True))
+    for expected, mean in zip(individual.unprocessed_data, running.unprocessed_data, strict=True):
+        assert np.allclose(mean, expected.mean(axis=0, keepdims=True))
+
+
+def test_failed_update(acquisition_control, multi_gate_sequence):
+    """Test if a failed sequence update is repeated by the next acquisition instead of replaying the sequence."""
+    console.parameter.decimation = 200
+    acquisition_control.set_sequence(multi_gate_sequence)
+    expected = acquisition_control.unrolled_seq.data.copy()
+
+    console.parameter.b1_scaling = 1e4
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            acquisition_control.run()
+    assert np.array_equal(acquisition_control.unrolled_seq.data, expected)
+
+
+def test_sequence_cache(tmp_path, multi_gate_sequence):
+    """Test if the sequence provider state of a cached sequence equals the state of the unrolled sequence."""
+    parameter = console.parameter
+    simulation.configure(consumption_rate=math.inf)
+    # Sequence cache is enabled by default
+    acquisition_control = AcquisitionControl(CONFIG, nexus_data_dir=str(tmp_path))
+    assert acquisition_control.sequence_cache.max_bytes == 8 * 1024**3
+    console.parameter.save_on_mutation = False
+    try:
+        acquisition_control.set_sequence(multi_gate_sequence)
+        expected = acquisition_control.seq_provider.dict()
+        expected_data = np.array(acquisition_control.unrolled_seq.data)
+        # Set another sequence, the first sequence is loaded from the cache afterwards
+        other_sequence = pp.Sequence()
+        other_sequence.set_definition("Name", "other_sequence")
+        other_sequence.add_block(pp.make_block_pulse(flip_angle=np.pi / 2, duration=1e-3))
+        other_sequence.add_block(pp.make_adc(num_samples=100, dwell=1e-5))
+        acquisition_control.set_sequence(other_sequence)
+        acquisition_control.set_sequence(multi_gate_sequence)
+        assert acquisition_control.sequence_cache.stats()["hits"] == 1
+        provider_state = acquisition_control.seq_provider.dict()
+        # RF waveform cache statistics differ, as the cached sequence is not unrolled
+        expected.pop("rf_cache")
+        provider_state.pop("rf_cache")
+        assert provider_state == expected
+        assert np.array_equal(acquisition_control.seq_provider._sqnc_cache, expected_data)
+
+        # Cached replay data is read only, it is unrolled again if acquisition parameters change
+        console.parameter.larmor_frequency += 1e3
+        data = acquisition_control.run()
+        assert acquisition_control.seq_provider.larmor_freq == console.parameter.larmor_frequency
+        assert data.meta[acquisition_control.seq_provider.__name__]["larmor_freq"] == console.parameter.larmor_frequency
+    finally:
+        acquisition_control.tx_card.disconnect()
+        acquisition_control.rx_card.disconnect()
+        console.parameter = parameter
+
+
+@pytest.mark.parametrize("ddc_workers", [0, 2])
+def test_continuous_averages(acquisition_control, multi_gate_sequence, ddc_workers):
+    """Test if averages which are acquired back-to-back in one card session equal separately acquired averages."""
+    console.parameter.num_averages = 3
+    console.parameter.averaging_delay = 1e-3
+    console.parameter.decimation = 200
+    acquisition_control.ddc_workers = ddc_workers
+    acquisition_control.set_sequence(multi_gate_sequence)
+
+    separate = acquisition_control.run()
+    acquisition_control.continuous_averages = True
+    continuous = acquisition_control.run()
+
+    assert acquisition_control.rx_card.reader_stats.gates == 3 * acquisition_control.unrolled_seq.adc_count
+    # One card session for separate averages each and one session for the continuous averages
+    assert [len(times) for times in separate.meta["timing"].values()] == [3, 3, 3]
+    assert [len(times) for times in continuous.meta["timing"].values()] == [1, 1, 1]
+    assert all(latency > 0 for latency in separate.meta["timing"]["arm_to_first_gate"])
+    for expected, data in zip(separate._raw, continuous._raw, strict=True):
+        assert data.shape == expected.shape
+        assert np.allclose(data, expected)
+    for expected, data in zip(separate.unprocessed_data, continuous.unprocessed_data, strict=True):
+        assert np.array_equal(data, expected)
+
+
+def test_continuous_averages_streaming(acquisition_control, multi_gate_sequence):
+    """Test if all gates of continuous averages are acquired, if the sequence is streamed."""
+    console.parameter.num_averages = 3
+    console.parameter.averaging_delay = 1e-3
+    console.parameter.decimation = 200
+    acquisition_control.set_sequence(multi_gate_sequence)
+    expected = acquisition_control.run()
+
+    acquisition_control.set_sequence(multi_gate_sequence, streaming=True)
+    acquisition_control.continuous_averages = True
+    data = acquisition_control.run()
+
+    assert acquisition_control.rx_card.reader_stats.gates == 3 * acquisition_control.unrolled_seq.adc_count
+    for gates, data_gates in zip(expected.unprocessed_data, data.unprocessed_data, strict=True):
+        assert data_gates.shape[0] == 3
+        assert np.array_equal(data_gates, gates)
+
+
+@pytest.mark.parametrize("ddc_workers", [0, 2])
+def test_run_async(acquisition_control, multi_gate_sequence, ddc_workers):
+    """Test if the processed averages are yielded by the asyncio interface, before the acquisition data."""
+    console.parameter.num_averages = 2
+    console.parameter.decimation = 200
+    acquisition_control.ddc_workers = ddc_workers
+    acquisition_control.set_sequence(multi_gate_sequence)
+
+    async def acquire():
+        acquisition = acquisition_control.start_async()
+        averages = [average async for average in acquisition]
+        return averages, await acquisition, await acquisition_control.run_async()
+
+    averages, data, expected = asyncio.run(acquire())
+    assert sorted(average.average for average in averages) == [0, 1]
+    for average in averages:
+        for results, unprocessed, raw in zip(average.results, data.unprocessed_data, data._raw, strict=True):
+            assert np.allclose(results[0], unprocessed[average.average:average.average + 1])
+            assert np.allclose(results[1], raw[average.average:average.average + 1])
+    for result, reference in zip(data._raw, expected._raw, strict=True):
+        assert np.allclose(result, reference)
+
+
+def test_per_gate(acquisition_control, multi_gate_sequence):
+    """Test if each processed gate is yielded, if the gates are processed during the acquisition."""
+    console.parameter.num_averages = 2
+    console.parameter.decimation = 200
+    acquisition_control.ddc_workers = 2
+    acquisition_control.set_sequence(multi_gate_sequence)
+
+    async def acquire():
+        return [gates async for gates in acquisition_control.start_async(per_gate=True)]
+
+    gates = asyncio.run(acquire())
+    assert len(gates) == 2 * acquisition_control.unrolled_seq.adc_count
+    assert all(item.results[1].shape[-2] == 1 for item in gates)
+
+
+def test_cancel(acquisition_control, multi_gate_sequence):
+    """Test if cancelling the task of an asynchronous acquisition stops both cards."""
+    console.parameter.num_averages = 3
+    console.parameter.averaging_delay = 2
+    console.parameter.decimation = 200
+    acquisition_control.set_sequence(multi_gate_sequence)
+
+    async def acquire():
+        async for average in acquisition_control.start_async():
+            # Cancel the iterating task during the first averaging delay
+            asyncio.current_task().cancel()
+            await asyncio.sleep(0)
+
+    time_start = time.perf_counter()
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(acquire())
+    assert time.perf_counter() - time_start < 1
+    assert acquisition_control.tx_card.worker is None
+    assert acquisition_control.rx_card.worker is None
+
+    async def cancel_waiting():
+        task = asyncio.create_task(acquisition_control.run_async())
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # Cards were stopped before the cancellation was propagated
+        return acquisition_control.tx_card.worker, acquisition_control.rx_card.worker
+
+    assert asyncio.run(cancel_waiting()) == (None, None)
+
+    # Cancelling a finished acquisition does not affect the next acquisition
+    console.parameter.averaging_delay = 0
+
+    async def cancel_finished():
+        acquisition = acquisition_control.start_async()
+        await acquisition
+        acquisition.cancel()
+
+    asyncio.run(cancel_finished())
+    acquisition_control.cancel()
+    assert acquisition_control.run().meta["timing"]["rx_start"]
+
+    # Cancellation of a blocking acquisition from another thread
+    console.parameter.averaging_delay = 2
+    threading.Timer(0.2, acquisition_control.cancel).start()
+    time_start = time.perf_counter()
+    with pytest.raises(AcquisitionCancelledError):
+        acquisition_control.run()
+    assert time.perf_counter() - time_start < 1
+
+
+def test_protocol(acquisition_control, multi_gate_sequence):
+    """Test if queued acquisitions equal the acquisitions of separately set sequences and parameters."""
+    localizer = pp.Sequence()
+    localizer.set_definition("Name", "localizer")
+    localizer.add_block(
+        pp.make_block_pulse(flip_angle=np.pi / 2, duration=1e-3, delay=1e-4), pp.make_adc(num_samples=100, dwell=1e-5)
+    )
+    console.parameter.decimation = 200
+    parameter = console.parameter
+    acquisition_control.set_sequence(multi_gate_sequence, streaming=True)
+    seq_provider, unrolled_seq = acquisition_control.seq_provider, acquisition_control.unrolled_seq
+    before = acquisition_control.run()
+    items = [
+        acquisition_control.enqueue(localizer, replace(parameter, num_averages=2), name="localizer"),
+        acquisition_control.enqueue(multi_gate_sequence, replace(parameter, larmor_frequency=2.1e6, b1_scaling=0.5)),
+    ]
+    assert acquisition_control.protocol.items == items
+    assert [item.name for item in items] == ["localizer", "1"]
+
+    assert acquisition_control.run_protocol() == items
+    assert len(acquisition_control.protocol) == 0
+    assert console.parameter is parameter
+    # Sequence which was set before the protocol is restored
+    assert acquisition_control.seq_provider is seq_provider
+    assert acquisition_control.unrolled_seq is unrolled_seq
+    assert acquisition_control.streaming
+    for data, reference in zip(acquisition_control.run()._raw, before._raw, strict=True):
+        assert data.shape == reference.shape
+        assert np.allclose(data, reference)
+    # Protocol items use a separate sequence provider with the output limits of the transmit card
+    assert all(item.seq_provider is not seq_provider for item in items)
+    assert items[0].seq_provider.output_limits == acquisition_control.tx_card.max_amplitude
+
+    for item, sequence in zip(items, [localizer, multi_gate_sequence], strict=True):
+        timing = item.data.meta["protocol"]
+        assert timing["name"] == item.name
+        assert timing["unroll_time"] > 0 and timing["wait_time"] >= 0 and timing["scan_time"] > 0
+        assert item.data.acquisition_parameters is item.parameter
+
+        console.parameter = item.parameter
+        acquisition_control.set_sequence(sequence)
+        expected = acquisition_control.run()
+        assert np.array_equal(acquisition_control.unrolled_seq.data, item.unrolled_seq.data)
+        for data, reference in zip(item.data._raw, expected._raw, strict=True):
+            assert data.shape == reference.shape
+            assert np.allclose(data, reference)
+    assert items[0].data._raw[0].shape[0] == 2
+
+
+def test_protocol_error(acquisition_control, multi_gate_sequence):
+    """Test if an invalid sequence of a queued acquisition stops the protocol."""
+    acquisition_control.enqueue("invalid.txt")
+    acquisition_control.enqueue(multi_gate_sequence)
+    with pytest.raises(FileNotFoundError):
+        acquisition_control.run_protocol()
+    assert len(acquisition_control.protocol) == 1
+    acquisition_control.protocol.clear()
@@ -1,5 +1,6 @@
 """Test configuration file."""
 
+import os
 from collections.abc import Callable
 
 import numpy as np
@@ -10,6 +11,9 @@ from console.interfaces.acquisition_parameter import AcquisitionParameter, Dimen
 from console.pulseq_interpreter.sequence_provider import SequenceProvider
 from console.utilities.sequences.system_settings import system
 
+# Use the simulated spectrum driver, such that the card devices can be tested without measurement cards
+os.environ.setdefault("NEXUS_SPCM_SIMULATION", "1")
+
 
 @pytest.fixture()
 def seq_provider() -> SequenceProvider:
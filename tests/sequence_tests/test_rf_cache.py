@@ -0,0 +1,59 @@
+"""Test the cache of unrolled RF waveforms."""
+import numpy as np
+
+from console.pulseq_interpreter.rf_cache import RFWaveformCache, shape_digest
+
+
+def test_lru_eviction():
+    """Test hit and miss counters and eviction of least recently used waveforms."""
+    waveforms = {key: np.full(10, key, dtype=complex) for key in range(3)}
+    # Byte budget for two waveforms
+    cache = RFWaveformCache(max_bytes=2 * waveforms[0].nbytes)
+
+    for key in [0, 1, 0, 2]:
+        cache.get(key, lambda key=key: waveforms[key])
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["evictions"] == 1
+    assert stats["size_bytes"] == 2 * waveforms[0].nbytes
+    # Waveform 1 was least recently used and evicted, waveform 0 is still cached
+    cache.get(0, lambda: np.zeros(10, dtype=complex))
+    assert cache.stats()["hits"] == 2
+    cache.get(1, lambda: np.zeros(10, dtype=complex))
+    assert cache.stats()["misses"] == 4
+
+
+def test_oversized_waveform():
+    """Test that waveforms exceeding the byte budget are not cached."""
+    cache = RFWaveformCache(max_bytes=0)
+    cache.get("key", lambda: np.ones(10, dtype=complex))
+    cache.get("key", lambda: np.ones(10, dtype=complex))
+    assert len(cache) == 0
+    assert cache.stats()["misses"] == 2
+
+
+def test_shape_digest():
+    """Test content based RF shape identifier."""
+    signal = np.linspace(0, 1, 100) * np.exp(1j * 0.3)
+    assert shape_digest(signal) == shape_digest(signal.copy())
+    assert shape_digest(signal) != shape_digest(2 * signal)
+
+
+def test_unrolling_with_cache(seq_provider, test_sequence):
+    """Test that repeated RF events are taken from cache and yield the same result as without cache."""
+    seq_provider.from_pypulseq(test_sequence)
+    for _ in range(3):
+        seq_provider.add_block(seq_provider.get_block(1))
+        seq_provider.add_block(seq_provider.get_block(2))
+
+    cached = seq_provider.unroll_sequence().data
+    assert seq_provider.rf_cache.stats()["misses"] == 1
+    assert seq_provider.rf_cache.stats()["hits"] == 3
+
+    seq_provider.rf_cache.max_bytes = 0
+    seq_provider.rf_cache.clear()
+    uncached = seq_provider.unroll_sequence().data
+    assert seq_provider.rf_cache.stats()["hits"] == 0
+    assert np.array_equal(cached, uncached)
@@ -0,0 +1,83 @@
+"""Testing of the persistent sequence cache."""
+import os
+
+import numpy as np
+
+import console
+from console.interfaces.acquisition_parameter import AcquisitionParameter
+from console.pulseq_interpreter.sequence_cache import SequenceCache, sequence_digest
+
+
+def test_cache_roundtrip(seq_provider, test_sequence, tmp_path, monkeypatch):
+    """Test if a cached sequence is loaded memory mapped and equals the unrolled sequence."""
+    monkeypatch.setattr(console, "parameter", AcquisitionParameter())
+    seq_provider.from_pypulseq(test_sequence)
+    cache = SequenceCache(str(tmp_path))
+    key = sequence_digest(seq_provider)
+
+    assert cache.load(key) is None
+    unrolled = seq_provider.unroll_sequence()
+    assert cache.store(key, unrolled)
+
+    cached = cache.load(key)
+    assert isinstance(cached.data, np.memmap)
+    assert not cached.data.flags.writeable
+    assert np.array_equal(cached.data, unrolled.data)
+    assert np.array_equal(cached.block_offsets, unrolled.block_offsets)
+    assert cached.adc_count == unrolled.adc_count
+    assert cached.sample_count == unrolled.sample_count
+    assert cached.duration == unrolled.duration
+    assert cached.larmor_frequency == unrolled.larmor_frequency
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_digest(seq_provider, test_sequence, monkeypatch):
+    """Test if the digest changes with the sequence content and the acquisition parameters."""
+    monkeypatch.setattr(console, "parameter", AcquisitionParameter())
+    seq_provider.from_pypulseq(test_sequence)
+    key = sequence_digest(seq_provider)
+    assert key == sequence_digest(seq_provider)
+
+    console.parameter.b1_scaling = 0.5
+    assert (key_b1 := sequence_digest(seq_provider)) != key
+
+    seq_provider.add_block(seq_provider.get_block(3))
+    assert sequence_digest(seq_provider) != key_b1
+
+
+def test_integrity_check(seq_provider, test_sequence, tmp_path, monkeypatch):
+    """Test if corrupted cache entries are removed."""
+    monkeypatch.setattr(console, "parameter", AcquisitionParameter())
+    seq_provider.from_pypulseq(test_sequence)
+    cache = SequenceCache(str(tmp_path), full_check=True)
+    key = sequence_digest(seq_provider)
+    cache.store(key, seq_provider.unroll_sequence())
+
+    data = np.load(tmp_path / key / "data.npy", mmap_mode="r+")
+    data[data.size // 2 + 1] += 1
+    data.flush()
+    del data
+
+    assert cache.load(key) is None
+    assert cache.stats()["invalid"] == 1
+    assert not os.path.exists(tmp_path / key)
+
+
+def test_eviction(tmp_path, seq_provider, test_sequence, monkeypatch):
+    """Test if the least recently used sequences are evicted when the byte budget is exceeded."""
+    monkeypatch.setattr(console, "parameter", AcquisitionParameter())
+    seq_provider.from_pypulseq(test_sequence)
+    unrolled = seq_provider.unroll_sequence()
+    cache = SequenceCache(str(tmp_path), max_bytes=int(2.5 * unrolled.data.nbytes))
+
+    assert cache.store("a", unrolled)
+    assert cache.store("b", unrolled)
+    # Access "a", such that "b" is the least recently used sequence
+    os.utime(tmp_path / "b" / "meta.json", (0, 0))
+    assert cache.load("a") is not None
+    assert cache.store("c", unrolled)
+
+    assert [key for key, _, _ in cache.entries()] == ["a", "c"]
+    assert cache.stats()["evictions"] == 1
+    assert cache.size_bytes() <= cache.max_bytes
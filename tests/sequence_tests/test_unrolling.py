@@ -1,7 +1,12 @@
 """Testing of sequence unrolling function."""
 import matplotlib
 import numpy as np
+import pypulseq as pp
+import pytest
 
+import console
+from console.interfaces.acquisition_parameter import AcquisitionParameter
+from console.interfaces.dimensions import Dimensions
 from console.interfaces.unrolled_sequence import UnrolledSequence
 
 
@@ -17,3 +22,142 @@ def test_sequence_provider(seq_provider, test_sequence):
     assert isinstance(fig, matplotlib.figure.Figure)
     assert isinstance(ax, np.ndarray)
     assert all(isinstance(x, matplotlib.axes.Axes) for x in ax)
+
+
+def test_vectorized_unrolling(seq_provider, test_sequence):
+    """Test if vectorized unrolling yields the identical result as block-wise unrolling."""
+    seq_provider.from_pypulseq(test_sequence)
+    # Repeat blocks to have gradient and ADC events which occur multiple times
+    for _ in range(3):
+        seq_provider.add_block(seq_provider.get_block(3))
+        seq_provider.add_block(seq_provider.get_block(5))
+
+    blockwise = seq_provider.unroll_sequence(vectorized=False)
+    vectorized = seq_provider.unroll_sequence(vectorized=True)
+
+    assert vectorized.adc_count == blockwise.adc_count == 4
+    assert np.array_equal(vectorized.block_offsets, blockwise.block_offsets)
+    assert np.array_equal(vectorized.data, blockwise.data)
+    assert np.array_equal(vectorized.adc_gate, blockwise.adc_gate)
+    assert np.array_equal(vectorized.rf_unblanking, blockwise.rf_unblanking)
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+@pytest.mark.parametrize("workers", [2, 3, 16])
+def test_parallel_unrolling(seq_provider, test_sequence, vectorized, workers):
+    """Test if unrolling block ranges concurrently yields the identical result as serial unrolling."""
+    seq_provider.from_pypulseq(test_sequence)
+    # Repeat RF and ADC blocks, such that the carrier and reference phase depend on the block range
+    for _ in range(3):
+        seq_provider.add_block(seq_provider.get_block(1))
+        seq_provider.add_block(seq_provider.get_block(5))
+
+    serial = seq_provider.unroll_sequence(vectorized=vectorized)
+    parallel = seq_provider.unroll_sequence(vectorized=vectorized, workers=workers)
+
+    assert parallel.adc_count == serial.adc_count
+    assert parallel.sample_count == serial.sample_count
+    assert np.array_equal(parallel.data, serial.data)
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+@pytest.mark.parametrize("chunk_bytes", [8 * 1000, 8 * 12345])
+def test_streaming_unrolling(seq_provider, test_sequence, vectorized, chunk_bytes):
+    """Test if streamed replay data equals the unrolled sequence, padded to a multiple of the chunk size."""
+    seq_provider.from_pypulseq(test_sequence)
+    unrolled = seq_provider.unroll_sequence()
+    expected = unrolled.data
+
+    streamed = seq_provider.unroll_sequence(vectorized=vectorized, streaming=True)
+    assert streamed.data.size == 0
+    assert np.array_equal(streamed.block_offsets, unrolled.block_offsets)
+    assert streamed.adc_count == unrolled.adc_count
+    assert streamed.sample_count == unrolled.sample_count
+
+    chunks = list(streamed.stream(chunk_bytes))
+    assert all(chunk.nbytes == chunk_bytes for chunk in chunks)
+    data = np.concatenate(chunks)
+    assert data.size == -(-expected.size * 2 // chunk_bytes) * chunk_bytes // 2
+    assert np.array_equal(data[:expected.size], expected)
+    assert not data[expected.size:].any()
+
+
+def test_adc_samples(seq_provider, test_sequence):
+    """Test if the ADC layout matches the gate signal of the unrolled sequence."""
+    seq_provider.from_pypulseq(test_sequence)
+    seq_provider.add_block(seq_provider.get_block(3))
+    seq_provider.add_block(seq_provider.get_block(5))
+    # ADC event of a different size with delay
+    seq_provider.add_block(pp.make_adc(num_samples=100, dwell=1e-5, delay=1e-4))
+
+    unrolled = seq_provider.unroll_sequence()
+    gate = np.concatenate(([0], unrolled.adc_gate.astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(gate)).reshape(-1, 2)
+    assert unrolled.adc_samples == (edges[:, 1] - edges[:, 0]).tolist()
+    assert len(unrolled.adc_samples) == unrolled.adc_count == 3
+    assert unrolled.adc_samples[-1] == round(100 * 1e-5 * seq_provider.spcm_freq)
+
+    streamed = seq_provider.unroll_sequence(streaming=True)
+    assert streamed.adc_samples == unrolled.adc_samples
+
+
+def test_streaming_invalid_chunk_size(seq_provider, test_sequence):
+    """Test if chunk sizes which are not a multiple of 4 channels times 2 bytes are rejected."""
+    seq_provider.from_pypulseq(test_sequence)
+    with pytest.raises(ValueError):
+        next(seq_provider.stream_sequence(chunk_bytes=1002))
+
+
+def test_block_views(seq_provider, test_sequence):
+    """Test if the per block replay data are views of the contiguous replay data."""
+    seq_provider.from_pypulseq(test_sequence)
+    unrolled = seq_provider.unroll_sequence()
+
+    assert unrolled.data.size == 4 * unrolled.sample_count == 4 * unrolled.block_offsets[-1]
+    assert len(unrolled.seq) == len(test_sequence.block_events)
+    assert all(np.shares_memory(block, unrolled.data) for block in unrolled.seq if block.size > 0)
+    assert np.array_equal(np.concatenate(unrolled.seq), unrolled.data)
+    # ADC gate is encoded in the 16th bit of the x gradient channel
+    assert np.count_nonzero(np.diff(unrolled.adc_gate.astype(int)) == 1) == unrolled.adc_count
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {"b1_scaling": 0.5},
+        {"larmor_frequency": 2.1e6},
+        {"fov_scaling": Dimensions(0.5, 0.8, 1.0)},
+        {"gradient_offset": Dimensions(0.0, 100.0, 0.0)},
+        {"decimation": 100},
+        {"larmor_frequency": 1.9e6, "b1_scaling": 1.5, "fov_scaling": Dimensions(1.0, 0.2, 1.0)},
+    ],
+)
+def test_incremental_update(seq_provider, test_sequence, monkeypatch, changes):
+    """Test if an incremental update yields the same result as unrolling the sequence again."""
+    monkeypatch.setattr(console, "parameter", AcquisitionParameter())
+    seq_provider.from_pypulseq(test_sequence)
+    unrolled = seq_provider.unroll_sequence()
+
+    for key, value in changes.items():
+        setattr(console.parameter, key, value)
+    updated = seq_provider.update_unrolled_sequence(unrolled)
+    expected = seq_provider.unroll_sequence()
+
+    assert np.shares_memory(updated.data, unrolled.data)
+    assert np.array_equal(updated.data, expected.data)
+    assert updated.larmor_frequency == expected.larmor_frequency == console.parameter.larmor_frequency
+
+
+@pytest.mark.parametrize("changes", [{"b1_scaling": 1e4}, {"fov_scaling": Dimensions(1e6, 1.0, 1.0)}])
+def test_incremental_update_output_limit(seq_provider, test_sequence, monkeypatch, changes):
+    """Test if an incremental update, which exceeds the output limits, leaves the unrolled sequence unchanged."""
+    monkeypatch.setattr(console, "parameter", AcquisitionParameter())
+    seq_provider.from_pypulseq(test_sequence)
+    unrolled = seq_provider.unroll_sequence()
+    expected = unrolled.data.copy()
+
+    for key, value in changes.items():
+        setattr(console.parameter, key, value)
+    with pytest.raises(ValueError):
+        seq_provider.update_unrolled_sequence(unrolled)
+    assert np.array_equal(unrolled.data, expected)
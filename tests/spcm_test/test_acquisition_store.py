@@ -0,0 +1,62 @@
+"""Test the preallocated store of received gates."""
+import numpy as np
+
+from console.spcm_control.acquisition_store import AcquisitionStore
+
+
+def _interleaved(gate_samples: int, num_channels: int, offset: int = 0) -> np.ndarray:
+    """Return interleaved samples, channel c of sample n has the value offset + num_channels * n + c."""
+    return np.arange(offset, offset + gate_samples * num_channels, dtype=np.int16)
+
+
+def test_grouping():
+    """Test if gates are grouped by size in the order of their first occurrence."""
+    store = AcquisitionStore([30, 10, 30, 20, 10], num_averages=3, num_channels=2)
+    assert store.sizes == [30, 10, 20]
+    assert [data.shape for data in store.data] == [(3, 2, 2, 30), (3, 2, 2, 10), (3, 1, 2, 20)]
+    assert store.num_gates == 5
+    assert store.nbytes == 3 * 2 * 2 * (60 + 20 + 20)
+    assert np.shares_memory(store.slot(1, 2), store.data[0])
+
+
+def test_write_sections():
+    """Test if interleaved sections of a gate are transposed to its slot."""
+    store = AcquisitionStore([30, 10], num_averages=2, num_channels=2)
+    store.start_average(1)
+    samples = _interleaved(30, 2)
+    store.write_sections((samples[:18], samples[18:]), gate_samples=30)
+    store.write(_interleaved(10, 2, offset=100), gate_samples=10)
+
+    assert store.received.tolist() == [0, 2]
+    assert np.array_equal(store.slot(1, 0), samples.reshape((2, 30), order="F"))
+    assert np.array_equal(store.slot(1, 1)[1], np.arange(101, 120, 2))
+    assert not store.data[0][0].any()
+
+
+def test_mismatch_and_drop():
+    """Test if gates with an unexpected size are truncated or zero-filled and excess gates are dropped."""
+    store = AcquisitionStore([10, 10], num_averages=1, num_channels=2)
+    store.slot(0, 1)[:] = -1
+    store.write(_interleaved(12, 2), gate_samples=12)
+    store.write(_interleaved(8, 2), gate_samples=8)
+    store.write(_interleaved(10, 2), gate_samples=10)
+
+    assert store.mismatches == 2
+    assert store.dropped == 1
+    assert np.array_equal(store.slot(0, 0), _interleaved(10, 2).reshape((2, 10), order="F"))
+    assert np.array_equal(store.slot(0, 1)[:, :8], _interleaved(8, 2).reshape((2, 8), order="F"))
+    assert not store.slot(0, 1)[:, 8:].any()
+
+
+def test_continuous():
+    """Test if the gate count separates the averages of a continuous stream."""
+    store = AcquisitionStore([10, 20], num_averages=2, num_channels=2, continuous=True)
+    store.start_average(0)
+    for offset in range(5):
+        store.write(_interleaved(10, 2, offset), gate_samples=10)
+        store.write(_interleaved(20, 2, offset), gate_samples=20)
+
+    assert store.received.tolist() == [2, 2]
+    assert store.average == 1
+    assert store.dropped == 6
+    assert np.array_equal(store.slot(1, 0), _interleaved(10, 2, offset=1).reshape((2, 10), order="F"))
@@ -0,0 +1,79 @@
+"""Test the accumulation of processed averages."""
+import numpy as np
+
+from console.spcm_control.acquisition_store import AcquisitionStore
+from console.spcm_control.average_accumulator import AverageAccumulator
+
+
+def _process(gates: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return the gates as float and their complex sum over the channels, decimated by 2."""
+    data = gates[..., ::2].sum(axis=0) * (1 + 1j)
+    return gates.astype(float), data[None, ...]
+
+
+def _fill(store: AcquisitionStore) -> None:
+    """Fill the store with random gates."""
+    rng = np.random.default_rng(seed=0)
+    for data in store.data:
+        data[:] = rng.integers(-100, 100, size=data.shape, dtype=np.int16)
+
+
+def test_individual_averages():
+    """Test if the results of each average are written to their preallocated slots."""
+    store = AcquisitionStore([20, 10, 20], num_averages=3, num_channels=2)
+    _fill(store)
+    accumulator = AverageAccumulator(store, _process)
+    assert [[output.shape for output in outputs] for outputs in accumulator.outputs] == [
+        [(3, 2, 2, 20), (3, 1, 2, 10)], [(3, 2, 1, 10), (3, 1, 1, 5)]
+    ]
+
+    for average in [2, 0]:
+        for group, data in enumerate(store.data):
+            accumulator.add(average, group, slice(None), _process(np.moveaxis(data[average], 1, 0)))
+    # Single gate of the first group
+    accumulator.add(1, 0, slice(1, 2), _process(store.slot(1, 2)[:, None, :]))
+
+    # First gate of average 1 was not added and remains zero-filled
+    expected = np.moveaxis(store.data[0], 1, 2).astype(float)
+    expected[1, :, 0] = 0
+    assert np.array_equal(accumulator.results()[0][0], expected)
+    assert accumulator.counts[0].tolist() == [2, 3]
+    assert [result[0].shape[0] for result in accumulator.results(np.array([0, 2]))] == [2, 2]
+
+
+def test_running_mean():
+    """Test if mean and variance of the accumulated averages equal the statistics of the individual averages."""
+    store = AcquisitionStore([20, 10, 20], num_averages=4, num_channels=2)
+    _fill(store)
+    individual = AverageAccumulator(store, _process)
+    running = AverageAccumulator(store, _process, running_mean=True)
+    for average in range(store.num_averages):
+        for group, data in enumerate(store.data):
+            results = _process(np.moveaxis(data[average], 1, 0))
+            individual.add(average, group, slice(None), results)
+            running.add(average, group, slice(None), results)
+
+    assert all(output.shape[0] == 1 for outputs in running.outputs for output in outputs)
+    for expected, results, variance in zip(individual.results(), running.results(), running.variances(), strict=True):
+        for data, mean in zip(expected, results, strict=True):
+            assert np.allclose(mean, data.mean(axis=0, keepdims=True))
+        assert np.allclose(variance, expected[-1].var(axis=0, keepdims=True))
+
+
+def test_listeners():
+    """Test if the listeners are called with the added gates and with each complete average."""
+    store = AcquisitionStore([20, 10, 20], num_averages=2, num_channels=2)
+    _fill(store)
+    gates, averages = [], []
+    accumulator = AverageAccumulator(store, _process, gate_listener=gates.append, average_listener=averages.append)
+
+    accumulator.add(1, 0, slice(None), _process(np.moveaxis(store.data[0][1], 1, 0)))
+    assert [item.average for item in gates] == [1] and not averages
+    accumulator.add(1, 1, slice(0, 1), _process(store.slot(1, 1)[:, None, :]))
+
+    assert accumulator.added.tolist() == [0, 3]
+    assert [(item.group, item.gates) for item in gates] == [(0, slice(None)), (1, slice(0, 1))]
+    assert [item.average for item in averages] == [1]
+    for results, outputs in zip(averages[0].results, accumulator.results(), strict=True):
+        assert np.array_equal(results[1], outputs[1][1:2])
+        assert not np.shares_memory(results[1], outputs[1])
@@ -0,0 +1,47 @@
+"""Test the pool of page-aligned DMA buffers."""
+import ctypes
+import mmap
+
+import pytest
+
+from console.spcm_control.spcm.tools import DMABufferPool
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_reuse(use_mmap):
+    """Test if released buffers are handed out again to requests of the same or a smaller size."""
+    pool = DMABufferPool(use_mmap=use_mmap, populate=True)
+    buffer = pool.acquire(3 * 4096 + 10)
+    assert ctypes.sizeof(buffer) == 3 * 4096 + 10
+    assert ctypes.addressof(buffer) % mmap.PAGESIZE == 0
+    assert not bytes(buffer).strip(b"\x00")
+    address = ctypes.addressof(buffer)
+    pool.release(buffer)
+
+    smaller = pool.acquire(4096)
+    other = pool.acquire(4096)
+    assert ctypes.addressof(smaller) == address
+    assert ctypes.addressof(other) != address
+    assert pool.stats.allocations == 2
+    assert pool.stats.reuses == 1
+    assert pool.stats.allocated_bytes == pool.stats.pooled_bytes == pool.stats.in_use_bytes == 5 * 4096
+    pool.release(smaller)
+    pool.release(other)
+    assert pool.stats.in_use_bytes == 0
+
+    with pytest.raises(ValueError):
+        pool.release(other)
+
+
+def test_replace():
+    """Test if free buffers which are too small are replaced by a new buffer."""
+    pool = DMABufferPool()
+    pool.release(pool.acquire(4096))
+    pool.release(pool.acquire(2 * 4096))
+    assert pool.stats.allocations == 2
+    assert pool.stats.pooled_bytes == 2 * 4096
+
+    pool.clear()
+    assert pool.stats.pooled_bytes == 0
+    pool.acquire(4096)
+    assert pool.stats.allocations == 3
@@ -0,0 +1,53 @@
+"""Test the background preparation of queued protocol items."""
+import threading
+import time
+
+import pytest
+
+from console.interfaces.acquisition_parameter import AcquisitionParameter
+from console.spcm_control.protocol_queue import ProtocolItem, ProtocolQueue
+
+
+def test_prefetch():
+    """Test if the next item is prepared while the current item is processed."""
+    prepared: list[str] = []
+    release = threading.Event()
+
+    def prepare(item: ProtocolItem) -> None:
+        if item.name == "2":
+            release.wait(1)
+        time.sleep(0.01)
+        prepared.append(item.name)
+
+    queue = ProtocolQueue(prepare, prefetch=1)
+    items = [queue.put(ProtocolItem(sequence="", parameter=AcquisitionParameter(), name=str(k))) for k in range(3)]
+    assert queue.items == items
+
+    assert queue.get() is items[0]
+    assert items[0].timing.unroll_time >= 0.01
+    # Second item is prepared during the "acquisition" of the first item, the third item is not prepared ahead
+    time.sleep(0.05)
+    assert prepared == ["0", "1"]
+    assert queue.get() is items[1]
+    assert items[1].timing.wait_time < 0.01
+
+    # Wait time of an item, of which the preparation is still running
+    threading.Timer(0.05, release.set).start()
+    assert queue.get() is items[2]
+    assert items[2].timing.wait_time >= 0.04
+    assert prepared == ["0", "1", "2"]
+    with pytest.raises(IndexError):
+        queue.get()
+    queue.shutdown()
+
+
+def test_error():
+    """Test if the error of a failed preparation is raised when the item is taken from the queue."""
+    def prepare(item: ProtocolItem) -> None:
+        raise FileNotFoundError(item.sequence)
+
+    queue = ProtocolQueue(prepare)
+    queue.put(ProtocolItem(sequence="missing.seq", parameter=AcquisitionParameter()))
+    with pytest.raises(FileNotFoundError):
+        queue.get()
+    queue.shutdown()
@@ -0,0 +1,47 @@
+"""Test gathering of replay data into the DMA buffer."""
+import ctypes
+
+import numpy as np
+import pytest
+
+from console.spcm_control.spcm.tools import ReplayDataReader, create_dma_buffer
+
+
+@pytest.mark.parametrize("chunk_bytes", [8, 4096, 8 * 1000])
+def test_gather_blocks(chunk_bytes):
+    """Test if gathered chunks equal the concatenated blocks, padded with zeros."""
+    rng = np.random.default_rng(seed=0)
+    blocks = [rng.integers(-(2**15), 2**15, size=4 * n, dtype=np.int16) for n in [0, 1, 1000, 17, 2500, 3]]
+    expected = np.concatenate(blocks)
+    num_chunks = -(-expected.nbytes // chunk_bytes)
+
+    buffer = create_dma_buffer(num_chunks * chunk_bytes)
+    ctypes.memset(ctypes.addressof(buffer), 0xFF, num_chunks * chunk_bytes)
+    reader = ReplayDataReader(blocks)
+    copied = [reader.read_into(ctypes.addressof(buffer) + k * chunk_bytes, chunk_bytes) for k in range(num_chunks)]
+
+    data = np.frombuffer(buffer, dtype=np.int16)
+    assert sum(copied) == reader.bytes_read == expected.nbytes
+    assert np.array_equal(data[:expected.size], expected)
+    assert not data[expected.size:].any()
+    assert reader.read_into(ctypes.addressof(buffer), chunk_bytes) == 0
+    assert reader.exhausted
+
+
+def test_exhausted_reader():
+    """Test if an exhausted reader writes zeros."""
+    buffer = create_dma_buffer(64)
+    ctypes.memset(ctypes.addressof(buffer), 0xFF, 64)
+    reader = ReplayDataReader([np.ones(4, dtype=np.int16)])
+    assert reader.read_into(ctypes.addressof(buffer), 64) == 8
+    assert reader.read_into(ctypes.addressof(buffer), 64) == 0
+    assert not np.frombuffer(buffer, dtype=np.int16).any()
+
+
+def test_invalid_replay_data():
+    """Test if replay data which is not int16 is rejected."""
+    buffer = create_dma_buffer(64)
+    with pytest.raises(ValueError):
+        ReplayDataReader([np.ones(4, dtype=np.float32)]).read_into(ctypes.addressof(buffer), 64)
+    with pytest.raises(ValueError):
+        ReplayDataReader([np.ones(8, dtype=np.int16)[::2]]).read_into(ctypes.addressof(buffer), 64)
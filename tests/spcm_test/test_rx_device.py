@@ -0,0 +1,155 @@
+"""Test the gate reader of the receive device with the simulated driver."""
+import math
+import time
+
+import numpy as np
+import pypulseq as pp
+import pytest
+
+import console.spcm_control.spcm.pyspcm as sp
+from console.spcm_control.acquisition_store import AcquisitionStore
+from console.spcm_control.rx_device import RxCard
+from console.spcm_control.spcm import simulation
+from console.spcm_control.tx_device import TxCard
+
+
+@pytest.fixture()
+def cards(request):
+    """Connect simulated transmit and receive card, the ring buffer of the transmit card is reduced.
+
+    The consumption rate of the simulated transmit card is given by the fixture parameter.
+    """
+    simulation.configure(consumption_rate=getattr(request, "param", None))
+    tx_card = TxCard(path="/dev/spcm1", max_amplitude=[200, 6000, 6000, 6000], filter_type=[0, 2, 2, 2], sample_rate=20)
+    rx_card = RxCard(
+        path="/dev/spcm0",
+        channel_enable=[1, 1, 0, 0, 0, 0, 0, 0],
+        max_amplitude=[200] * 8,
+        impedance_50_ohms=[1] * 8,
+        sample_rate=20,
+    )
+    tx_card.connect()
+    rx_card.connect()
+    tx_card.ring_buffer_size = sp.uint64(2**20)
+    tx_card.notify_size = sp.int32(2**16)
+    yield tx_card, rx_card
+    tx_card.disconnect()
+    rx_card.disconnect()
+
+
+def _acquire(tx_card, rx_card, unrolled, store: AcquisitionStore | None = None, timeout: float = 5) -> None:
+    rx_card.start_operation(store)
+    time.sleep(0.01)
+    tx_card.start_operation(unrolled)
+    time_start = time.perf_counter()
+    while rx_card.reader_stats.gates < unrolled.adc_count and time.perf_counter() - time_start < timeout:
+        time.sleep(0.01)
+    tx_card.stop_operation()
+    rx_card.stop_operation()
+
+
+def test_gate_sections_wrap():
+    """Test if gates which wrap around the end of the ring buffer are read in order."""
+    rx_card = RxCard(path="", channel_enable=[1, 1], max_amplitude=[200, 200], impedance_50_ohms=[1, 1], sample_rate=20)
+    rx_card.num_channels.value = 2
+    ring = np.arange(1000, dtype=np.int16)
+    stream = np.concatenate((ring, ring))
+
+    # Gate with 8 pre trigger samples (2 channels), which starts 100 bytes before the end of the ring buffer
+    sections = rx_card._gate_sections(ring, position=2 * 950 + 2 * 1000, gate_samples=30)
+    assert [section.size for section in sections] == [34, 26]
+    assert all(np.shares_memory(section, ring) for section in sections)
+    assert np.array_equal(np.concatenate(sections), stream[950 + 16:950 + 16 + 60])
+
+
+@pytest.mark.parametrize("cards", [math.inf], indirect=True)
+def test_batched_gates(cards, seq_provider, test_sequence):
+    """Test if gates which arrive between two wakeups are read in one batch."""
+    tx_card, rx_card = cards
+    # Short gates, the replay of all gates is transferred at once.
+    # Gates are separated by more than the post trigger (2048 samples/102.4 us), which follows a gate.
+    for _ in range(9):
+        test_sequence.add_block(pp.make_delay(2e-4))
+        test_sequence.add_block(pp.make_adc(num_samples=10, dwell=1e-5))
+    seq_provider.from_pypulseq(test_sequence)
+    unrolled = seq_provider.unroll_sequence()
+    _acquire(tx_card, rx_card, unrolled)
+
+    stats = rx_card.reader_stats
+    assert len(rx_card.rx_data) == stats.gates == unrolled.adc_count == 10
+    assert stats.max_batch_size > 1
+    assert stats.cpu_time_per_gate > 0
+    assert rx_card.dict()["reader_stats"]["gates"] == 10
+
+
+def test_idle_wakeups(cards, seq_provider, test_sequence):
+    """Test if the receive thread blocks in the DMA wait while no gate is received."""
+    tx_card, rx_card = cards
+    test_sequence.add_block(pp.make_delay(0.2))
+    test_sequence.add_block(pp.make_adc(num_samples=100, dwell=1e-5))
+    seq_provider.from_pypulseq(test_sequence)
+    unrolled = seq_provider.unroll_sequence()
+    _acquire(tx_card, rx_card, unrolled)
+
+    stats = rx_card.reader_stats
+    assert stats.gates == unrolled.adc_count == 2
+    # DMA wait timeout is 10 ms: A spinning reader would call the DMA wait several thousand times
+    assert stats.wakeups + stats.timeouts < 100
+    # Latency of the gates is bounded by the DMA wait timeout
+    assert 0 <= stats.latency_max < 0.1
+
+
+def test_store(cards, seq_provider, test_sequence):
+    """Test if the gates are copied from the ring buffer to the preallocated store."""
+    tx_card, rx_card = cards
+    test_sequence.add_block(pp.make_delay(1e-3))
+    test_sequence.add_block(pp.make_adc(num_samples=50, dwell=1e-5))
+    test_sequence.add_block(pp.make_delay(1e-3))
+    test_sequence.add_block(test_sequence.get_block(5))
+    seq_provider.from_pypulseq(test_sequence)
+    unrolled = seq_provider.unroll_sequence()
+    store = AcquisitionStore(unrolled.adc_samples, num_averages=2, num_channels=2)
+    store.start_average(1)
+    _acquire(tx_card, rx_card, unrolled, store=store)
+
+    assert rx_card.rx_data == []
+    assert store.received.tolist() == [0, 3]
+    assert store.mismatches == store.dropped == 0
+    # Gates of different size are stored in separate groups
+    assert unrolled.adc_samples[0] == unrolled.adc_samples[2] != unrolled.adc_samples[1]
+    assert [data.shape for data in store.data] == [
+        (2, 2, 2, unrolled.adc_samples[0]), (2, 1, 2, unrolled.adc_samples[1])
+    ]
+
+    gate = np.concatenate(([0], unrolled.adc_gate.astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(gate)).reshape(-1, 2)
+    rf = unrolled.data[0::4]
+    for k, (start, end) in enumerate(edges):
+        assert np.array_equal(store.slot(1, k)[1], rf[start:end])
+    assert not store.data[0][0].any()
+
+
+@pytest.mark.parametrize("cards", [math.inf], indirect=True)
+def test_wait_for_gates(cards, seq_provider, test_sequence):
+    """Test if waiting for gates returns once the gates were read, without polling the gate count."""
+    tx_card, rx_card = cards
+    test_sequence.add_block(pp.make_delay(1e-3))
+    test_sequence.add_block(pp.make_adc(num_samples=50, dwell=1e-5))
+    seq_provider.from_pypulseq(test_sequence)
+    unrolled = seq_provider.unroll_sequence()
+
+    rx_card.start_operation()
+    assert rx_card.started.wait(1)
+    tx_card.start_operation(unrolled)
+    assert tx_card.armed.wait(1)
+    assert rx_card.wait_for_gates(unrolled.adc_count, timeout=5)
+    assert len(rx_card.rx_data) == unrolled.adc_count == 2
+    assert rx_card.first_gate_time > tx_card.arm_time > rx_card.start_time
+    # No further gate is replayed
+    assert not rx_card.wait_for_gates(unrolled.adc_count + 1, timeout=0.05)
+    tx_card.stop_operation()
+    rx_card.stop_operation()
+    # The operation ended, waiting returns immediately
+    time_start = time.perf_counter()
+    assert not rx_card.wait_for_gates(unrolled.adc_count + 1, timeout=5)
+    assert time.perf_counter() - time_start < 1
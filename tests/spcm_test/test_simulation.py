@@ -0,0 +1,185 @@
+"""Test the simulated spectrum driver."""
+import ctypes
+import math
+import time
+
+import numpy as np
+import pypulseq as pp
+import pytest
+
+import console.spcm_control.spcm.pyspcm as sp
+from console.spcm_control.rx_device import RxCard
+from console.spcm_control.spcm import simulation
+from console.spcm_control.spcm.tools import create_dma_buffer
+from console.spcm_control.tx_device import TxCard
+
+
+def _get(card, register) -> int:
+    value = sp.int64(0)
+    sp.spcm_dwGetParam_i64(card, register, ctypes.byref(value))
+    return value.value
+
+
+def test_gated_recording():
+    """Test if gates, pre and post trigger and timestamps are recorded across replay chunks."""
+    _, rx_sim = simulation.configure(loopback=False)
+    card = sp.spcm_hOpen(ctypes.create_string_buffer(b"/dev/spcm0"))
+    assert _get(card, sp.SPC_PCITYP) == simulation.RX_CARD_TYPE
+
+    sp.spcm_dwSetParam_i32(card, sp.SPC_CHENABLE, sp.CHANNEL0 | sp.CHANNEL1)
+    sp.spcm_dwSetParam_i32(card, sp.SPC_PRETRIGGER, 8)
+    sp.spcm_dwSetParam_i32(card, sp.SPC_POSTTRIGGER, 16)
+    data_buffer = create_dma_buffer(2**16)
+    ts_buffer = create_dma_buffer(4096)
+    sp.spcm_dwDefTransfer_i64(card, sp.SPCM_BUF_DATA, sp.SPCM_DIR_CARDTOPC, 4096, data_buffer, 0, 2**16)
+    sp.spcm_dwDefTransfer_i64(card, sp.SPCM_BUF_TIMESTAMP, sp.SPCM_DIR_CARDTOPC, 4096, ts_buffer, 0, 4096)
+    sp.spcm_dwSetParam_i32(card, sp.SPC_M2CMD, sp.M2CMD_CARD_START | sp.M2CMD_DATA_STARTDMA)
+    assert _get(card, sp.SPC_CHCOUNT) == 2
+
+    # Two gates, the second gate spans two replay chunks
+    samples = np.zeros((3000, 4), dtype=np.int16)
+    samples[:, 0] = np.arange(3000)
+    gates = [(100, 600), (1500, 2400)]
+    for start, end in gates:
+        samples[start:end, 1] = np.int16(-(2**15))
+    rx_sim.receive(samples[:2000], first_sample=0)
+    rx_sim.receive(samples[2000:], first_sample=2000)
+
+    timestamps = np.frombuffer(ts_buffer, dtype=np.int64)
+    assert _get(card, sp.SPC_TS_AVAIL_USER_LEN) == 4 * 16
+    assert np.array_equal(timestamps[:8:2], np.ravel(gates))
+
+    # Data is available in notify size blocks
+    expected = np.concatenate([samples[start - 8:end + 16, 0] for start, end in gates])
+    assert rx_sim.stats()["recorded_bytes"] == expected.size * 4
+    assert _get(card, sp.SPC_DATA_AVAIL_USER_LEN) == expected.size * 4 // 4096 * 4096
+    data = np.frombuffer(data_buffer, dtype=np.int16)[:2 * expected.size].reshape(-1, 2)
+    assert np.array_equal(data[:, 1], expected)
+    assert rx_sim.stats()["gates"] == 2
+
+    # Release data to the card
+    sp.spcm_dwSetParam_i32(card, sp.SPC_DATA_AVAIL_CARD_LEN, 4096)
+    assert _get(card, sp.SPC_DATA_AVAIL_USER_POS) == 4096
+    assert _get(card, sp.SPC_DATA_AVAIL_USER_LEN) == expected.size * 4 // 4096 * 4096 - 4096
+
+
+def test_replay_rate():
+    """Test if the transmit card consumes the onboard memory at the consumption rate."""
+    tx_sim, _ = simulation.configure(consumption_rate=1e5, onboard_bytes=2**16)
+    card = sp.spcm_hOpen(ctypes.create_string_buffer(b"/dev/spcm1"))
+    buffer = create_dma_buffer(2**20)
+    sp.spcm_dwDefTransfer_i64(card, sp.SPCM_BUF_DATA, sp.SPCM_DIR_PCTOCARD, 2**14, buffer, 0, 2**20)
+    sp.spcm_dwSetParam_i64(card, sp.SPC_DATA_AVAIL_CARD_LEN, 2**20)
+    sp.spcm_dwSetParam_i32(card, sp.SPC_M2CMD, sp.M2CMD_DATA_STARTDMA)
+
+    # Onboard memory is filled before the replay starts, transferred bytes are free in the ring buffer
+    assert tx_sim.stats()["dma_bytes"] == 2**16
+    assert _get(card, sp.SPC_DATA_AVAIL_USER_LEN) == 2**16
+
+    time_start = time.perf_counter()
+    sp.spcm_dwSetParam_i32(card, sp.SPC_M2CMD, sp.M2CMD_CARD_START | sp.M2CMD_CARD_ENABLETRIGGER)
+    time.sleep(0.05)
+    sp.spcm_dwSetParam_i32(card, sp.SPC_M2CMD, sp.M2CMD_CARD_STOP)
+    elapsed = time.perf_counter() - time_start
+    replayed_samples = tx_sim.stats()["replayed_samples"]
+    assert 0.05 * 1e5 <= replayed_samples <= elapsed * 1e5
+
+    # Replayed onboard memory is refilled, free bytes are reported in notify size blocks
+    card_bytes = 8 * replayed_samples + 2**16
+    assert _get(card, sp.SPC_DATA_AVAIL_USER_LEN) == card_bytes - card_bytes % 2**14
+
+    # DMA wait returns with timeout, if no notify size block is available
+    sp.spcm_dwSetParam_i32(card, sp.SPC_DATA_AVAIL_CARD_LEN, _get(card, sp.SPC_DATA_AVAIL_USER_LEN))
+    sp.spcm_dwSetParam_i32(card, sp.SPC_TIMEOUT, 1)
+    assert sp.spcm_dwSetParam_i32(card, sp.SPC_M2CMD, sp.M2CMD_DATA_WAITDMA) == sp.ERR_TIMEOUT
+
+
+@pytest.mark.parametrize("onboard_bytes", [2**16, 2**26])
+def test_loopback(seq_provider, test_sequence, onboard_bytes):
+    """Test if the receive card records the gates of the sequence, which is replayed by the transmit card."""
+    tx_sim, rx_sim = simulation.configure(consumption_rate=math.inf, onboard_bytes=onboard_bytes)
+    for _ in range(4):
+        test_sequence.add_block(pp.make_delay(1e-3))
+        test_sequence.add_block(test_sequence.get_block(5))
+    seq_provider.from_pypulseq(test_sequence)
+    unrolled = seq_provider.unroll_sequence()
+
+    tx_card = TxCard(path="/dev/spcm1", max_amplitude=[200, 6000, 6000, 6000], filter_type=[0, 2, 2, 2], sample_rate=20)
+    rx_card = RxCard(
+        path="/dev/spcm0",
+        channel_enable=[1, 1, 0, 0, 0, 0, 0, 0],
+        max_amplitude=[200] * 8,
+        impedance_50_ohms=[1] * 8,
+        sample_rate=20,
+    )
+    tx_card.connect()
+    rx_card.connect()
+    # Small ring buffer, such that the replay data is streamed in multiple notify size chunks
+    tx_card.ring_buffer_size = sp.uint64(2**19)
+    tx_card.notify_size = sp.int32(2**15)
+
+    rx_card.start_operation()
+    time.sleep(0.01)
+    tx_card.start_operation(unrolled)
+    time_start = time.perf_counter()
+    while len(rx_card.rx_data) < unrolled.adc_count and time.perf_counter() - time_start < 5:
+        time.sleep(0.01)
+    tx_card.stop_operation()
+    rx_card.stop_operation()
+    tx_card.disconnect()
+    rx_card.disconnect()
+
+    assert tx_sim.stats()["underruns"] == 0
+    assert tx_sim.stats()["replayed_samples"] >= unrolled.sample_count
+    assert rx_sim.stats()["overruns"] == 0
+    assert rx_sim.stats()["gates"] == len(rx_card.rx_data) == unrolled.adc_count == 5
+
+    gate = np.concatenate(([0], unrolled.adc_gate.astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(gate)).reshape(-1, 2)
+    rf = unrolled.data[0::4]
+    reference = unrolled.data[2::4].view(np.uint16) >> 15
+    for data, (start, end) in zip(rx_card.rx_data, edges):
+        assert data.shape == (2, end - start)
+        assert np.array_equal(data[1], rf[start:end])
+        # Channel 0 carries the reference signal in the 16th bit
+        assert np.array_equal(data[0].view(np.uint16) >> 15, reference[start:end])
+        assert np.array_equal(data[0] << 1, rf[start:end] & ~np.int16(1))
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_repeated_replay(seq_provider, test_sequence, streaming):
+    """Test if the transmit card replays the sequence several times within one FIFO session."""
+    tx_sim, rx_sim = simulation.configure(consumption_rate=math.inf)
+    seq_provider.from_pypulseq(test_sequence)
+    unrolled = seq_provider.unroll_sequence(streaming=streaming)
+
+    tx_card = TxCard(path="/dev/spcm1", max_amplitude=[200, 6000, 6000, 6000], filter_type=[0, 2, 2, 2], sample_rate=20)
+    rx_card = RxCard(
+        path="/dev/spcm0",
+        channel_enable=[1, 1, 0, 0, 0, 0, 0, 0],
+        max_amplitude=[200] * 8,
+        impedance_50_ohms=[1] * 8,
+        sample_rate=20,
+    )
+    tx_card.connect()
+    rx_card.connect()
+
+    rx_card.start_operation()
+    time.sleep(0.01)
+    tx_card.start_operation(unrolled, repetitions=3, repetition_delay=1e-3)
+    time_start = time.perf_counter()
+    while len(rx_card.rx_data) < 3 * unrolled.adc_count and time.perf_counter() - time_start < 5:
+        time.sleep(0.01)
+    tx_card.stop_operation()
+    rx_card.stop_operation()
+    tx_card.disconnect()
+    rx_card.disconnect()
+
+    # Replay data of three repetitions and two delays of 1 ms at 20 MHz
+    sample_count = 3 * unrolled.sample_count + 2 * 20000
+    assert tx_card.data_buffer_size >= sample_count * 8
+    assert tx_sim.stats()["underruns"] == 0
+    assert tx_sim.stats()["replayed_samples"] >= sample_count
+    assert rx_sim.stats()["gates"] == len(rx_card.rx_data) == 3 * unrolled.adc_count
+    for k, data in enumerate(rx_card.rx_data):
+        assert np.array_equal(data, rx_card.rx_data[k % unrolled.adc_count])
@@ -0,0 +1,86 @@
+"""Testing of the unrolling and DDC benchmarks."""
+import json
+
+import pytest
+
+from console.interfaces.enums import DDCMethod
+from console.pulseq_interpreter.sequence_provider import SequenceProvider
+from console.utilities.benchmark import main, run_benchmark, run_ddc_benchmark, write_results
+
+
+def test_benchmark_results(tmp_path, monkeypatch):
+    """Test if the benchmark yields consistent results and writes them to a JSON file."""
+    # Number of resampled RF waveforms per unrolling
+    misses = []
+    unroll_sequence = SequenceProvider.unroll_sequence
+
+    def counting_unroll_sequence(provider, *args, **kwargs):
+        num_misses = provider.rf_cache.misses
+        unrolled = unroll_sequence(provider, *args, **kwargs)
+        misses.append(provider.rf_cache.misses - num_misses)
+        return unrolled
+
+    monkeypatch.setattr(SequenceProvider, "unroll_sequence", counting_unroll_sequence)
+    results = run_benchmark(workloads=["fid"], repeats=2)
+
+    assert len(results) == 1
+    result = results[0]
+    assert result.num_blocks == 3
+    assert len(result.unroll_times) == len(result.cold_unroll_times) == 2
+    # RF waveforms are resampled in each cold run and reused in the other runs
+    assert misses == [1, 1, 0, 0, 0]
+    assert result.peak_memory >= 8 * result.sample_count
+    assert result.samples_per_second == result.sample_count / min(result.unroll_times)
+
+    path = tmp_path / "benchmark.json"
+    write_results(str(path), results, repeats=2)
+    with open(path, encoding="utf-8") as file:
+        content = json.load(file)
+    assert content["options"] == {"repeats": 2}
+    assert content["results"][0]["name"] == "fid"
+    assert content["results"][0]["sample_count"] == result.sample_count
+    assert content["results"][0]["cold_unroll_time"] == result.cold_unroll_time
+
+
+def test_benchmark_cli(tmp_path, capsys):
+    """Test the command line interface of the benchmark."""
+    path = tmp_path / "benchmark.json"
+    main(["--workloads", "fid", "--repeats", "1", "--output", str(path)])
+
+    assert "fid" in capsys.readouterr().out
+    assert path.exists()
+
+
+def test_unknown_workload(capsys):
+    """Test if unknown workloads are rejected."""
+    with pytest.raises(ValueError):
+        run_benchmark(workloads=["unknown"])
+
+    # Workloads of the other benchmark are rejected by the command line interface
+    for args in [["--workloads", "tse_2x128x10000"], ["--ddc", "--workloads", "fid"]]:
+        with pytest.raises(SystemExit):
+            main(args)
+        assert "are not available" in capsys.readouterr().err
+
+
+def test_ddc_benchmark(tmp_path, capsys):
+    """Test if the DDC benchmark measures throughput and frequency response of the DDC methods."""
+    results = run_ddc_benchmark(
+        workloads=["tse_2x128x10000"], methods=[DDCMethod.FIR, DDCMethod.MULTISTAGE], repeats=2
+    )
+
+    assert [result.method for result in results] == ["fir", "multistage"]
+    for result in results:
+        assert len(result.times) == 2
+        assert result.samples_per_second == 2 * 128 * 10000 / min(result.times)
+        assert result.passband_ripple < 0.1
+        assert result.alias_attenuation > 50
+    assert results[1].alias_attenuation > results[0].alias_attenuation
+
+    path = tmp_path / "ddc-benchmark.json"
+    main(["--ddc", "--workloads", "tse_2x128x10000", "--repeats", "1", "--output", str(path)])
+    assert "multistage" in capsys.readouterr().out
+    with open(path, encoding="utf-8") as file:
+        content = json.load(file)
+    assert content["options"] == {"repeats": 1, "decimation": 200}
+    assert len(content["results"]) == len(DDCMethod)
@@ -1,8 +1,19 @@
 """Test digital down converter (DDC) functions."""
 import numpy as np
 import pytest
+from scipy import signal
 
-from console.utilities.ddc import filter_cic_fir_comp, filter_moving_average
+from console.utilities.ddc import (
+    cic_compensation_taps,
+    cic_decimate,
+    decimate_multistage,
+    demodulate_decimate,
+    filter_cic_fir_comp,
+    filter_cic_int,
+    filter_moving_average,
+    mixer,
+    plan_decimation,
+)
 
 
 @pytest.mark.parametrize("coils", [1, 2, 4])
@@ -41,3 +52,180 @@ def test_cic_fir_comp(coils, phase_encoding, num_samples, decimation, filter_sta
     assert proc_pe == phase_encoding
     assert proc_samples == num_samples // decimation
     assert np.iscomplex(processed).all()
+
+
+def _moving_average_reference(signal, decimation: int, overlap: int):
+    """Calculate the moving average filter by a strided convolution per output sample."""
+    kernel_size = int(overlap * decimation)
+    kernel_space = np.linspace(-1 + 1e-10, 1 - 1e-10, kernel_size)
+    kernel_space[kernel_space == 0] = 1e-10
+    kernel = np.exp(-1 / (1 - kernel_space**2)) * np.sin(kernel_space * 2.073 * np.pi) / kernel_space
+    num_ddc_samples = round(signal.shape[-1] / decimation)
+    n_pad = [(0, 0)] * (signal.ndim - 1) + [(int(kernel_size / 2),) * 2]
+    signal_pad = np.pad(signal, pad_width=n_pad)
+    signal_filtered = np.zeros(signal.shape[:-1] + (num_ddc_samples,), dtype=complex)
+    for k in range(num_ddc_samples):
+        signal_filtered[..., k] = signal_pad[..., k * decimation : k * decimation + kernel_size] @ kernel
+    return 2 * signal_filtered / np.sum(kernel)
+
+
+@pytest.mark.parametrize("shape", [(9511,), (16, 8000), (2, 2, 4, 9511)])
+@pytest.mark.parametrize("decimation", [7, 100, 200])
+@pytest.mark.parametrize("overlap", [2, 3, 8])
+def test_moving_average_reference(shape, decimation, overlap):
+    """Test if the polyphase and the sliding window implementation equal the strided convolution."""
+    rng = np.random.default_rng(seed=0)
+    input_data = rng.standard_normal(shape) + 1j * rng.standard_normal(shape)
+    processed = filter_moving_average(input_data, decimation=decimation, overlap=overlap)
+    expected = _moving_average_reference(input_data, decimation=decimation, overlap=overlap)
+    assert processed.shape == expected.shape
+    assert np.allclose(processed, expected)
+
+
+@pytest.mark.parametrize("shape", [(8000,), (2, 3, 9511)])
+@pytest.mark.parametrize("decimation", [7, 200])
+@pytest.mark.parametrize("frequency", [2e6, 2.1234e6])
+def test_demodulate_decimate(shape, decimation, frequency):
+    """Test if fused demodulation and decimation equals demodulation followed by decimation."""
+    rng = np.random.default_rng(seed=0)
+    input_data = rng.standard_normal(shape)
+    mixed = input_data * mixer(shape[-1], frequency, 20e6)
+
+    processed = demodulate_decimate(input_data, frequency, 20e6, decimation, method="fir")
+    expected = signal.decimate(mixed, q=decimation, ftype="fir")
+    assert processed.shape == expected.shape
+    assert np.allclose(processed, expected)
+
+    processed = demodulate_decimate(input_data, frequency, 20e6, decimation, method="avg")
+    expected = filter_moving_average(mixed, decimation=decimation, overlap=8)
+    assert processed.shape == expected.shape
+    assert np.allclose(processed, expected)
+
+    # Single precision
+    processed = demodulate_decimate(input_data, frequency, 20e6, decimation, method="avg", dtype=np.complex64)
+    assert processed.dtype == np.complex64
+    assert np.abs(processed - expected).max() < 1e-5 * np.abs(expected).max()
+
+
+def test_mixer_cache():
+    """Test if the mixer is cached per readout size and frequency and cannot be modified."""
+    assert mixer(1000, 2e6, 20e6) is mixer(1000, 2e6, 20e6)
+    assert mixer(1000, 2e6, 20e6) is not mixer(1000, 2.1e6, 20e6)
+    with pytest.raises(ValueError):
+        mixer(1000, 2e6, 20e6)[0] = 0
+    with pytest.raises(ValueError):
+        demodulate_decimate(np.zeros(1000), 2e6, 20e6, 10, method="cic")
+
+
+@pytest.mark.parametrize("decimation", [5, 64])
+@pytest.mark.parametrize("filter_stages", [1, 3, 5])
+def test_cic_decimate(decimation, filter_stages):
+    """Test if the integer CIC filter equals decimation after convolution with the CIC impulse response."""
+    rng = np.random.default_rng(seed=0)
+    input_data = rng.integers(-(2**15), 2**15, size=(3, 2000), dtype=np.int16)
+    processed = cic_decimate(input_data, decimation=decimation, number_of_stages=filter_stages)
+
+    impulse_response = np.ones(1, dtype=np.int64)
+    for _ in range(filter_stages):
+        impulse_response = np.convolve(impulse_response, np.ones(decimation, dtype=np.int64))
+    filtered = np.stack([np.convolve(row.astype(np.int64), impulse_response)[:row.size] for row in input_data])
+    assert processed.dtype == np.int64
+    assert np.array_equal(processed, filtered[:, decimation - 1::decimation])
+
+
+def test_cic_decimate_wrap_around():
+    """Test if the CIC output is exact, although the integrators overflow."""
+    input_data = np.full(100_000, 2**15 - 1, dtype=np.int16)
+    processed = cic_decimate(input_data, decimation=200, number_of_stages=5)
+    # Integrators exceed 64 bits after a few thousand samples, the output is constant after the transient
+    assert np.all(processed[5:] == (2**15 - 1) * 200**5)
+
+    with pytest.raises(ValueError):
+        cic_decimate(input_data, decimation=2**10, number_of_stages=5)
+    with pytest.raises(ValueError):
+        cic_decimate(input_data.astype(float), decimation=200, number_of_stages=5)
+
+
+@pytest.mark.parametrize("cic_decimation", [20, 50, 100])
+def test_filter_cic_int(cic_decimation):
+    """Test if the droop of the integer CIC filter is compensated in the passband."""
+    num_samples, decimation, sample_rate = 40_000, 200, 20e6
+    # Tones within 40 % of the output rate (80 % of the output Nyquist frequency)
+    for offset in [0, 10e3, 30e3]:
+        phase = 2 * np.pi * (2e6 + offset) * np.arange(num_samples) / sample_rate
+        input_data = np.round(2e4 * np.cos(phase)).astype(np.int16)
+        processed = filter_cic_int(input_data, 2e6, sample_rate, decimation=decimation, cic_decimation=cic_decimation)
+        assert processed.shape == (num_samples // decimation,)
+        # Amplitude of the demodulated tone is half of the real tone
+        assert np.allclose(np.abs(processed[20:-20]), 1e4, rtol=0.01)
+
+    taps = cic_compensation_taps(cic_decimation, number_of_stages=5, fir_decimation=decimation // cic_decimation)
+    assert np.isclose(np.sum(taps), 1)
+    with pytest.raises(ValueError):
+        filter_cic_int(input_data, 2e6, sample_rate, decimation=decimation, cic_decimation=30)
+
+
+@pytest.mark.parametrize("decimation", [224, 400, 1000])
+def test_filter_cic_int_large_decimation(decimation):
+    """Test if the CIC decimation is reduced to fit 64 bits and the result equals the float FIR decimation."""
+    num_samples, sample_rate = 100_000, 20e6
+    # Tones within 20 % of the output rate
+    for offset in [0, 0.2 * sample_rate / decimation]:
+        phase = 2 * np.pi * (2e6 + offset) * np.arange(num_samples) / sample_rate
+        input_data = np.round(2e4 * np.cos(phase)).astype(np.int16)
+        processed = filter_cic_int(input_data, 2e6, sample_rate, decimation=decimation)
+        assert processed.shape == (num_samples // decimation,)
+        reference = demodulate_decimate(input_data.astype(float), 2e6, sample_rate, decimation=decimation)
+        assert np.allclose(np.abs(processed[10:-10]), np.abs(reference[10:processed.size - 10]), rtol=0.01)
+        assert np.allclose(np.abs(processed[10:-10]), 1e4, rtol=0.01)
+
+    # An explicit CIC decimation factor, of which the output exceeds 64 bits, is rejected
+    with pytest.raises(ValueError):
+        filter_cic_int(input_data, 2e6, sample_rate, decimation=decimation, cic_decimation=decimation // 2)
+
+
+@pytest.mark.parametrize(("decimation", "stages"), [
+    (200, [("cic", 25), ("half-band", 2), ("half-band", 2), ("compensation", 2)]),
+    (100, [("cic", 25), ("half-band", 2), ("compensation", 2)]),
+    (64, [("cic", 8), ("half-band", 2), ("half-band", 2), ("compensation", 2)]),
+    (7, [("cic", 7), ("compensation", 1)]),
+    (2, [("compensation", 2)]),
+    (1, [("low-pass", 1)]),
+])
+def test_plan_decimation(decimation, stages):
+    """Test the factorization of the decimation factor into stages."""
+    plan = plan_decimation(decimation, 9511)
+    assert [(stage.name, stage.decimation) for stage in plan.stages] == stages
+    assert plan.num_output == -(-9511 // decimation)
+    assert all(np.isclose(np.sum(stage.taps), 1) for stage in plan.stages)
+    # Plans are cached per decimation factor and readout size
+    assert plan_decimation(decimation, 9511) is plan
+    with pytest.raises(ValueError):
+        plan_decimation(0, 9511)
+
+
+@pytest.mark.parametrize("num_samples", [40_000, 9511])
+def test_decimate_multistage(num_samples):
+    """Test if the multi-stage decimation is flat in the passband and equals the FIR decimation of a tone."""
+    decimation, sample_rate = 200, 20e6
+    # Tones within 40 % of the output rate (80 % of the output Nyquist frequency)
+    for offset in [0, 10e3, 35e3, 40e3]:
+        phase = 2 * np.pi * (2e6 + offset) * np.arange(num_samples) / sample_rate
+        input_data = np.stack((np.cos(phase), np.sin(phase)))
+        processed = decimate_multistage(input_data, 2e6, sample_rate, decimation=decimation)
+        assert processed.shape == (2, -(-num_samples // decimation))
+        # Amplitude of the demodulated tone is half of the real tone
+        assert np.allclose(np.abs(processed[:, 20:-20]), 0.5, rtol=0.005)
+        reference = demodulate_decimate(input_data, 2e6, sample_rate, decimation=decimation)
+        assert np.allclose(processed[:, 20:-20], reference[:, 20:-20], atol=0.01)
+
+
+def test_decimate_multistage_without_decimation():
+    """Test if the mixing image at twice the demodulation frequency is suppressed without decimation."""
+    num_samples, sample_rate = 4000, 20e6
+    for frequency in [2e6, 3e6, 7e6]:
+        phase = 2 * np.pi * frequency * np.arange(num_samples) / sample_rate
+        processed = decimate_multistage(np.cos(phase), frequency, sample_rate, decimation=1)
+        assert processed.shape == (num_samples,)
+        # Without filter, the image modulates the magnitude of the demodulated tone between 0 and 1
+        assert np.allclose(np.abs(processed[100:-100]), 0.5, atol=1e-3)
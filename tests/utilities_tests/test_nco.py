@@ -0,0 +1,48 @@
+"""Test numerically controlled oscillator (NCO)."""
+import numpy as np
+import pytest
+
+from console.utilities.nco import NumericallyControlledOscillator, phase_word
+
+
+@pytest.mark.parametrize("frequency", [2e6, 2.0231e6, 9.87654e6])
+@pytest.mark.parametrize("table_bits", [12, 18])
+def test_carrier_phase_error(frequency, table_bits):
+    """Test carrier against complex exponential within the documented phase error bound."""
+    dwell_time = 5e-8
+    start = 0.123456
+    nco = NumericallyControlledOscillator(frequency, dwell_time, table_bits=table_bits)
+    carrier = nco.carrier(nco.phase(100_000, start=phase_word(start)))
+    expected = np.exp(2j * np.pi * (frequency * np.arange(100_000) * dwell_time + start))
+
+    # Table quantization dominates the phase error, small margin for floating point precision of the reference
+    phase_error = np.abs(np.angle(carrier * expected.conj()))
+    assert phase_error.max() <= np.pi / 2**table_bits + 1e-9
+    assert np.allclose(np.abs(carrier), 1)
+
+
+def test_phase_continuation():
+    """Test that consecutive blocks continue the phase of a single accumulator."""
+    nco = NumericallyControlledOscillator(2.0231e6, 5e-8)
+    phase = nco.phase(3000)
+    block_a = nco.phase(1000)
+    block_b = nco.phase(2000, start=nco.advance(block_a[0], 1000))
+    assert np.array_equal(np.concatenate([block_a, block_b]), phase)
+
+
+def test_reference_signal():
+    """Test digital reference signal against the sign of the cosine."""
+    frequency, dwell_time = 2.0231e6, 5e-8
+    nco = NumericallyControlledOscillator(frequency, dwell_time)
+    reference = nco.reference(nco.phase(100_000))
+    expected = np.cos(2 * np.pi * frequency * np.arange(100_000) * dwell_time) > 0
+    # Samples exactly at a zero crossing may differ due to floating point rounding
+    assert np.count_nonzero(reference != expected) <= 2
+
+
+def test_phase_word():
+    """Test conversion of phase in cycles to phase words."""
+    assert phase_word(0) == 0
+    assert phase_word(0.5) == 2**63
+    assert phase_word(1.25) == 2**62
+    assert phase_word(-0.25) == 3 * 2**62